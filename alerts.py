@@ -0,0 +1,148 @@
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+
+# Cada evaluador recibe el consolidado y la regla, y devuelve (máscara, valor observado, umbral)
+RuleEvaluator = Callable[[pd.DataFrame, Dict], Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]]
+
+
+def _column(df: pd.DataFrame, name: str) -> Optional[np.ndarray]:
+    if name not in df.columns:
+        return None
+    return pd.to_numeric(df[name], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+
+
+def _rule_bajo_cajas(df: pd.DataFrame, rule: Dict):
+    """Disponible en la columna indicada por debajo de N cajas (N * u_por_caja)."""
+    valor = _column(df, rule['columna'])
+    u_por_caja = _column(df, 'u_por_caja')
+    if valor is None or u_por_caja is None:
+        return None
+    umbral = rule['cajas'] * np.where(u_por_caja > 0, u_por_caja, 1)
+    return valor < umbral, valor, umbral
+
+
+def _rule_caida_porcentual(df: pd.DataFrame, rule: Dict):
+    """Caída mayor al X% respecto de una columna de referencia (p. ej. stock_ayer)."""
+    valor = _column(df, rule['columna'])
+    referencia = _column(df, rule['referencia'])
+    if valor is None or referencia is None:
+        return None
+    umbral = referencia * (1 - rule['porcentaje'] / 100.0)
+    return (referencia > 0) & (valor < umbral), valor, umbral
+
+
+def _rule_sin_disponible(df: pd.DataFrame, rule: Dict):
+    """Sin disponible (<= 0) en todos los almacenes."""
+    warehouse_cols = [col for col in df.columns if col.endswith('_disponible')]
+    if not warehouse_cols:
+        return None
+    disponible = df[warehouse_cols].fillna(0).to_numpy(dtype=np.float64)
+    valor = disponible.sum(axis=1)
+    return (disponible <= 0).all(axis=1), valor, np.zeros(len(df))
+
+
+RULE_EVALUATORS: Dict[str, RuleEvaluator] = {
+    'bajo_cajas': _rule_bajo_cajas,
+    'caida_porcentual': _rule_caida_porcentual,
+    'sin_disponible': _rule_sin_disponible,
+}
+
+
+def evaluate_alert_rules(df: pd.DataFrame, rules=None) -> pd.DataFrame:
+    """Evalúa todas las reglas con máscaras vectorizadas y devuelve una fila por alerta activa."""
+    rules = settings.ALERT_RULES if rules is None else rules
+    frames = []
+    for rule in rules:
+        evaluator = RULE_EVALUATORS.get(rule['tipo'])
+        if evaluator is None:
+            logging.warning(f"Tipo de regla de alerta desconocido: {rule['tipo']} ({rule['id']})")
+            continue
+        result = evaluator(df, rule)
+        if result is None:
+            logging.warning(f"Regla de alerta '{rule['id']}' omitida: faltan columnas en el consolidado.")
+            continue
+        mask, valor, umbral = result
+        idx = np.flatnonzero(mask)
+        if idx.size == 0:
+            continue
+        frames.append(pd.DataFrame({
+            'regla': rule['id'],
+            'severidad': rule.get('severidad', 'media'),
+            'codigo': df['codigo'].astype(str).to_numpy()[idx],
+            'nombre': df['nombre'].astype(str).to_numpy()[idx] if 'nombre' in df.columns else '',
+            'linea': df['linea'].astype(str).to_numpy()[idx] if 'linea' in df.columns else '',
+            'valor': np.round(valor[idx], 2),
+            'umbral': np.round(umbral[idx], 2),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['regla', 'severidad', 'codigo', 'nombre', 'linea', 'valor', 'umbral', 'clave'])
+    df_alertas = pd.concat(frames, ignore_index=True)
+    df_alertas['clave'] = df_alertas['regla'] + '|' + df_alertas['codigo']
+    return df_alertas
+
+
+def _load_alert_state() -> Dict[str, Dict]:
+    if not os.path.exists(settings.ALERTS_STATE_FILE):
+        return {}
+    try:
+        with open(settings.ALERTS_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.error(f"Error al cargar el estado de alertas desde {settings.ALERTS_STATE_FILE}: {e}")
+        return {}
+
+
+def _save_alert_state(state: Dict[str, Dict]):
+    tmp_path = settings.ALERTS_STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, settings.ALERTS_STATE_FILE)
+
+
+def generate_stock_alerts(df: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """
+    Evalúa las reglas de alerta sobre el consolidado y escribe alertas_stock.json.
+    Sólo se reportan como nuevas las alertas que no estaban activas en la ejecución anterior;
+    las que dejan de cumplirse se marcan como resueltas y salen del estado.
+    """
+    logging.info("Evaluando reglas de alertas de stock...")
+    try:
+        now = datetime.now().isoformat(timespec='seconds')
+        df_alertas = evaluate_alert_rules(df)
+        state = _load_alert_state()
+
+        activas = pd.Index(df_alertas['clave'])
+        previas = pd.Index(list(state.keys()), dtype=object)
+        es_nueva = ~activas.isin(previas)
+        resueltas = previas[~previas.isin(activas)].tolist()
+        df_nuevas = df_alertas[es_nueva]
+
+        new_state = {}
+        for clave, valor in zip(df_alertas['clave'], df_alertas['valor']):
+            desde = state.get(clave, {}).get('desde', now)
+            new_state[clave] = {'desde': desde, 'valor': float(valor)}
+        _save_alert_state(new_state)
+
+        artifact = {
+            'generado': now,
+            'resumen': df_alertas.groupby('regla').size().astype(int).to_dict(),
+            'nuevas': df_nuevas.drop(columns=['clave']).to_dict(orient='records'),
+            'resueltas': resueltas,
+        }
+        with open(settings.OUTPUT_ALERTAS_JSON, 'w', encoding='utf-8') as f:
+            json.dump(artifact, f, ensure_ascii=False, separators=(',', ':'))
+
+        logging.info(f"Alertas: {len(df_alertas)} activas, {len(df_nuevas)} nuevas, {len(resueltas)} resueltas. "
+                     f"Guardadas en {settings.OUTPUT_ALERTAS_JSON}")
+        return df_nuevas
+    except Exception as e:
+        logging.error(f"Error generando alertas de stock: {e}")
+        return None
@@ -1,12 +1,18 @@
-from flask import Flask, jsonify, send_file
+import os
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+from flask import Flask, Response, jsonify, send_file, request
 from werkzeug.middleware.proxy_fix import ProxyFix
-from config import API_HOST, API_PORT, API_DEBUG, OUTPUT_FINAL_REPORT_EXCEL
+from config import settings
 from utils import rate_limit, TempURLManager
 from storage_manager import CloudStorageManager
 
 app = Flask(__name__)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
 
+# El cliente de Cloud Storage se inicializa en la primera petición que lo necesita
 storage_manager = CloudStorageManager()
 temp_url_manager = TempURLManager("salida/temp/temp_urls.json")
 
@@ -14,14 +20,221 @@ temp_url_manager = TempURLManager("salida/temp/temp_urls.json")
 def health():
     return jsonify({"status": "healthy"})
 
+def _reporte_version():
+    """Versión del reporte publicado: la de salida/ACTUAL.json o, sin publicación versionada, su fecha de modificación."""
+    from publish import read_pointer, published_path
+    pointer = read_pointer()
+    if pointer is not None:
+        return pointer['version']
+    try:
+        return str(os.stat(published_path(settings.OUTPUT_FINAL_REPORT_EXCEL)).st_mtime_ns)
+    except OSError:
+        return ''
+
 @app.route('/api/reporte-temp-url')
-@rate_limit(limit=5, per=60)
+@rate_limit(limit=settings.REPORTE_URL_RATE_LIMIT, per=60)
 def get_reporte_temp_url():
-    signed_url = storage_manager.generate_signed_url("reporte_stock_hoy.xlsx", expiration_minutes=30)
-    if signed_url:
-        return jsonify({"url": signed_url, "expires_in": 30})
+    signed = storage_manager.get_signed_url(settings.STORAGE_REPORT_BLOB, version=_reporte_version(),
+                                            expiration_minutes=settings.REPORTE_URL_EXPIRATION_MINUTES)
+    if signed:
+        url, expires_at = signed
+        return jsonify({
+            "url": url,
+            "expires_in": max(0, int((expires_at - time.time()) // 60)),
+            "expires_at": datetime.fromtimestamp(expires_at).isoformat(timespec='seconds')
+        })
     return jsonify({"error": "No se pudo generar URL"}), 500
 
+@app.route('/api/historial')
+def get_historial():
+    """Lista paginada de los reportes históricos publicados en el bucket."""
+    subprefix = request.args.get('prefix', '').lstrip('/')
+    page_size = request.args.get('page_size', default=settings.STORAGE_LIST_PAGE_SIZE, type=int)
+    page_token = request.args.get('page_token') or None
+    if page_size <= 0:
+        return jsonify({"error": "page_size debe ser mayor que 0"}), 400
+
+    page = storage_manager.list_files_page(
+        prefix=settings.STORAGE_HISTORY_PREFIX + subprefix,
+        delimiter='/',
+        page_size=page_size,
+        page_token=page_token
+    )
+    if page is None:
+        return jsonify({"error": "No se pudo listar el historial"}), 500
+    return jsonify(page)
+
+@app.route('/api/historico/<codigo>')
+def get_historico_codigo(codigo):
+    """Serie temporal de un código leída de las particiones diarias en Parquet."""
+    from normalize import normalize_code
+    codigo = normalize_code(codigo)
+    columnas = [c.strip() for c in request.args.get('columnas', settings.HISTORICO_STOCK_COLUMN).split(',') if c.strip()]
+    try:
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d') if 'hasta' in request.args else datetime.now()
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d') if 'desde' in request.args \
+            else hasta - timedelta(days=settings.HISTORICO_SERIE_DEFAULT_DIAS)
+    except ValueError:
+        return jsonify({"error": "Fechas deben tener formato YYYY-MM-DD"}), 400
+    if desde > hasta or (hasta - desde).days > settings.HISTORICO_SERIE_MAX_DIAS:
+        return jsonify({"error": f"Rango inválido (máximo {settings.HISTORICO_SERIE_MAX_DIAS} días)"}), 400
+
+    from historical_partitions import is_series_column, read_codigo_time_series
+    invalidas = [col for col in columnas if not is_series_column(col)]
+    if invalidas:
+        return jsonify({"error": f"Columnas no numéricas o desconocidas: {invalidas}"}), 400
+    serie = read_codigo_time_series(storage_manager, codigo, desde, hasta, columnas)
+    if serie is None:
+        return jsonify({"error": "Histórico no disponible"}), 503
+    return jsonify({
+        "codigo": codigo,
+        "desde": desde.strftime('%Y-%m-%d'),
+        "hasta": hasta.strftime('%Y-%m-%d'),
+        "columnas": columnas,
+        "serie": serie
+    })
+
+@app.route('/api/stock/<codigo>')
+def get_stock_codigo(codigo):
+    """Stock de un código (datos y almacenes) desde la base SQLite del consolidado."""
+    from normalize import normalize_code
+    from stock_db import query_stock_codigo, query_stock_history, stock_db_available
+    if not stock_db_available():
+        return jsonify({"error": "Base de stock no disponible"}), 503
+    codigo = normalize_code(codigo)
+    fecha = request.args.get('fecha')
+    try:
+        if fecha:
+            datetime.strptime(fecha, '%Y-%m-%d')
+        desde = request.args.get('desde')
+        if desde:
+            datetime.strptime(desde, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": "Fechas deben tener formato YYYY-MM-DD"}), 400
+
+    stock = query_stock_codigo(codigo, fecha)
+    if stock is None:
+        return jsonify({"error": f"Código {codigo} no encontrado"}), 404
+    if desde:
+        stock['historial'] = query_stock_history(codigo, desde, stock['fecha'])
+    return jsonify(stock)
+
+@app.route('/api/stock/batch', methods=['POST'])
+def get_stock_batch():
+    """
+    Stock de muchos códigos o EAN/EAN-14 en una sola petición (lectores de código de barras).
+    Cuerpo: {"codigos": [...], "almacenes": [...] opcional}. Con ?formato=ndjson (o Accept:
+    application/x-ndjson) la respuesta se envía por líneas: primero los almacenes y luego un
+    resultado por código.
+    """
+    body = request.get_json(silent=True) or {}
+    codigos = body.get('codigos')
+    if not isinstance(codigos, list) or not codigos:
+        return jsonify({"error": "Se requiere 'codigos' como lista no vacía"}), 400
+    if len(codigos) > settings.STOCK_BATCH_MAX_CODIGOS:
+        return jsonify({"error": f"Máximo {settings.STOCK_BATCH_MAX_CODIGOS} códigos por petición"}), 413
+
+    from barcode_index import get_barcode_index
+    index = get_barcode_index()
+    if index is None:
+        return jsonify({"error": "Consolidado de stock no disponible"}), 503
+    almacenes = body.get('almacenes') or None
+    if almacenes is not None:
+        if not isinstance(almacenes, list) or not all(isinstance(wh, str) for wh in almacenes):
+            return jsonify({"error": "'almacenes' debe ser una lista de textos"}), 400
+        desconocidos = [wh for wh in almacenes if wh not in index.almacenes]
+        if desconocidos:
+            return jsonify({"error": f"Almacenes desconocidos: {desconocidos}"}), 400
+
+    cabecera = {"almacenes": almacenes or index.almacenes, "version": index.version}
+    resultados = index.lookup(codigos, almacenes)
+    if request.args.get('formato') == 'ndjson' or request.accept_mimetypes.best == 'application/x-ndjson':
+        def lineas():
+            yield json.dumps(cabecera, ensure_ascii=False) + "\n"
+            for resultado in resultados:
+                yield json.dumps(resultado, ensure_ascii=False) + "\n"
+        return Response(lineas(), mimetype='application/x-ndjson')
+    resultados = list(resultados)
+    encontrados = sum(1 for r in resultados if r['encontrado'])
+    return jsonify({**cabecera, "encontrados": encontrados, "no_encontrados": len(resultados) - encontrados,
+                    "resultados": resultados})
+
+@app.route('/api/buscar')
+def buscar_productos():
+    """Búsqueda aproximada (tolerante a errores y tildes) por nombre, código o EAN; filtro opcional por línea."""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Parámetro 'q' requerido"}), 400
+    limite = max(1, min(request.args.get('limite', default=20, type=int), settings.SEARCH_MAX_RESULTADOS))
+
+    from search_index import get_search_index
+    index = get_search_index()
+    if index is None:
+        return jsonify({"error": "Índice de búsqueda no disponible"}), 503
+    resultados = index.search(query, linea=request.args.get('linea') or None, limit=limite)
+    return jsonify({"q": query, "total": len(resultados), "resultados": resultados})
+
+def _dialogflow_text(index, producto_query, almacen_query):
+    """Texto de respuesta para una consulta de stock de Dialogflow."""
+    if not producto_query:
+        return "¿De qué producto quieres saber el stock? Puedes decirme el código, el EAN o el nombre."
+    productos = index.find(producto_query, limit=settings.DIALOGFLOW_MAX_OPCIONES + 1)
+    if not productos:
+        return f"No encontré ningún producto que coincida con \"{producto_query}\"."
+    if len(productos) > 1:
+        opciones = "; ".join(f"{p['nombre']} ({p['codigo']})" for p in productos[:settings.DIALOGFLOW_MAX_OPCIONES])
+        return f"Encontré varios productos: {opciones}. ¿Cuál de ellos?"
+
+    producto = productos[0]
+    almacenes = producto.get('almacenes', {})
+    if almacen_query:
+        almacen = index.resolve_almacen(almacen_query)
+        if almacen is None:
+            return f"No conozco el almacén \"{almacen_query}\". Almacenes: {', '.join(index.almacenes)}."
+        stock = almacenes.get(almacen, {'total': 0, 'disponible': 0})
+        return (f"{producto['nombre']} ({producto['codigo']}) en {almacen}: "
+                f"{stock['disponible']} disponibles de {stock['total']} en total.")
+    con_stock = sorted(((wh, s['disponible']) for wh, s in almacenes.items() if s['disponible'] > 0),
+                       key=lambda item: item[1], reverse=True)
+    detalle = ", ".join(f"{wh}: {disp}" for wh, disp in con_stock[:5]) or "sin disponible en almacenes"
+    return (f"{producto['nombre']} ({producto['codigo']}) tiene {producto['stock_referencial']} unidades "
+            f"de stock referencial ({detalle}).")
+
+@app.route('/api/dialogflow/webhook', methods=['POST'])
+def dialogflow_webhook():
+    """Fulfillment de Dialogflow (ES y CX) resuelto contra el índice en memoria de stock_generales."""
+    if settings.DIALOGFLOW_WEBHOOK_TOKEN and not hmac.compare_digest(
+            request.headers.get('Authorization', '').encode(), f"Bearer {settings.DIALOGFLOW_WEBHOOK_TOKEN}".encode()):
+        return jsonify({"error": "No autorizado"}), 401
+    body = request.get_json(silent=True) or {}
+    es_cx = 'sessionInfo' in body or 'fulfillmentInfo' in body
+    parametros = (body.get('sessionInfo') or {}).get('parameters') if es_cx \
+        else (body.get('queryResult') or {}).get('parameters')
+    parametros = parametros or {}
+
+    from stock_index import get_stock_index
+    index = get_stock_index()
+    if index is None:
+        texto = "La información de stock no está disponible en este momento."
+    else:
+        texto = _dialogflow_text(index, str(parametros.get(settings.DIALOGFLOW_PARAM_PRODUCTO) or '').strip(),
+                                 str(parametros.get(settings.DIALOGFLOW_PARAM_ALMACEN) or '').strip())
+    if es_cx:
+        return jsonify({"fulfillmentResponse": {"messages": [{"text": {"text": [texto]}}]}})
+    return jsonify({"fulfillmentText": texto})
+
+@app.route('/api/rollups')
+def get_rollups():
+    """Agregados de stock por línea x almacén generados por el proceso (JSON o Parquet)."""
+    formato = request.args.get('formato', 'json').lower()
+    if formato not in ('json', 'parquet'):
+        return jsonify({"error": "formato debe ser 'json' o 'parquet'"}), 400
+    from publish import published_path
+    file_path = published_path(settings.OUTPUT_ROLLUP_STOCK_PARQUET if formato == 'parquet' else settings.OUTPUT_ROLLUP_STOCK_JSON)
+    if not os.path.exists(file_path):
+        return jsonify({"error": "Rollup de stock no disponible"}), 404
+    return send_file(file_path, max_age=60)
+
 @app.route('/api/temp-url/<token>')
 def get_file_by_temp_url(token):
     file_path = temp_url_manager.get_file_path(token)
@@ -30,4 +243,4 @@ def get_file_by_temp_url(token):
     return jsonify({"error": "URL inválida"}), 404
 
 if __name__ == "__main__":
-    app.run(host=API_HOST, port=API_PORT, debug=API_DEBUG)
\ No newline at end of file
+    app.run(host=settings.API_HOST, port=settings.API_PORT, debug=settings.API_DEBUG)
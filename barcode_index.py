@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import settings
+from normalize import normalize_code
+from utils import ReloadingValue, file_version
+
+# Índice hash para consultas masivas de lectores de código de barras (POST /api/stock/batch).
+# Mapea código, EAN y EAN-14 a la fila del producto en el consolidado publicado. Los datos se
+# leen directamente de la tabla Arrow abierta con memory-map (columnar_export.get_consolidated_table),
+# compartida por todos los workers; cada proceso sólo arma su dict de claves. Sin consolidado
+# Arrow publicado se usa data_stock_completo.parquet (copia propia del proceso).
+
+KEY_COLUMNS = ('codigo', 'ean', 'ean_14')
+INFO_COLUMNS = ('nombre', 'linea', 'stock_referencial')
+WAREHOUSE_FIELDS = ('stock_total', 'disponible')
+
+
+def _int_column(table, name: str) -> np.ndarray:
+    """Vista numpy sobre la columna (sin copia si es un único bloque int64 sin nulos)."""
+    column = table.column(name)
+    if column.num_chunks == 1 and column.null_count == 0 and column.type == pa.int64():
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    return np.nan_to_num(column.to_numpy().astype(float)).astype(np.int64)
+
+
+class BarcodeIndex:
+
+    def __init__(self, table, version: str = ''):
+        columns = table.column_names
+        self.table = table
+        self.version = version
+        self.almacenes = sorted({col[:-len(field) - 1] for col in columns for field in WAREHOUSE_FIELDS
+                                 if col.endswith('_' + field)})
+        n = table.num_rows
+        self.size = n
+        self.text = {col: table.column(col) for col in ('codigo', 'nombre', 'linea') if col in columns}
+        self.referencial = _int_column(table, 'stock_referencial') if 'stock_referencial' in columns \
+            else np.zeros(n, dtype=np.int64)
+        zeros = np.zeros(n, dtype=np.int64)
+        self.total = [_int_column(table, f"{wh}_stock_total") if f"{wh}_stock_total" in columns else zeros
+                      for wh in self.almacenes]
+        self.disponible = [_int_column(table, f"{wh}_disponible") if f"{wh}_disponible" in columns else zeros
+                           for wh in self.almacenes]
+
+        # Los códigos tienen prioridad sobre los EAN si un valor coincide con ambos
+        self.keys: Dict[str, int] = {}
+        for col in KEY_COLUMNS:
+            if col not in columns:
+                continue
+            for row, value in enumerate(table.column(col).to_pylist()):
+                if value:
+                    self.keys.setdefault(str(value), row)
+
+    @classmethod
+    def from_parquet(cls, path: Optional[str] = None) -> 'BarcodeIndex':
+        path = path or settings.DATA_STOCK_COMPLETO_PARQUET
+        names = pq.read_schema(path).names
+        wanted = set(KEY_COLUMNS + INFO_COLUMNS)
+        columns = [col for col in names if col in wanted or any(col.endswith('_' + f) for f in WAREHOUSE_FIELDS)]
+        stat = os.stat(path)
+        return cls(pq.read_table(path, columns=columns), version=f"{stat.st_mtime_ns}-{stat.st_size}")
+
+    def _text(self, col: str, row: int) -> str:
+        column = self.text.get(col)
+        value = column[row].as_py() if column is not None else None
+        return '' if value is None else str(value)
+
+    def lookup(self, values: Iterable, almacenes: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Un resultado por valor consultado, en el mismo orden. `total` y `disponible` vienen
+        alineados con la lista de almacenes (todos o los pedidos en `almacenes`).
+        """
+        cols = [self.almacenes.index(wh) for wh in almacenes] if almacenes else range(len(self.almacenes))
+        total = [self.total[j] for j in cols]
+        disponible = [self.disponible[j] for j in cols]
+        for value in values:
+            consulta = str(value if value is not None else '')
+            row = self.keys.get(normalize_code(consulta))
+            if row is None:
+                yield {'consulta': consulta, 'encontrado': False}
+                continue
+            yield {
+                'consulta': consulta,
+                'encontrado': True,
+                'codigo': self._text('codigo', row),
+                'nombre': self._text('nombre', row),
+                'linea': self._text('linea', row),
+                'stock_referencial': int(self.referencial[row]),
+                'total': [int(a[row]) for a in total],
+                'disponible': [int(a[row]) for a in disponible],
+            }
+
+
+def _current_source():
+    """Fuente vigente del índice: el consolidado Arrow compartido o, sin él, el Parquet del proceso."""
+    from columnar_export import get_consolidated_table
+    shared = get_consolidated_table()
+    if shared is not None:
+        return 'arrow', shared['version']
+    path = settings.DATA_STOCK_COMPLETO_PARQUET
+    version = file_version(path)
+    if version is None:
+        logging.warning(f"Índice de códigos de barras no disponible: no existe {path}")
+        return None
+    return 'parquet', version
+
+
+def _build(source) -> BarcodeIndex:
+    start = time.perf_counter()
+    if source[0] == 'arrow':
+        from columnar_export import get_consolidated_table
+        shared = get_consolidated_table()
+        index = BarcodeIndex(shared['tabla'], version=shared['version'])
+    else:
+        index = BarcodeIndex.from_parquet(settings.DATA_STOCK_COMPLETO_PARQUET)
+    logging.info(f"Índice de códigos de barras cargado: {index.size} productos, "
+                 f"{len(index.keys)} claves en {(time.perf_counter() - start) * 1000:.0f} ms.")
+    return index
+
+
+_index = ReloadingValue(_current_source, _build, settings.STOCK_INDEX_CHECK_SECONDS,
+                        description='el índice de códigos de barras')
+
+
+def get_barcode_index() -> Optional[BarcodeIndex]:
+    """Índice vigente; revisa como máximo cada STOCK_INDEX_CHECK_SECONDS si se publicó un consolidado nuevo."""
+    return _index.get()
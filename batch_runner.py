@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config import settings
+
+# Ejecución del proceso completo para varias empresas / ERPs en una misma máquina.
+# Cada tenant corre en su propio proceso con `settings` reubicado (apply_tenant), así las
+# rutas, el log y el estado de un tenant nunca se mezclan con los de otro. Los catálogos
+# (líneas, generales, especiales) se parsean una vez por juego de archivos distinto y se
+# entregan ya parseados a todos los tenants que los comparten.
+
+
+class TenantConfig(NamedTuple):
+    nombre: str
+    stock_api_url: str
+    datos_dir: str
+    salida_dir: str
+    procesamiento_dir: str
+    almacenes: Optional[List[str]] = None
+    storage_prefix: Optional[str] = None
+    doc_collection: Optional[str] = None
+
+
+def load_tenants(path: Optional[str] = None) -> List[TenantConfig]:
+    """
+    Lee la lista de tenants desde un JSON:
+    [{"nombre": ..., "stock_api_url": ..., "datos_dir": ..., "salida_dir": ...,
+      "procesamiento_dir": (opcional), "almacenes": [...] (opcional),
+      "storage_prefix": (opcional, "<nombre>/"), "doc_collection": (opcional, "<colección>_<nombre>")}, ...]
+    Las rutas relativas se resuelven respecto de la carpeta del archivo. El prefijo del bucket y
+    la colección de Firestore son propios de cada tenant para que no se pisen los datos.
+    """
+    path = path or settings.TENANTS_FILE
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    def resolve(p):
+        return os.path.abspath(os.path.join(base_dir, p))
+
+    tenants, nombres = [], set()
+    for entry in raw:
+        nombre = entry['nombre']
+        if nombre in nombres:
+            raise ValueError(f"Tenant duplicado en {path}: {nombre}")
+        nombres.add(nombre)
+        procesamiento_dir = entry.get('procesamiento_dir')
+        tenants.append(TenantConfig(
+            nombre=nombre,
+            stock_api_url=entry['stock_api_url'],
+            datos_dir=resolve(entry['datos_dir']),
+            salida_dir=resolve(entry['salida_dir']),
+            procesamiento_dir=resolve(procesamiento_dir) if procesamiento_dir
+            else os.path.join(settings.PROCESAMIENTO_DIR, 'tenants', nombre),
+            almacenes=entry.get('almacenes'),
+            storage_prefix=entry.get('storage_prefix'),
+            doc_collection=entry.get('doc_collection')
+        ))
+    return tenants
+
+
+def _catalog_files(datos_dir: str) -> List[str]:
+    relocated = {
+        'INPUT_LINES_TO_PROCESS_EXCEL': settings.INPUT_LINES_TO_PROCESS_EXCEL,
+        'INPUT_GENERALES_EXCEL': settings.INPUT_GENERALES_EXCEL,
+        'INPUT_ESPECIALES_EXCEL': settings.INPUT_ESPECIALES_EXCEL,
+    }
+    return [os.path.join(datos_dir, os.path.relpath(path, settings.DATOS_DIR)) for path in relocated.values()]
+
+
+def catalog_key(datos_dir: str) -> Tuple:
+    """Identidad del juego de catálogos: ruta real, tamaño y fecha de modificación de cada plantilla."""
+    key = []
+    for path in _catalog_files(datos_dir):
+        try:
+            stat = os.stat(path)
+            key.append((os.path.realpath(path), stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            key.append((os.path.realpath(path), None, None))
+    return tuple(key)
+
+
+def _configure_worker(tenant: Optional[TenantConfig] = None, datos_dir: Optional[str] = None):
+    """Prepara `settings` y el logging del proceso para el trabajo que va a ejecutar."""
+    if tenant is not None:
+        # Bucket y Firestore son compartidos: cada tenant escribe bajo su propio prefijo y colección
+        storage_prefix = tenant.storage_prefix if tenant.storage_prefix is not None else f"{tenant.nombre}/"
+        doc_collection = tenant.doc_collection or f"{type(settings).DOC_SYNC_COLLECTION}_{tenant.nombre}"
+        settings.apply_tenant(tenant.datos_dir, tenant.salida_dir, tenant.procesamiento_dir,
+                              tenant.stock_api_url, tenant.almacenes or [],
+                              storage_prefix=storage_prefix, doc_collection=doc_collection)
+    elif datos_dir is not None:
+        settings.apply_tenant(datos_dir=datos_dir)
+    # El paralelismo lo da el pool de tenants: la carga de cada uno usa hilos
+    settings.LOAD_USE_PROCESSES = False
+    settings.COPY_REPORT_TO_DESKTOP = False
+    # Un proceso reutilizado no debe seguir escribiendo en el log del tenant anterior
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def _load_shared_catalogs(datos_dir: str):
+    _configure_worker(datos_dir=datos_dir)
+    from data_loader import load_catalogs_and_lines
+    return load_catalogs_and_lines()
+
+
+def _run_tenant(tenant: TenantConfig, catalogs) -> Dict:
+    _configure_worker(tenant=tenant)
+    import main
+    inicio = datetime.now()
+    start = time.perf_counter()
+    error = None
+    try:
+        ok = main.run_pipeline(catalogs=catalogs)
+    except Exception as e:
+        ok, error = False, str(e)
+    return {
+        'tenant': tenant.nombre,
+        'ok': ok,
+        'inicio': inicio.isoformat(timespec='seconds'),
+        'segundos': round(time.perf_counter() - start, 2),
+        'error': error,
+        'log_dir': settings.LOGS_DIR
+    }
+
+
+def run_batch(tenants: List[TenantConfig], max_workers: Optional[int] = None) -> List[Dict]:
+    """
+    Ejecuta el proceso completo para cada tenant en un pool de procesos limitado a
+    `max_workers` (BATCH_MAX_WORKERS) y guarda el resumen de tiempos en BATCH_SUMMARY_FILE.
+    """
+    max_workers = max_workers or settings.BATCH_MAX_WORKERS
+    batch_start = time.perf_counter()
+    summary: Dict[str, Dict] = {}
+
+    groups: Dict[Tuple, List[TenantConfig]] = {}
+    for tenant in tenants:
+        groups.setdefault(catalog_key(tenant.datos_dir), []).append(tenant)
+    logging.info(f"Ejecución por lotes: {len(tenants)} tenants, {len(groups)} juegos de catálogos, "
+                 f"hasta {max_workers} en paralelo.")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        # 1. Catálogos: uno por juego distinto
+        catalog_futures = {}
+        for key, members in groups.items():
+            catalog_futures[pool.submit(_load_shared_catalogs, members[0].datos_dir)] = (key, time.perf_counter())
+
+        # 2. Cada grupo de tenants arranca apenas sus catálogos están listos
+        tenant_futures = {}
+        for future in as_completed(catalog_futures):
+            key, submitted = catalog_futures[future]
+            members = groups[key]
+            catalog_seconds = round(time.perf_counter() - submitted, 2)
+            try:
+                catalogs = future.result()
+            except Exception as e:
+                logging.error(f"Error cargando catálogos de {members[0].datos_dir}: {e}")
+                catalogs = None
+            if not catalogs or not catalogs[0]:
+                for tenant in members:
+                    summary[tenant.nombre] = {'tenant': tenant.nombre, 'ok': False, 'segundos': 0.0,
+                                              'error': 'catálogos no disponibles', 'catalogos_segundos': catalog_seconds}
+                continue
+            for tenant in members:
+                tenant_futures[pool.submit(_run_tenant, tenant, catalogs)] = (tenant, catalog_seconds, len(members))
+
+        for future in as_completed(tenant_futures):
+            tenant, catalog_seconds, shared_with = tenant_futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'tenant': tenant.nombre, 'ok': False, 'segundos': None, 'error': str(e)}
+            result['catalogos_segundos'] = catalog_seconds
+            result['catalogos_compartidos_con'] = shared_with - 1
+            summary[tenant.nombre] = result
+            logging.info(f"Tenant '{tenant.nombre}': {'OK' if result['ok'] else 'ERROR'} en {result['segundos']} s.")
+
+    results = [summary[tenant.nombre] for tenant in tenants]
+    total = round(time.perf_counter() - batch_start, 2)
+    try:
+        os.makedirs(os.path.dirname(settings.BATCH_SUMMARY_FILE), exist_ok=True)
+        with open(settings.BATCH_SUMMARY_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'generado': datetime.now().isoformat(timespec='seconds'), 'segundos_total': total,
+                       'tenants': results}, f, ensure_ascii=False, indent=4)
+    except Exception as e:
+        logging.error(f"No se pudo guardar el resumen de la ejecución por lotes: {e}")
+
+    logging.info(f"Resumen por lotes ({total} s en total):")
+    for result in results:
+        logging.info(f"  {result['tenant']:<20} {'OK' if result['ok'] else 'ERROR':<6} "
+                     f"catálogos {result.get('catalogos_segundos', 0):>7} s  proceso {result.get('segundos') or 0:>8} s"
+                     + (f"  ({result['error']})" if result.get('error') else ""))
+    return results
@@ -0,0 +1,125 @@
+"""
+Benchmark del índice de búsqueda por trigramas (search_index.py).
+
+Genera un catálogo sintético (por defecto 100k productos), mide el tiempo de construcción,
+guardado y carga del índice, y la latencia de consultas con errores de tipeo, sin tildes,
+por código/EAN y con filtro de línea.
+
+Uso:
+    python benchmarks/bench_search.py
+    python benchmarks/bench_search.py --productos 200000 --consultas 5000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+import pandas as pd
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from config import settings  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+
+PALABRAS = ["pelota", "fútbol", "vóley", "pintura", "acrílica", "lápiz", "grafito", "cuaderno", "cuadriculado",
+            "plumón", "indeleble", "goma", "barra", "témpera", "pincel", "regla", "forro", "vinifan", "correa",
+            "escolar", "oficio", "cartulina", "plastilina", "colores", "borrador", "tajador", "compás", "mochila"]
+
+
+def synthetic_catalog(n, seed=7):
+    rng = random.Random(seed)
+    lineas = list(settings.PALETA_LINEAS)
+    return pd.DataFrame({
+        'codigo': [f"{100000 + i}" for i in range(n)],
+        'nombre': [" ".join(rng.sample(PALABRAS, 3)).upper() + f" {rng.choice(['A4', 'X12', '500G', 'N2'])}"
+                   for _ in range(n)],
+        'linea': [rng.choice(lineas) for _ in range(n)],
+        'ean': [f"775{i:010d}" for i in range(n)],
+        'ean_14': [f"1775{i:010d}" if i % 3 == 0 else '' for i in range(n)],
+        'stock_referencial': [rng.randint(0, 500) for _ in range(n)],
+    })
+
+
+def typo(word, rng):
+    """Borra, cambia o intercambia una letra."""
+    if len(word) < 4:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    op = rng.random()
+    if op < 0.33:
+        return word[:i] + word[i + 1:]
+    if op < 0.66:
+        return word[:i] + rng.choice('aeiourst') + word[i + 1:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:]
+
+
+def generate_queries(df, n, seed=11):
+    """Mezcla: 50% nombre con un error, 20% nombre sin tildes, 20% código/EAN, 10% con filtro de línea."""
+    rng = random.Random(seed)
+    lineas = df['linea'].unique().tolist()
+    nombres, codigos, eans = df['nombre'].tolist(), df['codigo'].tolist(), df['ean'].tolist()
+    queries = []
+    for _ in range(n):
+        i = rng.randrange(len(nombres))
+        palabras = nombres[i].lower().split()[:2]
+        r = rng.random()
+        if r < 0.5:
+            queries.append((" ".join(typo(w, rng) for w in palabras), None))
+        elif r < 0.7:
+            queries.append((" ".join(palabras).translate(str.maketrans('áéíóú', 'aeiou')), None))
+        elif r < 0.9:
+            queries.append((rng.choice([codigos[i], eans[i]]), None))
+        else:
+            queries.append((" ".join(palabras), rng.choice(lineas)))
+    return queries
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--productos", type=int, default=100_000, help="Productos del catálogo sintético.")
+    parser.add_argument("--consultas", type=int, default=2000, help="Consultas a medir.")
+    parser.add_argument("--limite", type=int, default=20, help="Resultados por consulta.")
+    args = parser.parse_args()
+
+    df = synthetic_catalog(args.productos)
+
+    start = time.perf_counter()
+    index = SearchIndex.build(df)
+    build_s = time.perf_counter() - start
+    path = os.path.join(tempfile.mkdtemp(), "indice_busqueda.npz")
+    start = time.perf_counter()
+    index.save(path)
+    save_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index = SearchIndex.load(path)
+    load_s = time.perf_counter() - start
+    print(f"{args.productos} productos, {len(index.keys)} trigramas, {len(index.postings)} postings, "
+          f"{os.path.getsize(path) / 1e6:.1f} MB")
+    print(f"construcción {build_s:.2f} s | guardado {save_s:.2f} s | carga {load_s:.2f} s")
+
+    queries = generate_queries(df, args.consultas)
+    latencies, sin_resultado = [], 0
+    for texto, linea in queries:
+        start = time.perf_counter()
+        resultados = index.search(texto, linea=linea, limit=args.limite)
+        latencies.append((time.perf_counter() - start) * 1000)
+        sin_resultado += not resultados
+
+    print(f"\n{len(latencies)} consultas ({sin_resultado} sin resultado)")
+    print(f"p50 {percentile(latencies, 50):.2f} ms | p95 {percentile(latencies, 95):.2f} ms | "
+          f"p99 {percentile(latencies, 99):.2f} ms | máx {max(latencies):.2f} ms | "
+          f"media {statistics.mean(latencies):.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Mide el tiempo de arranque de los puntos de entrada con `python -X importtime`.
+
+Uso:
+    python benchmarks/bench_startup.py            # main.py y app.py
+    python benchmarks/bench_startup.py --top 15   # muestra los 15 módulos más costosos
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "main (import)": "import main",
+    "main --help": "import sys, main; sys.argv = ['main.py', '--help']\ntry:\n    main.main()\nexcept SystemExit:\n    pass",
+    "app (import)": "import app",
+}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(.+)")
+
+
+def run_importtime(code):
+    """Ejecuta el código en un intérprete nuevo y devuelve (segundos de pared, [(cumulativo_us, modulo)])."""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules.append((int(match.group(2)), match.group(4).strip(), len(match.group(3))))
+    return elapsed, modules, proc.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por objetivo (se reporta la mediana).")
+    parser.add_argument("--top", type=int, default=10, help="Módulos de primer nivel más costosos a mostrar.")
+    args = parser.parse_args()
+
+    for label, code in TARGETS.items():
+        walls, totals, modules = [], [], []
+        for _ in range(args.repeat):
+            elapsed, modules, returncode = run_importtime(code)
+            if returncode != 0:
+                print(f"{label}: el intérprete terminó con código {returncode}")
+                break
+            walls.append(elapsed)
+            # Los módulos importados directamente tienen la menor indentación
+            min_indent = min(indent for _, _, indent in modules) if modules else 0
+            totals.append(sum(cum for cum, _, indent in modules if indent == min_indent))
+        if not walls:
+            continue
+
+        print(f"\n=== {label} ===")
+        print(f"pared (mediana de {len(walls)}): {statistics.median(walls) * 1000:.1f} ms")
+        print(f"imports (mediana):            {statistics.median(totals) / 1000:.1f} ms")
+        min_indent = min(indent for _, _, indent in modules) if modules else 0
+        top_level = sorted(((cum, name) for cum, name, indent in modules if indent == min_indent), reverse=True)
+        for cum, name in top_level[:args.top]:
+            print(f"  {cum / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Prueba de carga del webhook de Dialogflow (/api/dialogflow/webhook).
+
+Reproduce una mezcla de consultas grabada (JSONL con {"producto": ..., "almacen": ...} por línea)
+o genera una a partir de stock_generales.json (códigos, EAN, fragmentos de nombre y fallos).
+Reporta p50/p95/p99 frente al objetivo de 20 ms.
+
+Uso:
+    python benchmarks/bench_webhook.py --synthetic 50000 --requests 5000
+    python benchmarks/bench_webhook.py --record consultas.jsonl --requests 2000
+    python benchmarks/bench_webhook.py --queries consultas.jsonl --url http://localhost:5000 --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from config import settings  # noqa: E402
+
+TARGET_P99_MS = 20.0
+PALABRAS = ["pelota", "futbol", "voley", "pintura", "acrilica", "lapiz", "grafito", "cuaderno", "cuadriculado",
+             "plumon", "indeleble", "goma", "barra", "tempera", "pincel", "regla", "forro", "vinifan", "correa"]
+
+
+def synthetic_stock(n, path, seed=7):
+    """stock_generales sintético con n productos y 12 almacenes."""
+    rng = random.Random(seed)
+    almacenes = [f"ALM{i:02d}" for i in range(12)]
+    productos = []
+    for i in range(n):
+        productos.append({
+            'codigo': f"{100000 + i}",
+            'nombre': " ".join(rng.sample(PALABRAS, 3)).upper() + f" N{i % 500}",
+            'linea': rng.choice(list(settings.PALETA_LINEAS)),
+            'ean': f"775{i:010d}",
+            'ean_14': '',
+            'precio': 1.0,
+            'can_kg_um': 0.0,
+            'u_por_caja': 12,
+            'stock_referencial': rng.randint(0, 500),
+            'almacenes': {wh: {'total': rng.randint(0, 100), 'disponible': rng.randint(-5, 100)} for wh in almacenes}
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(productos, f, ensure_ascii=False)
+    return productos
+
+
+def generate_mix(productos, n, seed=11):
+    """Mezcla: 40% código, 20% EAN, 30% fragmento de nombre, 10% sin resultado; mitad con almacén."""
+    rng = random.Random(seed)
+    almacenes = sorted({wh for p in productos[:100] for wh in p.get('almacenes', {})})
+    queries = []
+    for _ in range(n):
+        producto = rng.choice(productos)
+        r = rng.random()
+        if r < 0.4:
+            texto = producto['codigo']
+        elif r < 0.6:
+            texto = producto.get('ean') or producto['codigo']
+        elif r < 0.9:
+            palabras = producto['nombre'].split()
+            texto = " ".join(w[:max(3, len(w) - 2)].lower() for w in palabras[:2])
+        else:
+            texto = f"inexistente {rng.randint(0, 10 ** 6)}"
+        query = {'producto': texto}
+        if almacenes and rng.random() < 0.5:
+            query['almacen'] = rng.choice(almacenes)
+        queries.append(query)
+    return queries
+
+
+def dialogflow_body(query):
+    return {"queryResult": {"queryText": query['producto'], "parameters": {
+        settings.DIALOGFLOW_PARAM_PRODUCTO: query['producto'],
+        settings.DIALOGFLOW_PARAM_ALMACEN: query.get('almacen', '')
+    }}}
+
+
+def run_in_process(queries):
+    from app import app
+    client = app.test_client()
+    client.post('/api/dialogflow/webhook', json=dialogflow_body(queries[0]))  # construye el índice
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        response = client.post('/api/dialogflow/webhook', json=dialogflow_body(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"Respuesta {response.status_code}: {response.get_data(as_text=True)}")
+    return latencies
+
+
+def run_http(queries, url, concurrency):
+    import requests
+    session = requests.Session()
+    endpoint = url.rstrip('/') + '/api/dialogflow/webhook'
+    headers = {'Authorization': f"Bearer {settings.DIALOGFLOW_WEBHOOK_TOKEN}"} if settings.DIALOGFLOW_WEBHOOK_TOKEN else {}
+    session.post(endpoint, json=dialogflow_body(queries[0]), headers=headers, timeout=30)
+
+    def one(query):
+        start = time.perf_counter()
+        response = session.post(endpoint, json=dialogflow_body(query), headers=headers, timeout=30)
+        response.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, queries))
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stock", default=None, help="stock_generales.json a indexar (por defecto el de settings).")
+    parser.add_argument("--synthetic", type=int, default=0, help="Genera un stock_generales sintético con N productos.")
+    parser.add_argument("--queries", default=None, help="Mezcla grabada (JSONL) a reproducir.")
+    parser.add_argument("--record", default=None, help="Guarda la mezcla generada en este JSONL.")
+    parser.add_argument("--requests", type=int, default=2000, help="Consultas a generar si no hay mezcla grabada.")
+    parser.add_argument("--url", default=None, help="Servidor a probar por HTTP; sin esto se usa el cliente de pruebas de Flask.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Hilos concurrentes en modo HTTP.")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        settings.STOCK_GENERALES_FILE = os.path.join(tempfile.mkdtemp(), "stock_generales.json")
+        start = time.perf_counter()
+        productos = synthetic_stock(args.synthetic, settings.STOCK_GENERALES_FILE)
+        print(f"stock sintético: {len(productos)} productos ({time.perf_counter() - start:.1f} s)")
+    else:
+        if args.stock:
+            settings.STOCK_GENERALES_FILE = os.path.abspath(args.stock)
+        with open(settings.STOCK_GENERALES_FILE, 'r', encoding='utf-8') as f:
+            productos = json.load(f)
+
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        queries = generate_mix(productos, args.requests)
+        if args.record:
+            with open(args.record, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(q, ensure_ascii=False) + "\n" for q in queries)
+            print(f"mezcla grabada en {args.record}")
+
+    start = time.perf_counter()
+    latencies = run_http(queries, args.url, args.concurrency) if args.url else run_in_process(queries)
+    elapsed = time.perf_counter() - start
+
+    p99 = percentile(latencies, 99)
+    print(f"\n{len(latencies)} consultas en {elapsed:.2f} s ({len(latencies) / elapsed:.0f} req/s)")
+    print(f"p50 {percentile(latencies, 50):.2f} ms | p95 {percentile(latencies, 95):.2f} ms | "
+          f"p99 {p99:.2f} ms | máx {max(latencies):.2f} ms | media {statistics.mean(latencies):.2f} ms")
+    print(f"objetivo p99 < {TARGET_P99_MS:.0f} ms: {'OK' if p99 < TARGET_P99_MS else 'NO CUMPLE'}")
+    return 0 if p99 < TARGET_P99_MS else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import os
+import json
+import logging
+import typing
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from config import settings
+from publish import published_path
+from schemas import AlmacenStock, ProductoStock
+from utils import ReloadingValue
+
+# Exportación columnar de stock_generales: mismo contenido que stock_generales.json, pero con
+# una columna por almacén y campo (<almacen>_total, <almacen>_disponible) en un orden fijo,
+# en formato Arrow IPC sin compresión para que los consumidores lo abran con memory-map y
+# lean sólo las columnas que necesitan. El esquema se deriva de ProductoStock.
+#
+# El consolidado completo también se publica como Arrow IPC versionado para la API: cada
+# ejecución escribe un archivo nuevo (consolidado_<version>.arrow) y después reemplaza de forma
+# atómica el puntero (ACTUAL.json). Los workers de la API abren el archivo con memory-map de
+# sólo lectura, así todos comparten las mismas páginas del sistema operativo, y cambian al nuevo
+# cuando el puntero cambia, sin reiniciar.
+
+_ARROW_TYPES = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+
+
+def producto_stock_arrow_schema(warehouse_ids: List[str]) -> pa.Schema:
+    """Esquema Arrow equivalente a ProductoStock con el dict `almacenes` aplanado."""
+    fields = []
+    for name, field in ProductoStock.model_fields.items():
+        if typing.get_origin(field.annotation) is dict:
+            continue
+        fields.append(pa.field(name, _ARROW_TYPES[field.annotation], nullable=False))
+    for wh in warehouse_ids:
+        for name, field in AlmacenStock.model_fields.items():
+            fields.append(pa.field(f"{wh}_{name}", _ARROW_TYPES[field.annotation], nullable=False))
+    return pa.schema(fields, metadata={
+        'almacenes': json.dumps(warehouse_ids),
+        'esquema': ProductoStock.__name__
+    })
+
+
+def stock_generales_table(validated_items: List[Dict], warehouse_ids: List[str]) -> pa.Table:
+    """Tabla columnar a partir de los registros ya validados con ProductoStock (model_dump)."""
+    schema = producto_stock_arrow_schema(warehouse_ids)
+    columns = []
+    for field in schema:
+        if field.name in ProductoStock.model_fields:
+            values = [item[field.name] for item in validated_items]
+        else:
+            wh, name = field.name.rsplit('_', 1)
+            values = [item['almacenes'][wh][name] for item in validated_items]
+        columns.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def write_stock_generales_arrow(validated_items: List[Dict], warehouse_ids: List[str],
+                                path: Optional[str] = None) -> Optional[str]:
+    """Escribe stock_generales.arrow (Arrow IPC, escritura atómica)."""
+    path = path or settings.STOCK_GENERALES_ARROW_FILE
+    try:
+        table = stock_generales_table(validated_items, warehouse_ids)
+        tmp_path = path + '.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        logging.info(f"{os.path.basename(path)} generado: {table.num_rows} productos, {table.num_columns} columnas.")
+        return path
+    except Exception as e:
+        logging.error(f"Error generando la exportación columnar de stock_generales: {e}")
+        return None
+
+
+def read_stock_generales_arrow(columns: Optional[List[str]] = None, path: Optional[str] = None) -> pa.Table:
+    """Abre la exportación con memory-map y devuelve sólo las columnas pedidas."""
+    path = path or published_path(settings.STOCK_GENERALES_ARROW_FILE)
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def _write_arrow_atomic(table: pa.Table, path: str):
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def publish_consolidated_arrow(df_consolidado: pd.DataFrame, directory: Optional[str] = None) -> Optional[str]:
+    """Publica el consolidado como un archivo Arrow versionado y mueve el puntero hacia él."""
+    directory = directory or settings.CONSOLIDATED_ARROW_DIR
+    try:
+        os.makedirs(directory, exist_ok=True)
+        version = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        filename = f"consolidado_{version}.arrow"
+        df = df_consolidado.drop(columns=['motivo'], errors='ignore')
+        table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+        _write_arrow_atomic(table, os.path.join(directory, filename))
+
+        pointer_path = os.path.join(directory, settings.CONSOLIDATED_ARROW_POINTER)
+        tmp_path = pointer_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'archivo': filename, 'version': version, 'filas': table.num_rows}, f)
+        os.replace(tmp_path, pointer_path)
+        logging.info(f"Consolidado publicado para la API: {filename} ({table.num_rows} códigos).")
+
+        _prune_consolidated_versions(directory, keep=filename)
+        return os.path.join(directory, filename)
+    except Exception as e:
+        logging.error(f"Error publicando el consolidado en Arrow: {e}")
+        return None
+
+
+def _prune_consolidated_versions(directory: str, keep: str):
+    """
+    Borra versiones viejas dejando las CONSOLIDATED_ARROW_KEEP más recientes (un worker puede
+    seguir leyendo la anterior hasta su próxima revisión del puntero). En Windows un archivo
+    todavía mapeado no se puede borrar: se reintenta en la próxima publicación.
+    """
+    versions = sorted(name for name in os.listdir(directory)
+                      if name.startswith('consolidado_') and name.endswith('.arrow'))
+    for name in versions[:-settings.CONSOLIDATED_ARROW_KEEP]:
+        if name == keep:
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError as e:
+            logging.debug(f"No se pudo borrar {name} (¿en uso?): {e}")
+
+
+def read_consolidated_pointer(directory: Optional[str] = None) -> Optional[Dict]:
+    directory = directory or settings.CONSOLIDATED_ARROW_DIR
+    try:
+        with open(os.path.join(directory, settings.CONSOLIDATED_ARROW_POINTER), 'r', encoding='utf-8') as f:
+            pointer = json.load(f)
+        pointer['ruta'] = os.path.join(directory, pointer['archivo'])
+        return pointer
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def open_consolidated_arrow(path: str) -> pa.Table:
+    """Tabla respaldada por el memory-map del archivo (sin copiar los datos al proceso)."""
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _open_consolidated(version: str) -> Dict:
+    pointer = read_consolidated_pointer()
+    tabla = open_consolidated_arrow(pointer['ruta'])
+    logging.info(f"Consolidado Arrow {pointer['archivo']} abierto con memory-map.")
+    return {'version': pointer['version'], 'tabla': tabla}
+
+
+_consolidated = ReloadingValue(lambda: (read_consolidated_pointer() or {}).get('version'), _open_consolidated,
+                               settings.STOCK_INDEX_CHECK_SECONDS, description='el consolidado Arrow')
+
+
+def get_consolidated_table() -> Optional[Dict]:
+    """
+    Versión vigente del consolidado publicado: {'version', 'tabla'}. Revisa el puntero como
+    máximo cada STOCK_INDEX_CHECK_SECONDS; quien aún use la tabla anterior la conserva hasta
+    soltar la referencia.
+    """
+    return _consolidated.get()
@@ -17,8 +17,13 @@ class Settings:
     LOGS_DIR = os.path.join(PROCESAMIENTO_DIR, "logs")
     HISTORICOS_DIR = os.path.join(PROCESAMIENTO_DIR, "historicos")
     TEMP_DIR = os.path.join(PROCESAMIENTO_DIR, "temp")
+    HISTORICOS_PARTICIONES_DIR = os.path.join(HISTORICOS_DIR, "particiones")
+    HISTORICOS_INTRADIA_DIR = os.path.join(HISTORICOS_DIR, "intradia")
+    HISTORICOS_COMPACTADOS_DIR = os.path.join(HISTORICOS_DIR, "compactado")
     
-    REQUIRED_DIRS = [DATOS_DIR, SALIDA_DIR, PROCESAMIENTO_DIR, LOGS_DIR, HISTORICOS_DIR, TEMP_DIR]
+    MOVIMIENTOS_DIR = os.path.join(PROCESAMIENTO_DIR, "movimientos")
+
+    REQUIRED_DIRS = [DATOS_DIR, SALIDA_DIR, PROCESAMIENTO_DIR, LOGS_DIR, HISTORICOS_DIR, TEMP_DIR, HISTORICOS_PARTICIONES_DIR, MOVIMIENTOS_DIR]
 
     # === ARCHIVOS DE ENTRADA ===
     INPUT_GENERALES_EXCEL = os.path.join(DATOS_DIR, "codigos_generales.xlsx")
@@ -30,19 +35,99 @@ class Settings:
     OUTPUT_FINAL_REPORT_EXCEL = os.path.join(SALIDA_DIR, "reporte_stock_hoy.xlsx")
     OUTPUT_ESPECIALES_REPORT_EXCEL = os.path.join(SALIDA_DIR, "reporte_especiales.xlsx")
     OUTPUT_PRODUCTOS_LOCAL_JSON = os.path.join(SALIDA_DIR, "productos_local.json")
+    # productos_local partido por línea (un JSON compacto por línea + manifest.json con hash, tamaño y registros)
+    PRODUCTOS_LOCAL_SHARDS_DIR = os.path.join(SALIDA_DIR, "productos_local")
+    PRODUCTOS_LOCAL_SHARDS_ENABLED = os.getenv("PRODUCTOS_LOCAL_SHARDS_ENABLED", "true").lower() == "true"
     STOCK_GENERALES_FILE = os.path.join(SALIDA_DIR, "stock_generales.json")
+    STOCK_GENERALES_ARROW_FILE = os.path.join(SALIDA_DIR, "stock_generales.arrow")
+    # Índice de búsqueda por trigramas (nombre, código, EAN) publicado junto con productos_local
+    SEARCH_INDEX_FILE = os.path.join(SALIDA_DIR, "indice_busqueda.npz")
+    OUTPUT_ROLLUP_STOCK_JSON = os.path.join(SALIDA_DIR, "rollup_stock.json")
+    OUTPUT_ROLLUP_STOCK_PARQUET = os.path.join(SALIDA_DIR, "rollup_stock.parquet")
+    OUTPUT_ALERTAS_JSON = os.path.join(SALIDA_DIR, "alertas_stock.json")
     REPORTES_DIR = SALIDA_DIR
+    # Publicación versionada: cada ejecución publica en versiones/<version> y ACTUAL.json apunta a la vigente
+    PUBLICACIONES_DIR = os.path.join(SALIDA_DIR, "versiones")
+    PUBLICACION_POINTER_FILE = os.path.join(SALIDA_DIR, "ACTUAL.json")
+    PUBLICACION_LINK = os.path.join(SALIDA_DIR, "actual")
+    PUBLICACIONES_KEEP = int(os.getenv("PUBLICACIONES_KEEP", "3"))
     
     # === ARCHIVOS DE PROCESAMIENTO (Archivos de Trabajo) ===
+    # El consolidado canónico es el Parquet; el Excel sólo se genera si se pide (export-excel o la opción)
+    DATA_STOCK_COMPLETO_PARQUET = os.path.join(PROCESAMIENTO_DIR, "data_stock_completo.parquet")
     DATA_STOCK_COMPLETO_FILE = os.path.join(PROCESAMIENTO_DIR, "data_stock_completo.xlsx")
+    DATA_STOCK_COMPLETO_EXCEL_ENABLED = os.getenv("DATA_STOCK_COMPLETO_EXCEL_ENABLED", "false").lower() == "true"
     PREVIOUS_STOCK_FILE = os.path.join(TEMP_DIR, "previous_stock.json")
+    ALERTS_STATE_FILE = os.path.join(PROCESAMIENTO_DIR, "alertas_estado.json")
+    # Bloqueo para que no corran dos ejecuciones a la vez (espera máxima antes de abandonar)
+    RUN_LOCK_FILE = os.path.join(PROCESAMIENTO_DIR, "proceso.lock")
+    RUN_LOCK_WAIT_SECONDS = float(os.getenv("RUN_LOCK_WAIT_SECONDS", "0"))
+    # Base SQLite opcional con el consolidado diario (consultable por la API)
+    STOCK_DB_ENABLED = os.getenv("STOCK_DB_ENABLED", "false").lower() == "true"
+    STOCK_DB_FILE = os.path.join(PROCESAMIENTO_DIR, "stock.db")
+    # Consolidado versionado en Arrow IPC (memory-map compartido por los workers de la API)
+    CONSOLIDATED_ARROW_DIR = os.path.join(PROCESAMIENTO_DIR, "consolidado_arrow")
+    CONSOLIDATED_ARROW_POINTER = "ACTUAL.json"
+    CONSOLIDATED_ARROW_KEEP = 2
+    REPT_STOCK_LAYOUT_CACHE_FILE = os.path.join(PROCESAMIENTO_DIR, "rept_stock_formato.json")
+    REPT_STOCK_ARTIFACT_FILE = os.path.join(PROCESAMIENTO_DIR, "rept_stock_anterior.npz")
 
     # === API & DESCARGAS (desde .env) ===
     STOCK_API_URL = os.getenv("STOCK_API_URL", "http://default.url/if/not/set")
 
+    # Almacenes a conservar de REPT_STOCK (coma separados); vacío = todos
+    ALMACENES = [a.strip() for a in os.getenv("ALMACENES", "").split(",") if a.strip()] or None
+
+    # === ETAPA DE CARGA ===
+    # Descarga en un hilo y parseo de los libros en procesos; plazo total de la etapa en segundos
+    LOAD_STAGE_TIMEOUT_SECONDS = float(os.getenv("LOAD_STAGE_TIMEOUT_SECONDS", "300"))
+    LOAD_USE_PROCESSES = os.getenv("LOAD_USE_PROCESSES", "true").lower() == "true"
+    LOAD_PROCESS_WORKERS = int(os.getenv("LOAD_PROCESS_WORKERS", "3"))
+
     # === GOOGLE CLOUD STORAGE (desde .env) ===
     STORAGE_BUCKET_NAME = os.getenv("STORAGE_BUCKET_NAME")
     STORAGE_CREDENTIALS_PATH = os.getenv("STORAGE_CREDENTIALS_PATH")
+    STORAGE_HISTORY_PREFIX = os.getenv("STORAGE_HISTORY_PREFIX", "historicos/")
+    STORAGE_REPORT_BLOB = os.getenv("STORAGE_REPORT_BLOB", "reporte_stock_hoy.xlsx")
+    STORAGE_LIST_PAGE_SIZE = int(os.getenv("STORAGE_LIST_PAGE_SIZE", "100"))
+    STORAGE_LIST_MAX_PAGE_SIZE = 1000
+    STORAGE_LIST_CACHE_TTL_SECONDS = int(os.getenv("STORAGE_LIST_CACHE_TTL_SECONDS", "60"))
+    # URLs firmadas: se reutilizan hasta SIGNED_URL_RENEW_MARGIN_MINUTES antes de expirar o hasta que se publique otro reporte
+    REPORTE_URL_EXPIRATION_MINUTES = int(os.getenv("REPORTE_URL_EXPIRATION_MINUTES", "30"))
+    SIGNED_URL_RENEW_MARGIN_MINUTES = int(os.getenv("SIGNED_URL_RENEW_MARGIN_MINUTES", "5"))
+    REPORTE_URL_RATE_LIMIT = int(os.getenv("REPORTE_URL_RATE_LIMIT", "120"))  # peticiones por minuto
+
+    # === SINCRONIZACIÓN CON ALMACÉN DE DOCUMENTOS (Firestore) ===
+    DOC_SYNC_ENABLED = os.getenv("DOC_SYNC_ENABLED", "false").lower() == "true"
+    DOC_SYNC_BACKEND = os.getenv("DOC_SYNC_BACKEND", "firestore")  # 'firestore' | 'memoria'
+    DOC_SYNC_COLLECTION = os.getenv("DOC_SYNC_COLLECTION", "stock_generales")
+    DOC_SYNC_BATCH_SIZE = 500  # máximo de escrituras por commit en Firestore
+    DOC_SYNC_MAX_WORKERS = int(os.getenv("DOC_SYNC_MAX_WORKERS", "4"))
+    DOC_SYNC_MAX_RETRIES = 3
+    DOC_SYNC_RETRY_BASE_SECONDS = 1.0
+    DOC_SYNC_STATE_FILE = os.path.join(PROCESAMIENTO_DIR, "document_sync_estado.json")
+    FIRESTORE_PROJECT = os.getenv("FIRESTORE_PROJECT")
+    FIRESTORE_CREDENTIALS_PATH = os.getenv("FIRESTORE_CREDENTIALS_PATH")
+
+    # === EJECUCIÓN POR LOTES (varias empresas / ERPs) ===
+    TENANTS_FILE = os.getenv("TENANTS_FILE", os.path.join(DATOS_DIR, "tenants.json"))
+    BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "2"))
+    BATCH_SUMMARY_FILE = os.path.join(PROCESAMIENTO_DIR, "batch_resumen.json")
+    COPY_REPORT_TO_DESKTOP = os.getenv("COPY_REPORT_TO_DESKTOP", "true").lower() == "true"
+
+    # === API WEB (desde .env) ===
+    API_HOST = os.getenv("API_HOST", "0.0.0.0")
+    API_PORT = int(os.getenv("API_PORT", "5000"))
+    API_DEBUG = os.getenv("API_DEBUG", "false").lower() == "true"
+    # Índice en memoria de stock_generales (webhook de Dialogflow): cada cuánto revisar si cambió el archivo
+    STOCK_INDEX_CHECK_SECONDS = float(os.getenv("STOCK_INDEX_CHECK_SECONDS", "30"))
+    DIALOGFLOW_WEBHOOK_TOKEN = os.getenv("DIALOGFLOW_WEBHOOK_TOKEN")  # si se define, se exige "Authorization: Bearer <token>"
+    DIALOGFLOW_PARAM_PRODUCTO = os.getenv("DIALOGFLOW_PARAM_PRODUCTO", "producto")
+    DIALOGFLOW_PARAM_ALMACEN = os.getenv("DIALOGFLOW_PARAM_ALMACEN", "almacen")
+    DIALOGFLOW_MAX_OPCIONES = 5
+    SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", "0.5"))  # fracción mínima de trigramas de la consulta (0-1)
+    SEARCH_MAX_RESULTADOS = 50
+    STOCK_BATCH_MAX_CODIGOS = int(os.getenv("STOCK_BATCH_MAX_CODIGOS", "5000"))  # por petición a /api/stock/batch
 
     # === REPORTES & PROCESAMIENTO ===
     PALETA_LINEAS = {
@@ -70,6 +155,33 @@ class Settings:
 
     # === CONFIGURACIÓN DE HISTÓRICOS ===
     HISTORICO_STOCK_COLUMN = 'VES_disponible'
+    # Snapshots intradía: cada ejecución se registra (deltas contra la primera del día)
+    INTRADAY_SNAPSHOTS_ENABLED = os.getenv("INTRADAY_SNAPSHOTS_ENABLED", "false").lower() == "true"
+    HISTORICO_VENTANA_DIAS = int(os.getenv("HISTORICO_VENTANA_DIAS", "120"))
+    HISTORICO_LAGS_DIAS = {
+        1: 'stock_ayer',
+        7: 'stock_hace_una_semana',
+        30: 'stock_hace_30_dias',
+        90: 'stock_hace_90_dias'
+    }
+    HISTORICO_PROMEDIO_DIAS = 7
+    # Retención: resolución diaria hasta N días (mayor que el desfase más largo), luego semanal y mensual
+    SNAPSHOT_RETENCION_DIARIA_DIAS = int(os.getenv("SNAPSHOT_RETENCION_DIARIA_DIAS", "100"))
+    SNAPSHOT_RETENCION_SEMANAL_DIAS = int(os.getenv("SNAPSHOT_RETENCION_SEMANAL_DIAS", "365"))
+    HISTORICO_PARTITION_FILENAME = "stock.parquet"
+    HISTORICO_PARTITION_ROW_GROUP_SIZE = 5000
+    HISTORICO_SERIE_DEFAULT_DIAS = 30
+    HISTORICO_SERIE_MAX_DIAS = 366
+
+    # === ALERTAS DE STOCK ===
+    # tipos: 'bajo_cajas' (columna < cajas * u_por_caja), 'caida_porcentual' (columna cae más de
+    # 'porcentaje'% respecto de 'referencia') y 'sin_disponible' (disponible <= 0 en todos los almacenes)
+    ALERT_RULES = [
+        {'id': 'ves_bajo_2_cajas', 'tipo': 'bajo_cajas', 'columna': 'VES_disponible', 'cajas': 2, 'severidad': 'media'},
+        {'id': 'caida_50_vs_ayer', 'tipo': 'caida_porcentual', 'columna': 'stock_referencial',
+         'referencia': 'stock_ayer', 'porcentaje': 50, 'severidad': 'media'},
+        {'id': 'sin_disponible_total', 'tipo': 'sin_disponible', 'severidad': 'alta'},
+    ]
 
     # === ESTANDARIZACIÓN DE COLUMNAS ===
     STANDARD_COLUMN_NAMES = {
@@ -104,6 +216,27 @@ class Settings:
         'DISPONIBLE': 'disponible'
     }
     
+    # El encabezado de REPT_STOCK se detecta por nombre en las primeras filas (ver REPT_STOCK_HEADER_ALIASES)
+    # y el formato detectado se guarda en caché. Las posiciones fijas (base 0) quedan como respaldo.
+    REPT_STOCK_HEADER_SCAN_ROWS = 30
+    REPT_STOCK_HEADER_ALIASES = {
+        'codigo': ['ARTICULO', 'CODIGO', 'COD ARTICULO', 'CODIGO ARTICULO'],
+        'nombre_articulo': ['NOMBRE ARTICULO', 'DESCRIPCION', 'DESCRIPCION ARTICULO'],
+        'almacen': ['ALMACEN', 'COD ALMACEN', 'CODIGO ALMACEN'],
+        'stock_total': ['STOCK TOTAL', 'STOCK'],
+        'predespacho': ['PREDESPACHO', 'PRE DESPACHO'],
+        'disponible': ['DISPONIBLE', 'STOCK DISPONIBLE']
+    }
+    REPT_STOCK_HEADER_ROW = 10
+    REPT_STOCK_COLUMN_POSITIONS = {
+        'codigo': 1,
+        'nombre_articulo': 2,
+        'almacen': 9,
+        'stock_total': 13,
+        'predespacho': 16,
+        'disponible': 18
+    }
+    
     MANUAL_COLS_MAP = {
         'CODIGO': STANDARD_COLUMN_NAMES['codigo'],
         'NOMBRE': STANDARD_COLUMN_NAMES['nombre'],
@@ -113,4 +246,44 @@ class Settings:
         'MOTIVO': 'motivo'
     }
 
+    def apply_tenant(self, datos_dir=None, salida_dir=None, procesamiento_dir=None,
+                     stock_api_url=None, almacenes=None, storage_prefix=None, doc_collection=None):
+        """
+        Reconfigura esta instancia para otra empresa/ERP: cambia los directorios base y
+        reubica todas las rutas derivadas de ellos (archivos de entrada, salida y trabajo).
+        `storage_prefix` antepone un prefijo a los objetos del bucket (históricos y reporte) y
+        `doc_collection` cambia la colección de Firestore, para que los tenants no compartan datos.
+        Pensado para procesos dedicados a un tenant (ver batch_runner.py).
+        """
+        moves = [(old, os.path.abspath(new)) for old, new in (
+            (self.DATOS_DIR, datos_dir), (self.SALIDA_DIR, salida_dir), (self.PROCESAMIENTO_DIR, procesamiento_dir)
+        ) if new]
+
+        def rebase(path):
+            for old, new in moves:
+                if path == old or path.startswith(old + os.sep):
+                    return new + path[len(old):]
+            return path
+
+        for name in dir(self):
+            if not name.isupper():
+                continue
+            value = getattr(self, name)
+            if isinstance(value, str):
+                setattr(self, name, rebase(value))
+            elif isinstance(value, list) and value and all(isinstance(v, str) and os.path.isabs(v) for v in value):
+                setattr(self, name, [rebase(v) for v in value])
+
+        if stock_api_url:
+            self.STOCK_API_URL = stock_api_url
+        if almacenes is not None:
+            self.ALMACENES = list(almacenes) or None
+        if storage_prefix is not None:
+            # Sobre los valores de la clase: un proceso reutilizado no acumula prefijos de otro tenant
+            self.STORAGE_HISTORY_PREFIX = storage_prefix + Settings.STORAGE_HISTORY_PREFIX
+            self.STORAGE_REPORT_BLOB = storage_prefix + Settings.STORAGE_REPORT_BLOB
+        if doc_collection is not None:
+            self.DOC_SYNC_COLLECTION = doc_collection
+        return self
+
 settings = Settings()
\ No newline at end of file
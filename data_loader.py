@@ -1,188 +1,232 @@
 import os
+import math
+import hashlib
+import itertools
+import unicodedata
+import numpy as np
 import pandas as pd
 import logging
 import requests
+from array import array
 from io import BytesIO
-from typing import List, Optional, Tuple, Dict
+import json
+from typing import Iterator, List, Optional, Tuple, Dict
+from datetime import datetime # Added datetime import
 
 from config import settings
+from utils import validate_file_exists
+from normalize import normalize_codes, normalize_eans
 
-def validate_file_exists(filepath: str, description: str) -> bool:
-    """Verifica si un archivo existe y loguea el resultado."""
-    if not os.path.exists(filepath):
-        logging.error(f"{description} no encontrado: {filepath}")
-        return False
-    logging.info(f"{description} encontrado: {filepath}")
-    return True
-
-def download_and_parse_rept_stock() -> Optional[pd.DataFrame]:
-    """Descarga y procesa el reporte de stock desde la API."""
+def download_rept_stock() -> Optional[bytes]:
+    """Descarga el libro REPT_STOCK desde la API y retorna su contenido binario."""
     logging.info("Descargando REPT_STOCK...")
     try:
         response = requests.get(settings.STOCK_API_URL, timeout=120)
         response.raise_for_status()
-        with BytesIO(response.content) as f:
-            df_raw = pd.read_excel(f, skiprows=10, dtype=str)
-
-        df = df_raw.iloc[:, [1, 2, 9, 13, 16, 18]].copy()
-        df.columns = ["ARTÍCULO", "NOMBRE_ARTICULO", "ALMACEN", "STOCK TOTAL", "PREDESPACHO", "DISPONIBLE"]
-        df.rename(columns=settings.REPT_STOCK_COLS_MAP, inplace=True)
-        
-        df.dropna(subset=["codigo", "almacen"], inplace=True)
-        df["codigo"] = df["codigo"].astype(str).str.strip()
-
-        numeric_cols = ["stock_total", "predespacho", "disponible"]
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-        df_pivot = df.pivot_table(
-            index="codigo",
-            columns="almacen",
-            values=numeric_cols,
-            aggfunc="first",
-            fill_value=0
-        )
-        df_pivot.columns = [f"{alm}_{tipo.replace(' ', '_')}" for tipo, alm in df_pivot.columns]
-        df_pivot.reset_index(inplace=True)
-        df_pivot['codigo'] = df_pivot['codigo'].astype(str).str.strip() # Ensure codigo remains string after pivot
-        # Remove all spaces
-        df_pivot['codigo'] = df_pivot['codigo'].str.replace(' ', '', regex=False)
-
-        ves_disponible_col = next((col for col in df_pivot.columns if 'VES' in col.upper() and 'disponible' in col.lower()), None)
-        if ves_disponible_col:
-            df_pivot[settings.STANDARD_COLUMN_NAMES['stock_referencial']] = df_pivot[ves_disponible_col].astype(int)
-        else:
-            df_pivot[settings.STANDARD_COLUMN_NAMES['stock_referencial']] = 0
-            logging.warning("No se encontró columna con stock de VES, usando 0 como stock referencial")
-
-        logging.info(f"REPT_STOCK procesado: {len(df_pivot)} productos.")
-        return df_pivot
+        logging.info(f"REPT_STOCK descargado: {len(response.content) / 1024:.0f} KB.")
+        return response.content
     except Exception as e:
         logging.error(f"Error descargando REPT_STOCK: {e}")
         return None
 
-def load_catalogs_and_lines() -> Tuple[List[str], pd.DataFrame, pd.DataFrame]:
-    """Carga las plantillas manuales de Excel."""
-    logging.info("Cargando plantillas manuales. Asegúrese que los encabezados son: 'codigo', 'nombre', 'linea', 'orden', 'u_por_caja'")
+def _cell_to_str(value) -> Optional[str]:
+    """Convierte una celda de texto como lo haría read_excel(dtype=str); None si está vacía."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            value = int(value)
+    return str(value).strip()
+
+def _cell_to_number(value) -> float:
+    """Convierte una celda numérica durante la lectura (como to_numeric(errors='coerce').fillna(0))."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 0.0 if isinstance(value, float) and math.isnan(value) else float(value)
+    if isinstance(value, str):
+        try:
+            number = float(value.strip())
+            return 0.0 if math.isnan(number) else number
+        except ValueError:
+            return 0.0
+    return 0.0
+
+def _iter_sheet_rows(content: bytes, first_row: int = 0, max_col: Optional[int] = None,
+                     max_row: Optional[int] = None) -> Iterator[tuple]:
+    """
+    Recorre las filas de la primera hoja desde `first_row` hasta `max_row` (base 0, exclusivo)
+    de a una, cortadas en `max_col`. Usa python-calamine si está instalado; si no, openpyxl en
+    modo read_only (xlsx) o xlrd (xls; xlrd carga la hoja entera, no tiene lectura por filas).
+    """
     try:
-        required_files = [
-            (settings.INPUT_LINES_TO_PROCESS_EXCEL, "Archivo de líneas a procesar"),
-            (settings.INPUT_GENERALES_EXCEL, "Catálogo de códigos generales"),
-            (settings.INPUT_ESPECIALES_EXCEL, "Catálogo de códigos especiales")
-        ]
-        for filepath, description in required_files:
-            if not validate_file_exists(filepath, description):
-                return [], pd.DataFrame(), pd.DataFrame()
-
-        df_lineas = pd.read_excel(settings.INPUT_LINES_TO_PROCESS_EXCEL)
-        df_lineas.rename(columns=settings.MANUAL_COLS_MAP, inplace=True)
-        lineas = df_lineas["linea"].astype(str).str.strip().tolist()
-        if 'ESPECIALES' in lineas:
-            lineas.remove('ESPECIALES')
-
-        df_generales = pd.read_excel(settings.INPUT_GENERALES_EXCEL, dtype={'codigo': str})
-        df_generales.rename(columns=settings.MANUAL_COLS_MAP, inplace=True)
-        
-        df_especiales = pd.read_excel(settings.INPUT_ESPECIALES_EXCEL, dtype={'codigo': str})
-        df_especiales.rename(columns=settings.MANUAL_COLS_MAP, inplace=True)
-
-        logging.info(f"Cargadas {len(lineas)} líneas a procesar.")
-        logging.info(f"Catálogo generales: {len(df_generales)} códigos.")
-        logging.info(f"Catálogo especiales: {len(df_especiales)} códigos.")
-
-        return lineas, df_generales, df_especiales
+        from python_calamine import CalamineWorkbook
+    except ImportError:
+        CalamineWorkbook = None
+
+    if CalamineWorkbook is not None:
+        # iter_rows() conserva las filas vacías iniciales pero empieza en la primera columna con
+        # datos: se antepone ese desplazamiento para mantener las posiciones fijas (como pandas)
+        sheet = CalamineWorkbook.from_filelike(BytesIO(content)).get_sheet_by_index(0)
+        pad = (None,) * (sheet.start[1] if sheet.start else 0)
+        for row in itertools.islice(sheet.iter_rows(), first_row, max_row):
+            yield (pad + tuple(row))[:max_col]
+    elif content[:2] == b'PK':  # xlsx (zip)
+        from openpyxl import load_workbook
+        workbook = load_workbook(BytesIO(content), read_only=True, data_only=True)
+        try:
+            worksheet = workbook.worksheets[0]
+            yield from worksheet.iter_rows(min_row=first_row + 1, max_row=max_row, max_col=max_col, values_only=True)
+        finally:
+            workbook.close()
+    else:  # xls (BIFF)
+        import xlrd
+        workbook = xlrd.open_workbook(file_contents=content, on_demand=True)
+        try:
+            sheet = workbook.sheet_by_index(0)
+            for i in range(first_row, min(max_row, sheet.nrows) if max_row else sheet.nrows):
+                yield tuple(sheet.row_values(i, 0, min(max_col, sheet.ncols) if max_col else None))
+        finally:
+            workbook.release_resources()
+
+def _normalize_header(value) -> str:
+    """Texto de encabezado comparable: mayúsculas, sin tildes y con espacios simples."""
+    if value is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(text.upper().replace('_', ' ').replace('.', ' ').split())
+
+def _header_aliases() -> Dict[str, set]:
+    aliases = {field: {_normalize_header(name)} for name, field in settings.REPT_STOCK_COLS_MAP.items()}
+    for field, extra in settings.REPT_STOCK_HEADER_ALIASES.items():
+        aliases.setdefault(field, set()).update(_normalize_header(name) for name in extra)
+    return aliases
+
+def _header_signature(row) -> str:
+    return hashlib.sha1('|'.join(_normalize_header(v) for v in row).encode('utf-8')).hexdigest()
+
+def detect_rept_stock_layout(probe_rows: List[tuple]) -> Optional[Tuple[int, Dict[str, int]]]:
+    """
+    Busca en las primeras filas la fila de encabezados y la posición de cada columna
+    de REPT_STOCK_COLS_MAP por nombre. Retorna (fila_encabezado, posiciones) o None.
+    """
+    aliases = _header_aliases()
+    required = [field for field in aliases if field != 'nombre_articulo']
+    for row_idx, row in enumerate(probe_rows):
+        normalized = [_normalize_header(v) for v in row]
+        positions = {}
+        for field, names in aliases.items():
+            col = next((i for i, text in enumerate(normalized) if text in names), None)
+            if col is not None:
+                positions[field] = col
+        if all(field in positions for field in required):
+            return row_idx, positions
+    return None
+
+def _load_layout_cache() -> Dict[str, Dict]:
+    if not os.path.exists(settings.REPT_STOCK_LAYOUT_CACHE_FILE):
+        return {}
+    try:
+        with open(settings.REPT_STOCK_LAYOUT_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except Exception as e:
-        logging.error(f"Error cargando catálogos y líneas: {e}")
-        return [], pd.DataFrame(), pd.DataFrame()
+        logging.warning(f"Caché de formato de REPT_STOCK ilegible, se volverá a detectar: {e}")
+        return {}
 
-def load_base_total() -> Optional[pd.DataFrame]:
-    """Carga el archivo base_total.xls del ERP."""
-    if not validate_file_exists(settings.INPUT_BASE_TOTAL, "Base total"):
-        return None
+def _save_layout_cache(cache: Dict[str, Dict]):
     try:
-        df_base = pd.read_excel(settings.INPUT_BASE_TOTAL, engine='xlrd', dtype={'codigo': str})
-        df_base.columns = df_base.columns.str.strip()
-        
-        cols_to_drop = ['FLG_INACTIVO', 'FLG_DESCONTINUADO']
-        df_base.drop(columns=cols_to_drop, inplace=True, errors='ignore')
-
-        df_base.rename(columns=settings.BASE_TOTAL_COLS_MAP, inplace=True)
-
-        required_columns = ['codigo', 'nombre', 'linea']
-        if not all(col in df_base.columns for col in required_columns):
-            logging.error(f"Columnas requeridas {required_columns} faltantes en base_total.")
-            return None
-
-        df_base['codigo'] = df_base['codigo'].astype(str).str.strip()
-        # Remove all spaces
-        df_base['codigo'] = df_base['codigo'].str.replace(' ', '', regex=False)
-        df_base['linea'] = df_base['linea'].astype(str).str.strip()
-
-        for col in ['ean', 'ean_14']:
-            if col in df_base.columns:
-                df_base[col] = df_base[col].fillna('').astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-                # Remove all spaces
-                df_base[col] = df_base[col].str.replace(' ', '', regex=False)
-
-        logging.info(f"Base total procesada: {len(df_base)} productos.")
-        return df_base
+        with open(settings.REPT_STOCK_LAYOUT_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=4)
     except Exception as e:
-        logging.error(f"Error procesando base_total.xls: {e}")
-        return None
-
-
-
-import os
-import pandas as pd
-import logging
-import requests
-from io import BytesIO
-import json
-from typing import List, Optional, Tuple, Dict
-from datetime import datetime # Added datetime import
-
-from config import settings
+        logging.warning(f"No se pudo guardar la caché de formato de REPT_STOCK: {e}")
 
-def validate_file_exists(filepath: str, description: str) -> bool:
-    """Verifica si un archivo existe y loguea el resultado."""
-    if not os.path.exists(filepath):
-        logging.error(f"{description} no encontrado: {filepath}")
-        return False
-    logging.info(f"{description} encontrado: {filepath}")
-    return True
-
-def download_and_parse_rept_stock() -> Optional[pd.DataFrame]:
-    """Descarga y procesa el reporte de stock desde la API."""
-    logging.info("Descargando REPT_STOCK...")
+def resolve_rept_stock_layout(probe_rows: List[tuple]) -> Tuple[int, Dict[str, int]]:
+    """
+    Determina la fila de encabezados y las posiciones de columnas de REPT_STOCK.
+    Primero prueba los formatos ya conocidos (firma = hash de la fila de encabezados en la
+    posición guardada); si ninguno coincide, detecta el formato por nombres y lo guarda.
+    Si tampoco se detecta, usa las posiciones fijas de settings.
+    """
+    cache = _load_layout_cache()
+    for signature, layout in sorted(cache.items(), key=lambda item: item[1].get('ultimo_uso', ''), reverse=True):
+        header_row = layout['header_row']
+        if header_row < len(probe_rows) and _header_signature(probe_rows[header_row]) == signature:
+            layout['ultimo_uso'] = datetime.now().isoformat(timespec='seconds')
+            _save_layout_cache(cache)
+            logging.info(f"Formato de REPT_STOCK reconocido desde caché (encabezado en fila {header_row + 1}).")
+            return header_row, layout['positions']
+
+    detected = detect_rept_stock_layout(probe_rows)
+    if detected is None:
+        logging.warning("No se pudo detectar la fila de encabezados de REPT_STOCK por nombre; "
+                        "se usan las posiciones fijas de configuración. Revise el formato del reporte.")
+        return settings.REPT_STOCK_HEADER_ROW, settings.REPT_STOCK_COLUMN_POSITIONS
+
+    header_row, positions = detected
+    cache[_header_signature(probe_rows[header_row])] = {
+        'header_row': header_row,
+        'positions': positions,
+        'ultimo_uso': datetime.now().isoformat(timespec='seconds')
+    }
+    _save_layout_cache(cache)
+    if header_row != settings.REPT_STOCK_HEADER_ROW or any(
+            settings.REPT_STOCK_COLUMN_POSITIONS.get(field) != col for field, col in positions.items()):
+        logging.warning(f"Nuevo formato de REPT_STOCK detectado: encabezado en fila {header_row + 1}, columnas {positions}.")
+    else:
+        logging.info(f"Formato de REPT_STOCK detectado: encabezado en fila {header_row + 1}.")
+    return header_row, positions
+
+def parse_rept_stock(content: bytes) -> Optional[pd.DataFrame]:
+    """
+    Procesa el libro REPT_STOCK leyendo fila a fila sólo las columnas necesarias
+    (código, almacén y las tres cantidades), convirtiendo los números durante la lectura.
+    La memoria pico depende de esas columnas y no del ancho del reporte del ERP.
+    """
     try:
-        response = requests.get(settings.STOCK_API_URL, timeout=120)
-        response.raise_for_status()
-        with BytesIO(response.content) as f:
-            df_raw = pd.read_excel(f, skiprows=10, dtype=str)
-
-        df = df_raw.iloc[:, [1, 2, 9, 13, 16, 18]].copy()
-        df.columns = ["ARTÍCULO", "NOMBRE_ARTICULO", "ALMACEN", "STOCK TOTAL", "PREDESPACHO", "DISPONIBLE"]
-        df.rename(columns=settings.REPT_STOCK_COLS_MAP, inplace=True)
-        
-        df.dropna(subset=["codigo", "almacen"], inplace=True)
-        df["codigo"] = df["codigo"].astype(str).str.strip()
+        # Sondeo barato de las primeras filas (ancho completo) para ubicar encabezado y columnas;
+        # después se leen sólo las filas de datos hasta la última columna necesaria
+        probe_rows = list(_iter_sheet_rows(content, max_row=settings.REPT_STOCK_HEADER_SCAN_ROWS))
+        header_row, positions = resolve_rept_stock_layout(probe_rows)
 
         numeric_cols = ["stock_total", "predespacho", "disponible"]
-        for col in numeric_cols:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+        max_col = max(positions[col] for col in ["codigo", "almacen"] + numeric_cols) + 1
+        rows = _iter_sheet_rows(content, first_row=header_row + 1, max_col=max_col)
+
+        almacenes_permitidos = set(settings.ALMACENES) if settings.ALMACENES else None
+        codigos, almacenes = [], []
+        numeric_values = {col: array('d') for col in numeric_cols}
+        for row in rows:
+            if len(row) < max_col:
+                row = tuple(row) + (None,) * (max_col - len(row))
+            codigo = _cell_to_str(row[positions["codigo"]])
+            almacen = _cell_to_str(row[positions["almacen"]])
+            if codigo is None or almacen is None:
+                continue
+            if almacenes_permitidos is not None and almacen not in almacenes_permitidos:
+                continue
+            codigos.append(codigo)
+            almacenes.append(almacen)
+            for col in numeric_cols:
+                numeric_values[col].append(_cell_to_number(row[positions[col]]))
+
+        df = pd.DataFrame({
+            "codigo": codigos,
+            "almacen": pd.Categorical(almacenes),
+            **{col: np.frombuffer(values, dtype=np.float64) if len(values) else np.zeros(0) for col, values in numeric_values.items()}
+        })
+        del codigos, almacenes, numeric_values
 
         df_pivot = df.pivot_table(
             index="codigo",
             columns="almacen",
             values=numeric_cols,
             aggfunc="first",
-            fill_value=0
+            fill_value=0,
+            observed=True
         )
         df_pivot.columns = [f"{alm}_{tipo.replace(' ', '_')}" for tipo, alm in df_pivot.columns]
         df_pivot.reset_index(inplace=True)
-        df_pivot['codigo'] = df_pivot['codigo'].astype(str).str.strip() # Ensure codigo remains string after pivot
-        # Remove all spaces
-        df_pivot['codigo'] = df_pivot['codigo'].str.replace(' ', '', regex=False)
+        df_pivot['codigo'] = normalize_codes(df_pivot['codigo'], source='REPT_STOCK codigo')
 
         ves_disponible_col = next((col for col in df_pivot.columns if 'VES' in col.upper() and 'disponible' in col.lower()), None)
         if ves_disponible_col:
@@ -191,11 +235,18 @@ def download_and_parse_rept_stock() -> Optional[pd.DataFrame]:
             df_pivot[settings.STANDARD_COLUMN_NAMES['stock_referencial']] = 0
             logging.warning("No se encontró columna con stock de VES, usando 0 como stock referencial")
 
-        logging.info(f"REPT_STOCK procesado: {len(df_pivot)} productos.")
+        logging.info(f"REPT_STOCK procesado: {len(df)} filas, {len(df_pivot)} productos.")
         return df_pivot
     except Exception as e:
-        logging.error(f"Error descargando REPT_STOCK: {e}")
+        logging.error(f"Error procesando REPT_STOCK: {e}")
+        return None
+
+def download_and_parse_rept_stock() -> Optional[pd.DataFrame]:
+    """Descarga y procesa el reporte de stock desde la API."""
+    content = download_rept_stock()
+    if content is None:
         return None
+    return parse_rept_stock(content)
 
 def load_catalogs_and_lines() -> Tuple[List[str], pd.DataFrame, pd.DataFrame]:
     """Carga las plantillas manuales de Excel."""
@@ -218,9 +269,11 @@ def load_catalogs_and_lines() -> Tuple[List[str], pd.DataFrame, pd.DataFrame]:
 
         df_generales = pd.read_excel(settings.INPUT_GENERALES_EXCEL, dtype={'codigo': str})
         df_generales.rename(columns=settings.MANUAL_COLS_MAP, inplace=True)
+        df_generales['codigo'] = normalize_codes(df_generales['codigo'], source='codigos_generales codigo')
         
         df_especiales = pd.read_excel(settings.INPUT_ESPECIALES_EXCEL, dtype={'codigo': str})
         df_especiales.rename(columns=settings.MANUAL_COLS_MAP, inplace=True)
+        df_especiales['codigo'] = normalize_codes(df_especiales['codigo'], source='codigos_especiales codigo')
 
         logging.info(f"Cargadas {len(lineas)} líneas a procesar.")
         logging.info(f"Catálogo generales: {len(df_generales)} códigos.")
@@ -249,16 +302,12 @@ def load_base_total() -> Optional[pd.DataFrame]:
             logging.error(f"Columnas requeridas {required_columns} faltantes en base_total.")
             return None
 
-        df_base['codigo'] = df_base['codigo'].astype(str).str.strip()
-        # Remove all spaces
-        df_base['codigo'] = df_base['codigo'].str.replace(' ', '', regex=False)
+        df_base['codigo'] = normalize_codes(df_base['codigo'], source='base_total codigo')
         df_base['linea'] = df_base['linea'].astype(str).str.strip()
 
         for col in ['ean', 'ean_14']:
             if col in df_base.columns:
-                df_base[col] = df_base[col].fillna('').astype(str).str.replace(r'\.0', '', regex=True).str.strip()
-                # Remove all spaces
-                df_base[col] = df_base[col].str.replace(' ', '', regex=False)
+                df_base[col] = normalize_eans(df_base[col], source=f'base_total {col}')
 
         logging.info(f"Base total procesada: {len(df_base)} productos.")
         return df_base
@@ -269,11 +318,8 @@ def load_base_total() -> Optional[pd.DataFrame]:
 
 
 def merge_catalogs(df_generales: pd.DataFrame, df_especiales: pd.DataFrame) -> pd.DataFrame:
-    """Fusiona los catálogos de códigos generales y especiales."""
+    """Fusiona los catálogos de códigos generales y especiales (códigos ya normalizados al cargarlos)."""
     try:
-        df_generales['codigo'] = df_generales['codigo'].astype(str).str.strip()
-        df_especiales['codigo'] = df_especiales['codigo'].astype(str).str.strip()
-
         catalogo_df = pd.concat([df_generales, df_especiales], ignore_index=True, sort=False)
         catalogo_df = catalogo_df.fillna('')
 
@@ -293,30 +339,54 @@ def merge_catalogs(df_generales: pd.DataFrame, df_especiales: pd.DataFrame) -> p
         logging.error(f"Error fusionando catálogos: {e}")
         return pd.DataFrame({'codigo': [], 'u_por_caja': [], 'orden': []})
 
-def load_previous_stock() -> Optional[Dict[str, int]]:
+def load_consolidated_stock() -> Optional[pd.DataFrame]:
     """
-    Carga el stock de productos de la ejecución anterior desde un archivo JSON.
-    Retorna un diccionario de codigo -> stock_anterior.
+    Lee el último consolidado guardado (data_stock_completo.parquet). Si sólo existe la versión
+    Excel de ejecuciones anteriores, la usa como respaldo.
     """
-    if not os.path.exists(settings.PREVIOUS_STOCK_FILE):
-        logging.info(f"No se encontró el archivo de stock anterior: {settings.PREVIOUS_STOCK_FILE}. Se asume primera ejecución o archivo no disponible.")
-        return {}
     try:
-        with open(settings.PREVIOUS_STOCK_FILE, 'r', encoding='utf-8') as f:
-            previous_stock_data = json.load(f)
-        logging.info(f"Stock anterior cargado desde {settings.PREVIOUS_STOCK_FILE} con {len(previous_stock_data)} productos.")
-        return previous_stock_data
+        if os.path.exists(settings.DATA_STOCK_COMPLETO_PARQUET):
+            df = pd.read_parquet(settings.DATA_STOCK_COMPLETO_PARQUET)
+        elif validate_file_exists(settings.DATA_STOCK_COMPLETO_FILE, "Consolidado de stock (Excel)"):
+            logging.warning(f"No existe {settings.DATA_STOCK_COMPLETO_PARQUET}; se lee la versión Excel.")
+            df = pd.read_excel(settings.DATA_STOCK_COMPLETO_FILE, dtype={'codigo': str, 'ean': str, 'ean_14': str})
+        else:
+            return None
+        logging.info(f"Consolidado cargado: {len(df)} códigos.")
+        return df
     except Exception as e:
-        logging.error(f"Error al cargar el stock anterior desde {settings.PREVIOUS_STOCK_FILE}: {e}")
+        logging.error(f"Error cargando el consolidado de stock: {e}")
+        return None
+
+def load_previous_stock() -> Optional[Dict[str, int]]:
+    """
+    Carga el stock de productos de la ejecución anterior desde el artefacto binario
+    de REPT_STOCK que deja stock_diff.track_stock_movements.
+    Retorna un diccionario de codigo -> stock_anterior.
+    """
+    from stock_diff import load_stock_artifact, referencial_from_artifact
+
+    artifact = load_stock_artifact()
+    if artifact is None:
+        logging.info(f"No se encontró el stock anterior: {settings.REPT_STOCK_ARTIFACT_FILE}. Se asume primera ejecución o archivo no disponible.")
         return {}
+    previous_stock_data = referencial_from_artifact(artifact)
+    logging.info(f"Stock anterior ({artifact.timestamp}) cargado desde {settings.REPT_STOCK_ARTIFACT_FILE} con {len(previous_stock_data)} productos.")
+    return previous_stock_data
 
 def load_historical_stock_snapshot(date: datetime) -> Optional[Dict[str, int]]:
     """
     Carga un snapshot de stock histórico para una fecha específica.
     Retorna un diccionario de codigo -> stock_referencial para esa fecha.
+    Si el día ya fue compactado por la política de retención, retorna el cierre de su periodo.
     """
     snapshot_filename = os.path.join(settings.HISTORICOS_DIR, f"stock_snapshot_{date.strftime('%Y-%m-%d')}.json")
     if not os.path.exists(snapshot_filename):
+        from snapshot_retention import load_compacted_snapshot
+        compacted = load_compacted_snapshot(date.date() if isinstance(date, datetime) else date)
+        if compacted is not None:
+            logging.info(f"Snapshot histórico del {date.strftime('%Y-%m-%d')} leído desde el histórico compactado ({len(compacted)} productos).")
+            return compacted
         logging.warning(f"No se encontró el snapshot histórico para la fecha {date.strftime('%Y-%m-%d')}: {snapshot_filename}")
         return {}
     try:
@@ -327,4 +397,3 @@ def load_historical_stock_snapshot(date: datetime) -> Optional[Dict[str, int]]:
     except Exception as e:
         logging.error(f"Error al cargar el snapshot histórico desde {snapshot_filename}: {e}")
         return {}
-
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from config import settings
+
+# Sincronización de stock_generales con un almacén de documentos (Firestore por defecto).
+# Sólo se envían los productos cuyo contenido cambió desde la última sincronización exitosa
+# (hash por documento en DOC_SYNC_STATE_FILE) y los que dejaron de existir se eliminan.
+# Las escrituras van en lotes de DOC_SYNC_BATCH_SIZE (máx. 500 por commit en Firestore), varios
+# lotes en paralelo y con reintentos. El id de cada documento se deriva del código, así repetir
+# un lote es idempotente.
+
+Write = Tuple[str, Optional[Dict]]  # (id de documento, datos) ; datos None = eliminar
+
+
+class DocumentStoreBackend(ABC):
+    """Interfaz mínima del almacén: confirmar un lote de escrituras de forma atómica."""
+
+    @abstractmethod
+    def commit_batch(self, collection: str, writes: List[Write]):
+        """Aplica todas las escrituras del lote o ninguna."""
+
+
+class InMemoryDocumentStore(DocumentStoreBackend):
+    """Almacén en memoria para pruebas locales; `fail_commits` simula errores transitorios."""
+
+    def __init__(self, fail_commits: int = 0):
+        self.collections: Dict[str, Dict[str, Dict]] = {}
+        self.commits = 0
+        self.fail_commits = fail_commits
+        self._lock = threading.Lock()
+
+    def commit_batch(self, collection: str, writes: List[Write]):
+        with self._lock:
+            if self.fail_commits > 0:
+                self.fail_commits -= 1
+                raise ConnectionError("Error simulado del almacén en memoria")
+            docs = self.collections.setdefault(collection, {})
+            for doc_id, data in writes:
+                if data is None:
+                    docs.pop(doc_id, None)
+                else:
+                    docs[doc_id] = data
+            self.commits += 1
+
+
+class FirestoreBackend(DocumentStoreBackend):
+    """Firestore mediante escrituras por lote (google-cloud-firestore se importa al usarlo)."""
+
+    def __init__(self):
+        from google.cloud import firestore
+        if settings.FIRESTORE_CREDENTIALS_PATH:
+            self.client = firestore.Client.from_service_account_json(
+                settings.FIRESTORE_CREDENTIALS_PATH, project=settings.FIRESTORE_PROJECT)
+        else:
+            self.client = firestore.Client(project=settings.FIRESTORE_PROJECT)
+
+    def commit_batch(self, collection: str, writes: List[Write]):
+        batch = self.client.batch()
+        col = self.client.collection(collection)
+        for doc_id, data in writes:
+            if data is None:
+                batch.delete(col.document(doc_id))
+            else:
+                batch.set(col.document(doc_id), data)
+        batch.commit()
+
+
+BACKENDS = {
+    'firestore': FirestoreBackend,
+    'memoria': InMemoryDocumentStore,
+}
+
+
+def document_id(codigo: str) -> str:
+    """Id estable y válido para Firestore a partir del código (sin '/', ni '.'/'..')."""
+    doc_id = quote(str(codigo), safe='')
+    return doc_id if doc_id not in ('', '.', '..') else f"codigo_{doc_id.replace('.', '%2E')}"
+
+
+def _document_hash(data: Dict) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False,
+                                     separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def _load_state() -> Dict[str, Dict[str, str]]:
+    if not os.path.exists(settings.DOC_SYNC_STATE_FILE):
+        return {}
+    try:
+        with open(settings.DOC_SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logging.warning(f"Estado de sincronización ilegible, se enviarán todos los documentos: {e}")
+        return {}
+
+
+def _save_state(state: Dict[str, Dict[str, str]]):
+    tmp_path = settings.DOC_SYNC_STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, settings.DOC_SYNC_STATE_FILE)
+
+
+def _commit_with_retries(backend: DocumentStoreBackend, collection: str, writes: List[Write]):
+    for attempt in range(settings.DOC_SYNC_MAX_RETRIES + 1):
+        try:
+            backend.commit_batch(collection, writes)
+            return
+        except Exception as e:
+            if attempt == settings.DOC_SYNC_MAX_RETRIES:
+                raise
+            delay = settings.DOC_SYNC_RETRY_BASE_SECONDS * (2 ** attempt)
+            logging.warning(f"Lote de {len(writes)} documentos falló ({e}); reintento {attempt + 1} en {delay:.1f} s.")
+            time.sleep(delay)
+
+
+def sync_documents(items: List[Dict], backend: Optional[DocumentStoreBackend] = None,
+                   collection: Optional[str] = None) -> Optional[Dict[str, int]]:
+    """
+    Envía al almacén los productos nuevos o modificados y elimina los que ya no están.
+    El estado local sólo registra los lotes confirmados: lo que falle se reintenta en la
+    próxima ejecución.
+    """
+    collection = collection or settings.DOC_SYNC_COLLECTION
+    try:
+        backend = backend or BACKENDS[settings.DOC_SYNC_BACKEND]()
+        state = _load_state()
+        previous = state.get(collection, {})
+
+        current = {}
+        documents = {}
+        for item in items:
+            doc_id = document_id(item['codigo'])
+            current[doc_id] = _document_hash(item)
+            documents[doc_id] = item
+        writes: List[Write] = [(doc_id, documents[doc_id]) for doc_id, digest in current.items()
+                               if previous.get(doc_id) != digest]
+        writes += [(doc_id, None) for doc_id in previous if doc_id not in current]
+        if not writes:
+            logging.info(f"Sincronización '{collection}': sin cambios ({len(current)} documentos).")
+            return {'enviados': 0, 'eliminados': 0, 'lotes': 0, 'fallidos': 0}
+
+        batch_size = settings.DOC_SYNC_BATCH_SIZE
+        batches = [writes[i:i + batch_size] for i in range(0, len(writes), batch_size)]
+        synced = dict(previous)
+        failed = 0
+        with ThreadPoolExecutor(max_workers=settings.DOC_SYNC_MAX_WORKERS, thread_name_prefix='doc-sync') as pool:
+            futures = {pool.submit(_commit_with_retries, backend, collection, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"Lote de {len(batch)} documentos no sincronizado tras reintentos: {e}")
+                    continue
+                for doc_id, data in batch:
+                    if data is None:
+                        synced.pop(doc_id, None)
+                    else:
+                        synced[doc_id] = current[doc_id]
+
+        state[collection] = synced
+        _save_state(state)
+        eliminados = sum(1 for _, data in writes if data is None)
+        result = {'enviados': len(writes) - eliminados, 'eliminados': eliminados, 'lotes': len(batches), 'fallidos': failed}
+        logging.info(f"Sincronización '{collection}': {result}")
+        return result
+    except Exception as e:
+        logging.error(f"Error sincronizando documentos con el almacén: {e}")
+        return None
+
+
+def sync_stock_generales(backend: Optional[DocumentStoreBackend] = None) -> Optional[Dict[str, int]]:
+    """Sincroniza el último stock_generales.json publicado."""
+    from publish import published_path
+    path = published_path(settings.STOCK_GENERALES_FILE)
+    if not os.path.exists(path):
+        logging.warning(f"No existe {path}; no hay nada que sincronizar.")
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        items = json.load(f)
+    return sync_documents(items, backend)
@@ -0,0 +1,161 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import settings
+
+PARTITION_BASE_COLUMNS = ['codigo', 'linea', 'stock_referencial']
+WAREHOUSE_SUFFIXES = ('_stock_total', '_predespacho', '_disponible')
+SERIES_NUMERIC_COLUMNS = ('stock_referencial',)
+
+
+def is_series_column(column: str) -> bool:
+    """Columnas numéricas de la partición que pueden pedirse como serie temporal."""
+    return column in SERIES_NUMERIC_COLUMNS or column.endswith(WAREHOUSE_SUFFIXES)
+
+
+def partition_relative_path(date: datetime) -> str:
+    """Ruta relativa de la partición de un día: date=YYYY-MM-DD/stock.parquet"""
+    return f"date={date.strftime('%Y-%m-%d')}/{settings.HISTORICO_PARTITION_FILENAME}"
+
+
+def partition_blob_name(date: datetime) -> str:
+    return settings.STORAGE_HISTORY_PREFIX + partition_relative_path(date)
+
+
+def write_daily_partition(df_consolidado: pd.DataFrame, snapshot_date: Optional[datetime] = None) -> Optional[str]:
+    """
+    Escribe el stock consolidado del día como Parquet en HISTORICOS_PARTICIONES_DIR.
+    Las filas se ordenan por código para que las estadísticas de cada row group
+    permitan descartar bloques completos al filtrar por un código.
+    """
+    snapshot_date = snapshot_date or datetime.now()
+    try:
+        warehouse_cols = sorted(col for col in df_consolidado.columns if col.endswith(WAREHOUSE_SUFFIXES))
+        cols = [col for col in PARTITION_BASE_COLUMNS if col in df_consolidado.columns] + warehouse_cols
+        df_partition = df_consolidado[cols].copy()
+        df_partition['codigo'] = df_partition['codigo'].astype(str)
+        if 'linea' in df_partition.columns:
+            df_partition['linea'] = df_partition['linea'].astype(str)
+        df_partition.sort_values('codigo', inplace=True)
+
+        output_path = os.path.join(settings.HISTORICOS_PARTICIONES_DIR, partition_relative_path(snapshot_date))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        table = pa.Table.from_pandas(df_partition, preserve_index=False)
+        pq.write_table(
+            table,
+            output_path,
+            compression='zstd',
+            row_group_size=settings.HISTORICO_PARTITION_ROW_GROUP_SIZE,
+            write_statistics=True
+        )
+        logging.info(f"Partición histórica escrita en {output_path} ({len(df_partition)} productos, {len(cols)} columnas)")
+        return output_path
+    except Exception as e:
+        logging.error(f"Error escribiendo la partición histórica del {snapshot_date.strftime('%Y-%m-%d')}: {e}")
+        return None
+
+
+def publish_daily_partition(df_consolidado: pd.DataFrame, storage_manager=None, snapshot_date: Optional[datetime] = None) -> Optional[str]:
+    """
+    Escribe la partición del día y la sube al bucket como historicos/date=YYYY-MM-DD/stock.parquet.
+    Si no hay bucket configurado sólo se conserva la copia local.
+    """
+    snapshot_date = snapshot_date or datetime.now()
+    local_path = write_daily_partition(df_consolidado, snapshot_date)
+    if local_path is None:
+        return None
+    if not settings.STORAGE_BUCKET_NAME:
+        logging.info("STORAGE_BUCKET_NAME no configurado: la partición histórica sólo se guarda localmente.")
+        return None
+
+    if storage_manager is None:
+        from storage_manager import CloudStorageManager
+        storage_manager = CloudStorageManager()
+    blob_name = partition_blob_name(snapshot_date)
+    result = storage_manager.upload_file(local_path, blob_name, make_public=False)
+    if result is None:
+        logging.error(f"No se pudo publicar la partición histórica {blob_name}")
+        return None
+    logging.info(f"Partición histórica publicada como {blob_name}")
+    return blob_name
+
+
+def _date_from_partition_name(blob_name: str) -> Optional[datetime]:
+    try:
+        date_part = next(part for part in blob_name.split('/') if part.startswith('date='))
+        return datetime.strptime(date_part[len('date='):], '%Y-%m-%d')
+    except (StopIteration, ValueError):
+        return None
+
+
+def _read_partition_rows(storage_manager, blob_name: str, codigo: str, columns: List[str]) -> Optional[pd.DataFrame]:
+    reader = storage_manager.open_blob(blob_name)
+    if reader is None:
+        return None
+    try:
+        with reader:
+            parquet_file = pq.ParquetFile(reader)
+            available = set(parquet_file.schema_arrow.names)
+            read_cols = ['codigo'] + [col for col in columns if col in available and col != 'codigo']
+            # Recorrer sólo los row groups cuyo rango [min, max] de código contiene el buscado
+            codigo_idx = parquet_file.schema_arrow.get_field_index('codigo')
+            matching_groups = []
+            for rg in range(parquet_file.metadata.num_row_groups):
+                stats = parquet_file.metadata.row_group(rg).column(codigo_idx).statistics
+                if stats is None or not stats.has_min_max or stats.min <= codigo <= stats.max:
+                    matching_groups.append(rg)
+            if not matching_groups:
+                return pd.DataFrame(columns=read_cols)
+            table = parquet_file.read_row_groups(matching_groups, columns=read_cols)
+            df = table.to_pandas()
+            return df[df['codigo'] == codigo]
+    except Exception as e:
+        logging.warning(f"No se pudo leer la partición {blob_name}: {e}")
+        return None
+
+
+def read_codigo_time_series(storage_manager, codigo: str, start: datetime, end: datetime,
+                            columns: List[str]) -> Optional[List[Dict]]:
+    """
+    Devuelve la serie temporal de un código entre dos fechas (inclusive).
+    Sólo se listan las particiones del rango y de cada una se leen las columnas pedidas
+    de los row groups que pueden contener el código. None si el bucket no está disponible.
+    """
+    from storage_manager import StorageUnavailableError
+    prefix = settings.STORAGE_HISTORY_PREFIX + 'date='
+    start_offset = partition_blob_name(start).rsplit('/', 1)[0]
+    end_offset = partition_blob_name(end + timedelta(days=1)).rsplit('/', 1)[0]
+    try:
+        blob_names = [
+            f["name"] for f in storage_manager.iter_files(prefix=prefix, start_offset=start_offset, end_offset=end_offset)
+            if f["name"].endswith('/' + settings.HISTORICO_PARTITION_FILENAME)
+        ]
+    except StorageUnavailableError as e:
+        logging.error(f"No se pudo listar las particiones históricas: {e}")
+        return None
+    if not blob_names:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(8, len(blob_names))) as executor:
+        frames = list(executor.map(lambda name: _read_partition_rows(storage_manager, name, codigo, columns), blob_names))
+
+    series = []
+    for blob_name, df in zip(blob_names, frames):
+        snapshot_date = _date_from_partition_name(blob_name)
+        if df is None or df.empty or snapshot_date is None:
+            continue
+        row = df.iloc[0]
+        point = {'date': snapshot_date.strftime('%Y-%m-%d')}
+        for col in columns:
+            value = pd.to_numeric(row[col], errors='coerce') if col in df.columns else None
+            point[col] = int(value) if value is not None and pd.notna(value) else None
+        series.append(point)
+    series.sort(key=lambda p: p['date'])
+    return series
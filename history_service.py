@@ -0,0 +1,215 @@
+import os
+import glob
+import json
+import logging
+from datetime import datetime, date, timedelta
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+from normalize import normalize_codes
+
+SNAPSHOT_PREFIX = "stock_snapshot_"
+
+
+def _snapshot_date_from_path(file_path: str) -> Optional[date]:
+    name = os.path.basename(file_path)
+    try:
+        return datetime.strptime(name[len(SNAPSHOT_PREFIX):len(SNAPSHOT_PREFIX) + 10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+class StockHistory:
+    """
+    Histórico de stock_referencial como matriz códigos x días (calendario continuo).
+    Los días sin snapshot quedan como NaN, de modo que un desfase de N días es siempre
+    un desplazamiento de N columnas y todos los cálculos se hacen sobre la matriz completa.
+    """
+
+    def __init__(self, codigos: Iterable[str], start_date: date, valores: np.ndarray):
+        self.codigos = pd.Index(codigos, dtype=object)
+        self.start_date = start_date
+        self.valores = valores  # float64, shape (n_codigos, n_dias)
+
+    # --- Construcción ---
+    @classmethod
+    def load(cls, window_days: Optional[int] = None, end_date: Optional[date] = None) -> 'StockHistory':
+        """Carga una sola vez los snapshots diarios de la ventana [end_date - window_days, end_date]."""
+        window_days = window_days or settings.HISTORICO_VENTANA_DIAS
+        end_date = end_date or datetime.now().date()
+        start_date = end_date - timedelta(days=window_days)
+
+        per_day = []
+        for file_path in sorted(glob.glob(os.path.join(settings.HISTORICOS_DIR, f"{SNAPSHOT_PREFIX}*.json"))):
+            snapshot_date = _snapshot_date_from_path(file_path)
+            if snapshot_date is None or not (start_date <= snapshot_date <= end_date):
+                continue
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                codigos = normalize_codes(pd.Series(list(data.keys()), dtype=object), source=None).to_numpy(dtype=object)
+                valores = np.fromiter((float(v) for v in data.values()), dtype=np.float64, count=len(data))
+                per_day.append((snapshot_date, codigos, valores))
+            except Exception as e:
+                logging.warning(f"Error al cargar el snapshot {file_path}: {e}")
+
+        # Días ya compactados por la política de retención: el cierre (last) de cada periodo
+        # se ubica en su fecha final, que es el valor real del último snapshot del periodo.
+        from snapshot_retention import iter_compacted_periods, read_compacted
+        for path, _, fecha_fin in iter_compacted_periods(start_date, end_date):
+            if fecha_fin > end_date:
+                continue
+            try:
+                df_periodo, _ = read_compacted(path, columns=['codigo', 'last'])
+                per_day.append((fecha_fin, df_periodo['codigo'].to_numpy(dtype=object),
+                                df_periodo['last'].to_numpy(dtype=np.float64)))
+            except Exception as e:
+                logging.warning(f"Error al cargar el histórico compactado {path}: {e}")
+
+        history = cls.from_daily_arrays(per_day, start_date, end_date)
+        logging.info(f"Histórico cargado: {len(per_day)} snapshots, {len(history.codigos)} códigos, "
+                     f"ventana {start_date} a {end_date}.")
+        return history
+
+    @classmethod
+    def from_daily_arrays(cls, per_day: List[tuple], start_date: date, end_date: date) -> 'StockHistory':
+        """Construye la matriz a partir de tuplas (fecha, codigos, valores)."""
+        if per_day:
+            all_codes = pd.Index(np.concatenate([codes for _, codes, _ in per_day])).unique()
+        else:
+            all_codes = pd.Index([], dtype=object)
+        n_days = (end_date - start_date).days + 1
+        matrix = np.full((len(all_codes), n_days), np.nan)
+        for snapshot_date, codes, values in per_day:
+            rows = all_codes.get_indexer(codes)
+            matrix[rows, (snapshot_date - start_date).days] = values
+        return cls(all_codes, start_date, matrix)
+
+    def add_day(self, snapshot_date: date, codigos: Iterable[str], valores: Iterable[float]):
+        """Incorpora (o extiende el calendario con) el snapshot de un día ya guardado en disco."""
+        codigos = pd.Index(normalize_codes(pd.Series(list(codigos), dtype=object), source=None).to_numpy(dtype=object))
+        valores = np.asarray(valores, dtype=np.float64)
+        col = (snapshot_date - self.start_date).days
+        if col < 0:
+            return
+        if col >= self.valores.shape[1]:
+            extra = np.full((self.valores.shape[0], col + 1 - self.valores.shape[1]), np.nan)
+            self.valores = np.hstack([self.valores, extra])
+        new_codes = codigos.difference(self.codigos)
+        if len(new_codes):
+            self.codigos = self.codigos.append(new_codes)
+            self.valores = np.vstack([self.valores, np.full((len(new_codes), self.valores.shape[1]), np.nan)])
+        self.valores[self.codigos.get_indexer(codigos), col] = valores
+
+    # --- Consultas ---
+    @property
+    def end_date(self) -> date:
+        return self.start_date + timedelta(days=self.valores.shape[1] - 1)
+
+    def observed_dates(self) -> List[date]:
+        """Fechas del calendario que tienen al menos un snapshot."""
+        cols = np.flatnonzero(~np.isnan(self.valores).all(axis=0)) if len(self.codigos) else []
+        return [self.start_date + timedelta(days=int(c)) for c in cols]
+
+    def has_date(self, target: date) -> bool:
+        col = (target - self.start_date).days
+        return 0 <= col < self.valores.shape[1] and len(self.codigos) > 0 and not np.isnan(self.valores[:, col]).all()
+
+    def _rows_for(self, codigos: Iterable[str]) -> np.ndarray:
+        return self.codigos.get_indexer(pd.Index(codigos, dtype=object))
+
+    def _take(self, matrix_or_vector: np.ndarray, codigos: Iterable[str]) -> np.ndarray:
+        """Alinea filas de la matriz con una lista de códigos (NaN si el código no tiene histórico)."""
+        rows = self._rows_for(codigos)
+        out = np.full(len(rows), np.nan)
+        found = rows >= 0
+        out[found] = matrix_or_vector[rows[found]]
+        return out
+
+    def values_on(self, target: date, codigos: Iterable[str]) -> Optional[np.ndarray]:
+        """Stock de cada código en una fecha; None si no hay snapshot de ese día."""
+        if not self.has_date(target):
+            return None
+        return self._take(self.valores[:, (target - self.start_date).days], codigos)
+
+    def lag(self, days: int, codigos: Iterable[str], reference_date: Optional[date] = None) -> Optional[np.ndarray]:
+        """Stock de hace `days` días respecto de reference_date (por defecto hoy)."""
+        reference_date = reference_date or datetime.now().date()
+        return self.values_on(reference_date - timedelta(days=days), codigos)
+
+    def rolling_mean(self, window: int) -> np.ndarray:
+        """Media móvil de `window` días por código, ignorando los días sin snapshot."""
+        filled = np.nan_to_num(self.valores, nan=0.0)
+        counts = (~np.isnan(self.valores)).astype(np.float64)
+        csum = np.cumsum(np.pad(filled, ((0, 0), (1, 0))), axis=1)
+        ccnt = np.cumsum(np.pad(counts, ((0, 0), (1, 0))), axis=1)
+        hi = np.arange(1, self.valores.shape[1] + 1)
+        lo = np.maximum(hi - window, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (csum[:, hi] - csum[:, lo]) / (ccnt[:, hi] - ccnt[:, lo])
+
+    def latest_rolling_mean(self, window: int, codigos: Iterable[str]) -> np.ndarray:
+        return self._take(self.rolling_mean(window)[:, -1], codigos)
+
+    def average_daily_consumption(self, window: int) -> np.ndarray:
+        """Consumo diario medio (sólo bajadas de stock entre días consecutivos con dato)."""
+        drops = np.clip(-np.diff(self.valores[:, -(window + 1):], axis=1), 0, None)
+        valid = ~np.isnan(drops)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(valid, drops, 0).sum(axis=1) / valid.sum(axis=1)
+
+    def days_of_cover(self, current: Iterable[float], codigos: Iterable[str], window: int) -> np.ndarray:
+        """Días de cobertura = stock actual / consumo diario medio (NaN si no hay consumo)."""
+        consumption = self._take(self.average_daily_consumption(window), codigos)
+        current = np.asarray(current, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cover = np.where(consumption > 0, current / consumption, np.nan)
+        return np.round(cover, 1)
+
+    def stockout_streak(self, codigos: Iterable[str]) -> np.ndarray:
+        """Días consecutivos (hasta el último snapshot) con stock <= 0."""
+        codigos = np.asarray(codigos, dtype=object)
+        matrix = self.valores[:, ~np.isnan(self.valores).all(axis=0)] if len(self.codigos) else self.valores
+        if matrix.shape[1] == 0:
+            return np.zeros(len(codigos), dtype=np.int64)
+        stockout = np.where(np.isnan(matrix), False, matrix <= 0)
+        streak = np.cumprod(stockout[:, ::-1], axis=1).sum(axis=1).astype(np.float64)
+        return np.nan_to_num(self._take(streak, codigos), nan=0).astype(np.int64)
+
+    def to_frame(self, codigos: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """Tabla codigo x fechas observadas (YYYY-MM-DD), con 0 donde falta el dato."""
+        observed = self.observed_dates()
+        cols = [(d - self.start_date).days for d in observed]
+        if codigos is None:
+            rows = np.arange(len(self.codigos))
+        else:
+            rows = self._rows_for(codigos)
+            rows = rows[rows >= 0]
+        data = np.nan_to_num(self.valores[np.ix_(rows, cols)], nan=0).astype(np.int64)
+        df = pd.DataFrame(data, columns=[d.strftime('%Y-%m-%d') for d in observed])
+        df.insert(0, 'codigo', self.codigos[rows].astype(str))
+        return df
+
+
+def add_history_columns(df_consolidado: pd.DataFrame, history: StockHistory) -> pd.DataFrame:
+    """
+    Añade al consolidado las columnas de desfase (HISTORICO_LAGS_DIAS), media móvil,
+    días de cobertura y racha de quiebre de stock, todas desde la misma matriz.
+    """
+    codigos = df_consolidado['codigo'].astype(str).to_numpy()
+    today = datetime.now().date()
+    for days, column in settings.HISTORICO_LAGS_DIAS.items():
+        values = history.lag(days, codigos, reference_date=today)
+        if values is None:
+            logging.warning(f"No se encontró el snapshot histórico de hace {days} días para '{column}'.")
+            continue
+        df_consolidado[column] = np.nan_to_num(values, nan=0).astype(np.int64)
+
+    window = settings.HISTORICO_PROMEDIO_DIAS
+    df_consolidado[f'stock_promedio_{window}_dias'] = np.round(history.latest_rolling_mean(window, codigos), 1)
+    df_consolidado['dias_cobertura'] = history.days_of_cover(df_consolidado['stock_referencial'], codigos, window)
+    df_consolidado['dias_sin_stock'] = history.stockout_streak(codigos)
+    return df_consolidado
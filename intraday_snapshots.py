@@ -0,0 +1,142 @@
+import os
+import gzip
+import json
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+from stock_diff import StockArtifact, artifact_from_frame, align_artifact
+
+# Formato del log: un miembro gzip por ejecución (append), una línea por registro
+# "<timestamp ISO>\t<json>". El primer registro del día es la base completa; los
+# siguientes guardan sólo las celdas que difieren de esa base, así reconstruir
+# cualquier instante requiere la base y un único registro.
+
+
+def intraday_log_path(day: datetime) -> str:
+    return os.path.join(settings.HISTORICOS_INTRADIA_DIR, f"stock_intradia_{day.strftime('%Y-%m-%d')}.log.gz")
+
+
+def _read_base(log_path: str) -> Optional[StockArtifact]:
+    with gzip.open(log_path, 'rt', encoding='utf-8') as f:
+        line = f.readline()
+    if not line:
+        return None
+    _, payload = line.rstrip('\n').split('\t', 1)
+    record = json.loads(payload)
+    return StockArtifact(
+        timestamp=record['ts'],
+        codigos=np.array(record['codigos'], dtype=str),
+        columnas=np.array(record['columnas'], dtype=str),
+        valores=np.array(record['valores'], dtype=np.int64).reshape(len(record['codigos']), len(record['columnas']))
+    )
+
+
+def _append_record(log_path: str, timestamp: str, record: dict):
+    line = f"{timestamp}\t{json.dumps(record, ensure_ascii=False, separators=(',', ':'))}\n"
+    with gzip.open(log_path, 'at', encoding='utf-8') as f:
+        f.write(line)
+
+
+def record_intraday_snapshot(df_consolidado: pd.DataFrame, now: Optional[datetime] = None) -> Optional[str]:
+    """
+    Agrega al log del día un snapshot de todas las columnas de almacén.
+    La primera ejecución del día escribe la base; las demás sólo los deltas contra ella.
+    """
+    now = now or datetime.now()
+    try:
+        os.makedirs(settings.HISTORICOS_INTRADIA_DIR, exist_ok=True)
+        log_path = intraday_log_path(now)
+        current = artifact_from_frame(df_consolidado, timestamp=now.isoformat(timespec='seconds'))
+        base = _read_base(log_path) if os.path.exists(log_path) else None
+
+        if base is None:
+            _append_record(log_path, current.timestamp, {
+                'tipo': 'base',
+                'ts': current.timestamp,
+                'codigos': current.codigos.tolist(),
+                'columnas': current.columnas.tolist(),
+                'valores': current.valores.ravel().tolist()
+            })
+            logging.info(f"Snapshot intradía base guardado en {log_path} ({len(current.codigos)} códigos).")
+            return log_path
+
+        # Índices extendidos: primero los de la base, luego los nuevos de este registro
+        base_codigos = pd.Index(base.codigos)
+        base_columnas = pd.Index(base.columnas)
+        nuevos_codigos = pd.Index(current.codigos).difference(base_codigos)
+        nuevas_columnas = pd.Index(current.columnas).difference(base_columnas)
+        codigos = base_codigos.append(nuevos_codigos)
+        columnas = base_columnas.append(nuevas_columnas)
+
+        delta = align_artifact(current, codigos, columnas) - align_artifact(base, codigos, columnas)
+        filas, cols = np.nonzero(delta)
+        _append_record(log_path, current.timestamp, {
+            'tipo': 'delta',
+            'ts': current.timestamp,
+            'nuevos_codigos': nuevos_codigos.tolist(),
+            'nuevas_columnas': nuevas_columnas.tolist(),
+            'filas': filas.tolist(),
+            'cols': cols.tolist(),
+            'deltas': delta[filas, cols].tolist()
+        })
+        logging.info(f"Snapshot intradía guardado en {log_path}: {len(filas)} celdas distintas a la base de {base.timestamp}.")
+        return log_path
+    except Exception as e:
+        logging.error(f"Error al guardar el snapshot intradía: {e}")
+        return None
+
+
+def _find_record(log_path: str, at: datetime) -> Tuple[Optional[dict], Optional[dict]]:
+    """Devuelve (base, último registro con timestamp <= at) leyendo sólo el JSON de esos dos."""
+    at_iso = at.isoformat(timespec='seconds')
+    base_line, match_line = None, None
+    with gzip.open(log_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            ts, payload = line.split('\t', 1)
+            if base_line is None:
+                base_line = payload
+            if ts <= at_iso:
+                match_line = payload
+            else:
+                break
+    base = json.loads(base_line) if base_line else None
+    if match_line is None:
+        return base, None
+    return base, base if match_line is base_line else json.loads(match_line)
+
+
+def load_intraday_snapshot(at: datetime) -> Optional[pd.DataFrame]:
+    """
+    Reconstruye el stock de todas las columnas de almacén vigente en el instante `at`
+    (el último snapshot del día de `at` tomado hasta esa hora).
+    """
+    log_path = intraday_log_path(at)
+    if not os.path.exists(log_path):
+        logging.warning(f"No hay log intradía para {at.strftime('%Y-%m-%d')}: {log_path}")
+        return None
+    try:
+        base, record = _find_record(log_path, at)
+        if base is None or record is None:
+            return None
+        codigos = list(base['codigos'])
+        columnas = list(base['columnas'])
+        valores = np.array(base['valores'], dtype=np.int64).reshape(len(codigos), len(columnas))
+
+        if record['tipo'] == 'delta':
+            codigos += record['nuevos_codigos']
+            columnas += record['nuevas_columnas']
+            valores = np.pad(valores, ((0, len(record['nuevos_codigos'])), (0, len(record['nuevas_columnas']))))
+            valores[record['filas'], record['cols']] += np.array(record['deltas'], dtype=np.int64)
+
+        df = pd.DataFrame(valores, columns=columnas)
+        df.insert(0, 'codigo', codigos)
+        df.attrs['timestamp'] = record['ts']
+        return df
+    except Exception as e:
+        logging.error(f"Error al reconstruir el snapshot intradía de {at.isoformat()}: {e}")
+        return None
@@ -0,0 +1,147 @@
+import time
+import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+
+from config import settings
+import data_loader
+
+# Etapa de carga: la descarga de REPT_STOCK (espera de red) corre en un hilo y el parseo de
+# los libros Excel (CPU) en procesos. El parseo de REPT_STOCK se encola apenas termina la
+# descarga, mientras catálogos y base_total ya se están procesando.
+#
+# Política de fallos: la etapa falla completa si cualquier fuente falla, y lo hace en cuanto se
+# detecta, sin esperar a las demás (se cancelan las pendientes). Todo tiene un único plazo,
+# LOAD_STAGE_TIMEOUT_SECONDS; al vencer se detienen los procesos que sigan trabajando.
+#
+# Los procesos de parseo (spawn en Windows) no heredan la configuración de logging: envían sus
+# registros por una cola a los handlers del proceso principal. El pool crea sus procesos a
+# través de _TrackedContext, que guarda un handle de cada uno para poder detenerlos.
+
+
+class LoadedSources(NamedTuple):
+    df_stock: pd.DataFrame
+    lineas_a_procesar: List[str]
+    df_generales_cat: pd.DataFrame
+    df_especiales_cat: pd.DataFrame
+    df_base: pd.DataFrame
+
+
+def _is_failed(name: str, result) -> bool:
+    """Las funciones de data_loader señalan errores con None o resultados vacíos (ya logueados)."""
+    if name == 'catalogos':
+        return not result[0]
+    return result is None
+
+
+class _TrackedContext:
+    """Contexto de multiprocessing (mp_context del pool) que guarda los procesos que crea."""
+
+    def __init__(self):
+        self._context = multiprocessing.get_context()
+        self.processes: List[multiprocessing.process.BaseProcess] = []
+
+    def Process(self, *args, **kwargs):
+        process = self._context.Process(*args, **kwargs)
+        self.processes.append(process)
+        return process
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+
+def _init_parse_worker(log_queue, level: int):
+    """Inicializador de cada proceso de parseo: envía sus registros al logging del proceso principal."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def _terminate_workers(context: _TrackedContext):
+    """Detiene los procesos que siguen parseando cuando la etapa ya no los necesita."""
+    for process in context.processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def load_sources(timeout: Optional[float] = None, catalogs: Optional[Tuple] = None) -> Optional[LoadedSources]:
+    """
+    Carga REPT_STOCK, catálogos/líneas y base_total en paralelo.
+    `catalogs` permite pasar (lineas, generales, especiales) ya parseados (p. ej. compartidos
+    entre tenants) para no volver a leer las plantillas.
+    Retorna None si alguna fuente falla o si se supera el plazo de la etapa.
+    """
+    timeout = settings.LOAD_STAGE_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    start = time.perf_counter()
+
+    context = log_listener = None
+    if settings.LOAD_USE_PROCESSES:
+        context = _TrackedContext()
+        log_queue = context.Queue()
+        root = logging.getLogger()
+        log_listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+        log_listener.start()
+        parse_pool = ProcessPoolExecutor(max_workers=settings.LOAD_PROCESS_WORKERS, mp_context=context,
+                                         initializer=_init_parse_worker, initargs=(log_queue, root.getEffectiveLevel()))
+    else:
+        parse_pool = ThreadPoolExecutor(max_workers=settings.LOAD_PROCESS_WORKERS, thread_name_prefix='parse')
+    io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='descarga')
+
+    pending: Dict[Future, str] = {
+        io_pool.submit(data_loader.download_rept_stock): 'descarga',
+        parse_pool.submit(data_loader.load_base_total): 'base_total',
+    }
+    results = {}
+    if catalogs is None:
+        pending[parse_pool.submit(data_loader.load_catalogs_and_lines)] = 'catalogos'
+    else:
+        results['catalogos'] = catalogs
+    ok = False
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            done, _ = wait(pending, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                logging.error(f"Etapa de carga sin terminar tras {timeout:.0f} s; pendientes: "
+                              f"{', '.join(sorted(pending.values()))}.")
+                return None
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logging.error(f"Error en la carga de '{name}': {e}")
+                    return None
+                if _is_failed(name, result):
+                    logging.error(f"La carga de '{name}' falló; se cancelan las fuentes pendientes.")
+                    return None
+                logging.info(f"Fuente '{name}' lista en {time.perf_counter() - start:.1f} s.")
+
+                if name == 'descarga':
+                    # El libro viaja una vez al proceso que lo parsea
+                    pending[parse_pool.submit(data_loader.parse_rept_stock, result)] = 'rept_stock'
+                else:
+                    results[name] = result
+
+        lineas_a_procesar, df_generales_cat, df_especiales_cat = results['catalogos']
+        ok = True
+        logging.info(f"Etapa de carga completada en {time.perf_counter() - start:.1f} s.")
+        return LoadedSources(results['rept_stock'], lineas_a_procesar, df_generales_cat, df_especiales_cat,
+                             results['base_total'])
+    finally:
+        for future in pending:
+            future.cancel()
+        parse_pool.shutdown(wait=ok, cancel_futures=True)
+        if not ok and context is not None:
+            _terminate_workers(context)
+        io_pool.shutdown(wait=False, cancel_futures=True)
+        if log_listener is not None:
+            log_listener.stop()
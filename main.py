@@ -1,38 +1,26 @@
 import os
-import pandas as pd
+import sys
+import glob
+import shutil
 import logging
-from datetime import datetime, timedelta # Added timedelta
+import argparse
 import traceback
-import glob
 import warnings
-import shutil
+from datetime import datetime
 
-# Módulos de configuración y lógica de la aplicación
+# Sólo la configuración se importa al inicio: pandas, requests, pydantic y los módulos
+# del proceso se cargan dentro de cada subcomando para que el arranque sea rápido.
 from config import settings
-from data_loader import (
-    download_and_parse_rept_stock,
-    load_catalogs_and_lines,
-    load_base_total,
-    merge_catalogs,
-    load_previous_stock,
-    load_historical_stock_snapshot # Added new import
-)
-from report_generator import (
-    generate_historical_general_stock_report,
-    generate_stock_report,
-    generate_especiales_report,
-    generate_productos_local_json,
-    generate_stock_generales_json,
-    save_daily_stock_snapshot
-)
-
-# --- CONFIGURACIÓN INICIAL ---
-warnings.filterwarnings('ignore', category=pd.errors.DtypeWarning)
-warnings.filterwarnings('ignore', category=UserWarning)
-
-# Crear directorios requeridos si no existen
-for directory in settings.REQUIRED_DIRS:
-    os.makedirs(directory, exist_ok=True)
+
+def ensure_directories():
+    """Crea los directorios requeridos si no existen."""
+    for directory in settings.REQUIRED_DIRS:
+        os.makedirs(directory, exist_ok=True)
+
+def configure_warnings():
+    import pandas as pd
+    warnings.filterwarnings('ignore', category=pd.errors.DtypeWarning)
+    warnings.filterwarnings('ignore', category=UserWarning)
 
 def setup_logging():
     """Configura el sistema de logging para el script."""
@@ -69,126 +57,338 @@ def clean_temp_files():
     logging.info(f"Limpieza completada: {cleaned_count} archivos eliminados")
 
 
-# --- FLUJO PRINCIPAL DE EJECUCIÓN ---
-def main():
-    """Función principal que orquesta todo el proceso ETL y de reportes."""
+# --- ETAPAS DEL PROCESO ---
+def consolidate_data(df_stock, df_base, df_generales_cat, df_especiales_cat, history):
+    """Cruza base_total, catálogos, REPT_STOCK e histórico en el DataFrame consolidado."""
+    import pandas as pd
+    from data_loader import merge_catalogs, load_previous_stock
+    from history_service import add_history_columns
+    from normalize import CodeDictionary, normalize_codes
+
+    catalogo_df = merge_catalogs(df_generales_cat, df_especiales_cat)
+    stock_anterior_dict = load_previous_stock()
+    df_stock_anterior = None
+    if stock_anterior_dict: # Only merge if there's actual previous stock data
+        df_stock_anterior = pd.DataFrame({
+            'codigo': normalize_codes(pd.Series(list(stock_anterior_dict.keys()), dtype=object), source='stock anterior codigo'),
+            'stock_antes': list(stock_anterior_dict.values())
+        })
+
+    # Todas las fuentes comparten el mismo diccionario de códigos: los merges comparan enteros
+    sources = [df for df in (df_base, catalogo_df, df_stock, df_stock_anterior) if df is not None]
+    codes = CodeDictionary.from_sources(*(df['codigo'] for df in sources))
+    df_base, catalogo_df, df_stock = (df.assign(codigo=codes.encode(df['codigo'])) for df in (df_base, catalogo_df, df_stock))
+    
+    df_base = pd.merge(df_base, catalogo_df, on='codigo', how='left')
+    # Fill NaN values in 'motivo' column with empty string after merge
+    if 'motivo' in df_base.columns:
+        df_base['motivo'] = df_base['motivo'].fillna('')
+    df_base['u_por_caja'] = df_base['u_por_caja'].fillna(1).astype(int)
+    df_base['orden'] = df_base['orden'].fillna(0).astype(int)
+    
+    df_consolidado = pd.merge(df_base, df_stock, on='codigo', how='left')
+    df_consolidado['stock_referencial'] = df_consolidado.get('stock_referencial', 0).fillna(0).astype(int)
+
+    # Merge stock_anterior into df_consolidado
+    if df_stock_anterior is not None:
+        df_stock_anterior['codigo'] = codes.encode(df_stock_anterior['codigo'])
+        df_consolidado = pd.merge(df_consolidado, df_stock_anterior, on='codigo', how='left')
+        df_consolidado['stock_antes'] = df_consolidado['stock_antes'].fillna(0).astype(int) # Fill NaN with 0 and convert to int
+    df_consolidado['codigo'] = codes.decode(df_consolidado['codigo'])
+
+    # Histórico: desfases, medias y coberturas desde la matriz ya cargada
+    df_consolidado = add_history_columns(df_consolidado, history)
+
+    # Asegurar columnas opcionales para los reportes
+    if 'precio' not in df_consolidado.columns: df_consolidado['precio'] = 0.0
+    if 'can_kg_um' not in df_consolidado.columns: df_consolidado['can_kg_um'] = ''
+
+    df_consolidado['precio'] = pd.to_numeric(df_consolidado['precio'], errors='coerce').fillna(0.0)
+    df_consolidado['can_kg_um'] = pd.to_numeric(df_consolidado['can_kg_um'], errors='coerce').fillna(0.0)
+    
+    # Conversión final de tipos de datos numéricos
+    int_columns = ['u_por_caja', 'orden', 'stock_referencial', 'dias_sin_stock'] + list(settings.HISTORICO_LAGS_DIAS.values()) + \
+                 [col for col in df_consolidado.columns if any(k in col for k in ['_stock_total', '_disponible', '_predespacho'])]
+    for col in int_columns:
+        if col in df_consolidado.columns:
+            df_consolidado[col] = pd.to_numeric(df_consolidado[col], errors='coerce').fillna(0).astype('int64')
+
+    df_consolidado.drop_duplicates(subset=['codigo'], inplace=True) # Remove duplicate codes
+    return df_consolidado
+
+# Salidas que cada publicación debe traer recién generadas; si falta alguna no se publica
+REPORT_OUTPUTS = ('OUTPUT_FINAL_REPORT_EXCEL', 'OUTPUT_ESPECIALES_REPORT_EXCEL', 'OUTPUT_PRODUCTOS_LOCAL_JSON',
+                  'STOCK_GENERALES_FILE')
+ROLLUP_OUTPUTS = ('OUTPUT_ROLLUP_STOCK_JSON', 'OUTPUT_ROLLUP_STOCK_PARQUET')
+
+def generate_reports(df_consolidado, df_base, lineas_a_procesar, df_generales_cat, df_especiales_cat, history):
+    """Genera todos los reportes y archivos JSON a partir del consolidado."""
+    from report_generator import (
+        generate_historical_general_stock_report,
+        generate_stock_report,
+        generate_especiales_report,
+        generate_productos_local_json,
+        generate_stock_generales_json
+    )
+    from alerts import generate_stock_alerts
+
+    logging.info("--- PASO 3: GENERANDO REPORTES ---")
+    
+    # Preparar subconjuntos de datos para ciertos reportes
+    codigos_generales = set(df_generales_cat['codigo'])
+    df_base_generales = df_consolidado[df_consolidado['codigo'].isin(codigos_generales)].copy()
+    # Ensure unique codes for general report
+    df_base_generales.drop_duplicates(subset=['codigo'], inplace=True)
+    
+    codigos_especiales = set(df_especiales_cat['codigo'])
+    df_base_especiales = df_consolidado[df_consolidado['codigo'].isin(codigos_especiales)].copy()
+    # Ensure unique codes for special report
+    df_base_especiales.drop_duplicates(subset=['codigo'], inplace=True)
+
+    # Alertas de quiebre y stock bajo sobre los códigos de catálogo
+    generate_stock_alerts(df_consolidado[df_consolidado['codigo'].isin(codigos_generales | codigos_especiales)])
+
+    # Generar cada reporte llamando a las funciones del módulo generador
+    generate_historical_general_stock_report(df_generales_cat, df_base, history)
+    
+    generate_stock_report(df_base_generales.copy(), lineas_a_procesar)
+    generate_especiales_report(df_consolidado)
+    generate_productos_local_json(df_consolidado, lineas_a_procesar)
+    generate_stock_generales_json(df_base_generales, df_base_especiales, lineas_a_procesar)
+
+def copy_report_to_desktop():
+    """Copia reporte_stock_hoy.xlsx al escritorio."""
+    logging.info("Copiando reporte_stock_hoy.xlsx al escritorio...")
+    try:
+        from publish import published_path
+        source_path = published_path(settings.OUTPUT_FINAL_REPORT_EXCEL)
+        destination_path = r"C:\Users\ccusi\Desktop\reporte_stock_hoy.xlsx"
+        shutil.copy(source_path, destination_path)
+        logging.info(f"reporte_stock_hoy.xlsx copiado exitosamente a {destination_path}")
+    except Exception as copy_e:
+        logging.error(f"Error al copiar reporte_stock_hoy.xlsx al escritorio: {copy_e}")
+        logging.error(traceback.format_exc())
+
+
+# --- SUBCOMANDOS ---
+def run_pipeline(catalogs=None) -> bool:
+    """
+    Proceso completo: descarga, consolidación, snapshots y reportes.
+    `catalogs` = (lineas, generales, especiales) ya parseados, usado por la ejecución por lotes.
+    """
+    ensure_directories()
     logger = setup_logging()
+    configure_warnings()
     logger.info("=== INICIANDO PROCESO COMPLETO (REFACTORIZADO) ===")
 
+    from publish import run_lock
+    with run_lock() as acquired:
+        if not acquired:
+            return False
+        return _run_pipeline_locked(logger, catalogs)
+
+def _run_pipeline_locked(logger, catalogs) -> bool:
     try:
+        from loading_stage import load_sources
+        from report_generator import (generate_stock_rollups, save_daily_stock_snapshot,
+                                      save_consolidated_stock, export_consolidated_excel)
+        from columnar_export import publish_consolidated_arrow
+        from publish import versioned_publish
+        from historical_partitions import publish_daily_partition
+        from history_service import StockHistory
+        from stock_diff import track_stock_movements
+        from snapshot_retention import apply_snapshot_retention
+
         # 1. Limpieza inicial
         clean_temp_files()
 
-        # 2. Carga y parseo de datos fuente
+        # 2. Carga y parseo de datos fuente (en paralelo: descarga en hilo, parseo en procesos)
         logger.info("--- PASO 1: CARGANDO DATOS ---")
-        df_stock = download_and_parse_rept_stock()
-        if df_stock is None: return
-
-        lineas_a_procesar, df_generales_cat, df_especiales_cat = load_catalogs_and_lines()
-        if not lineas_a_procesar: return
-        
-        df_base = load_base_total()
-        if df_base is None: return
+        sources = load_sources(catalogs=catalogs)
+        if sources is None: return False
+        df_stock, lineas_a_procesar, df_generales_cat, df_especiales_cat, df_base = sources
         
         # 3. Procesamiento y consolidación de datos
         logger.info("--- PASO 2: CONSOLIDANDO DATOS ---")
-        catalogo_df = merge_catalogs(df_generales_cat, df_especiales_cat)
-        
-        df_base = pd.merge(df_base, catalogo_df, on='codigo', how='left')
-        # Fill NaN values in 'motivo' column with empty string after merge
-        if 'motivo' in df_base.columns:
-            df_base['motivo'] = df_base['motivo'].fillna('')
-        df_base['u_por_caja'] = df_base['u_por_caja'].fillna(1).astype(int)
-        df_base['orden'] = df_base['orden'].fillna(0).astype(int)
-        
-        df_consolidado = pd.merge(df_base, df_stock, on='codigo', how='left')
-        df_consolidado['stock_referencial'] = df_consolidado.get('stock_referencial', 0).fillna(0).astype(int)
-
-        # Load stock_anterior and merge into df_consolidado
-        stock_anterior_dict = load_previous_stock()
-        if stock_anterior_dict: # Only merge if there's actual previous stock data
-            df_stock_anterior = pd.DataFrame(list(stock_anterior_dict.items()), columns=['codigo', 'stock_antes'])
-            df_stock_anterior['codigo'] = df_stock_anterior['codigo'].astype(str).str.strip() # Ensure consistent type and cleaning
-            df_consolidado = pd.merge(df_consolidado, df_stock_anterior, on='codigo', how='left')
-            df_consolidado['stock_antes'] = df_consolidado['stock_antes'].fillna(0).astype(int) # Fill NaN with 0 and convert to int
-
-        # Load historical stock for 'stock_ayer' and 'stock_hace_una_semana'
         today = datetime.now()
-        yesterday = today - timedelta(days=1)
-        one_week_ago = today - timedelta(days=7)
-
-        stock_ayer_dict = load_historical_stock_snapshot(yesterday)
-        if stock_ayer_dict:
-            df_stock_ayer = pd.DataFrame(list(stock_ayer_dict.items()), columns=['codigo', 'stock_ayer'])
-            df_stock_ayer['codigo'] = df_stock_ayer['codigo'].astype(str).str.strip()
-            df_consolidado = pd.merge(df_consolidado, df_stock_ayer, on='codigo', how='left')
-            df_consolidado['stock_ayer'] = df_consolidado['stock_ayer'].fillna(0).astype(int)
-
-        stock_hace_una_semana_dict = load_historical_stock_snapshot(one_week_ago)
-        if stock_hace_una_semana_dict:
-            df_stock_hace_una_semana = pd.DataFrame(list(stock_hace_una_semana_dict.items()), columns=['codigo', 'stock_hace_una_semana'])
-            df_stock_hace_una_semana['codigo'] = df_stock_hace_una_semana['codigo'].astype(str).str.strip()
-            df_consolidado = pd.merge(df_consolidado, df_stock_hace_una_semana, on='codigo', how='left')
-            df_consolidado['stock_hace_una_semana'] = df_consolidado['stock_hace_una_semana'].fillna(0).astype(int)
-
-        # Asegurar columnas opcionales para los reportes
-        if 'precio' not in df_consolidado.columns: df_consolidado['precio'] = 0.0
-        if 'can_kg_um' not in df_consolidado.columns: df_consolidado['can_kg_um'] = ''
-
-        df_consolidado['precio'] = pd.to_numeric(df_consolidado['precio'], errors='coerce').fillna(0.0)
-        df_consolidado['can_kg_um'] = pd.to_numeric(df_consolidado['can_kg_um'], errors='coerce').fillna(0.0)
-        
-        # Conversión final de tipos de datos numéricos
-        int_columns = ['u_por_caja', 'orden', 'stock_referencial', 'stock_ayer', 'stock_hace_una_semana'] + \
-                     [col for col in df_consolidado.columns if any(k in col for k in ['_stock_total', '_disponible', '_predespacho'])]
-        for col in int_columns:
-            if col in df_consolidado.columns:
-                df_consolidado[col] = pd.to_numeric(df_consolidado[col], errors='coerce').fillna(0).astype('int64')
+        history = StockHistory.load()
+        df_consolidado = consolidate_data(df_stock, df_base, df_generales_cat, df_especiales_cat, history)
+
+        # Movimientos por código y almacén respecto de la ejecución anterior (también intradía)
+        track_stock_movements(df_stock)
         
-        # Guardar el snapshot consolidado, la "fuente de la verdad" para los reportes
-        df_consolidado.drop_duplicates(subset=['codigo'], inplace=True) # Remove duplicate codes
-        df_consolidado.drop(columns=['motivo'], errors='ignore').to_excel(settings.DATA_STOCK_COMPLETO_FILE, index=False)
-        logger.info(f"{settings.DATA_STOCK_COMPLETO_FILE} generado.")
+        # Guardar el snapshot consolidado, la "fuente de la verdad" para los reportes (Parquet; Excel opcional)
+        save_consolidated_stock(df_consolidado)
+        publish_consolidated_arrow(df_consolidado)
+        if settings.DATA_STOCK_COMPLETO_EXCEL_ENABLED:
+            export_consolidated_excel(df_consolidado)
+        if settings.STOCK_DB_ENABLED:
+            from stock_db import write_stock_db
+            write_stock_db(df_consolidado, today.date())
         
         # 5. Guardar estado para la próxima ejecución (snapshot del inicio del día)
         save_daily_stock_snapshot(df_consolidado)
+        if not history.has_date(today.date()):
+            history.add_day(today.date(), df_consolidado['codigo'], df_consolidado['stock_referencial'])
+        publish_daily_partition(df_consolidado)
 
-        # 4. Generación de todos los reportes
-        logger.info("--- PASO 3: GENERANDO REPORTES ---")
-        
-        # Preparar subconjuntos de datos para ciertos reportes
-        codigos_generales = set(df_generales_cat['codigo'].astype(str).str.strip())
-        df_base_generales = df_consolidado[df_consolidado['codigo'].isin(codigos_generales)].copy()
-        # Ensure unique codes for general report
-        df_base_generales.drop_duplicates(subset=['codigo'], inplace=True)
-        
-        codigos_especiales = set(df_especiales_cat['codigo'].astype(str).str.strip())
-        df_base_especiales = df_consolidado[df_consolidado['codigo'].isin(codigos_especiales)].copy()
-        # Ensure unique codes for special report
-        df_base_especiales.drop_duplicates(subset=['codigo'], inplace=True)
+        # 4. Generación de todos los reportes en una versión nueva de salida, publicada al terminar
+        with versioned_publish(required=REPORT_OUTPUTS + ROLLUP_OUTPUTS):
+            # Agregados por línea x almacén, calculados una sola vez sobre el consolidado
+            generate_stock_rollups(df_consolidado)
+            generate_reports(df_consolidado, df_base, lineas_a_procesar, df_generales_cat, df_especiales_cat, history)
+        if settings.COPY_REPORT_TO_DESKTOP:
+            copy_report_to_desktop()
+        if settings.DOC_SYNC_ENABLED:
+            from document_sync import sync_stock_generales
+            sync_stock_generales()
 
-        # Generar cada reporte llamando a las funciones del módulo generador
-        generate_historical_general_stock_report(df_generales_cat, df_base)
-        
-        generate_stock_report(df_base_generales.copy(), lineas_a_procesar)
-        generate_especiales_report(df_consolidado)
-        generate_productos_local_json(df_consolidado, lineas_a_procesar)
-        generate_stock_generales_json(df_base_generales, df_base_especiales, lineas_a_procesar)
-        
-        # Copiar reporte_stock_hoy.xlsx al escritorio
-        logger.info("Copiando reporte_stock_hoy.xlsx al escritorio...")
-        try:
-            source_path = os.path.join(settings.SALIDA_DIR, "reporte_stock_hoy.xlsx")
-            destination_path = r"C:\Users\ccusi\Desktop\reporte_stock_hoy.xlsx"
-            shutil.copy(source_path, destination_path)
-            logger.info(f"reporte_stock_hoy.xlsx copiado exitosamente a {destination_path}")
-        except Exception as copy_e:
-            logger.error(f"Error al copiar reporte_stock_hoy.xlsx al escritorio: {copy_e}")
-            logger.error(traceback.format_exc())
+        # Compactar snapshots fuera de la ventana diaria
+        apply_snapshot_retention()
+        return True
 
     except Exception as e:
         logger.error(f"Error fatal en el proceso principal: {e}")
         logger.error(traceback.format_exc())
+        return False
+
+def run_reports_only() -> bool:
+    """Regenera los reportes desde el último consolidado guardado, sin descargar REPT_STOCK."""
+    ensure_directories()
+    logger = setup_logging()
+    configure_warnings()
+    logger.info("=== REGENERANDO REPORTES DESDE EL ÚLTIMO CONSOLIDADO ===")
+
+    from publish import run_lock
+    with run_lock() as acquired:
+        if not acquired:
+            return False
+        return _run_reports_only_locked(logger)
+
+def _run_reports_only_locked(logger) -> bool:
+    try:
+        from data_loader import load_catalogs_and_lines, load_consolidated_stock
+        from history_service import StockHistory
+        from publish import versioned_publish
+
+        df_consolidado = load_consolidated_stock()
+        if df_consolidado is None: return False
+
+        lineas_a_procesar, df_generales_cat, df_especiales_cat = load_catalogs_and_lines()
+        if not lineas_a_procesar: return False
+
+        with versioned_publish(carry_over=True, required=REPORT_OUTPUTS):
+            generate_reports(df_consolidado, df_consolidado, lineas_a_procesar, df_generales_cat, df_especiales_cat,
+                             StockHistory.load())
+        return True
+
+    except Exception as e:
+        logger.error(f"Error fatal regenerando reportes: {e}")
+        logger.error(traceback.format_exc())
+        return False
+
+def export_excel(output_path=None) -> bool:
+    """Genera data_stock_completo.xlsx (u otra ruta) desde el último consolidado en Parquet."""
+    ensure_directories()
+    setup_logging()
+    from data_loader import load_consolidated_stock
+    from report_generator import export_consolidated_excel
+    from publish import run_lock
+    with run_lock() as acquired:
+        if not acquired:
+            return False
+        df_consolidado = load_consolidated_stock()
+        if df_consolidado is None:
+            return False
+        return export_consolidated_excel(df_consolidado, output_path) is not None
+
+def sync_docs() -> bool:
+    """Sincroniza el último stock_generales.json con el almacén de documentos."""
+    ensure_directories()
+    setup_logging()
+    from document_sync import sync_stock_generales
+    from publish import run_lock
+    with run_lock() as acquired:
+        if not acquired:
+            return False
+        result = sync_stock_generales()
+    return result is not None and result['fallidos'] == 0
+
+def compact_history() -> bool:
+    """Aplica la política de retención de snapshots sin ejecutar el proceso."""
+    ensure_directories()
+    setup_logging()
+    from snapshot_retention import apply_snapshot_retention
+    from publish import run_lock
+    with run_lock() as acquired:
+        if not acquired:
+            return False
+        apply_snapshot_retention()
+    return True
+
+def run_batch(tenants_file=None, max_workers=None) -> bool:
+    """Ejecuta el proceso completo para cada tenant de TENANTS_FILE (ver batch_runner.py)."""
+    ensure_directories()
+    setup_logging()
+    from batch_runner import load_tenants, run_batch as run_tenants
+    try:
+        tenants = load_tenants(tenants_file)
+    except Exception as e:
+        logging.error(f"No se pudo leer la lista de tenants: {e}")
+        return False
+    results = run_tenants(tenants, max_workers)
+    return all(result['ok'] for result in results)
+
+def serve(host=None, port=None, debug=None) -> bool:
+    """Levanta la API web de app.py."""
+    from app import app
+    app.run(
+        host=host or settings.API_HOST,
+        port=port or settings.API_PORT,
+        debug=settings.API_DEBUG if debug is None else debug
+    )
+    return True
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Gestión de stock: proceso ETL, reportes y API.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    subparsers.add_parser("run", help="Proceso completo (opción por defecto).")
+    subparsers.add_parser("reports-only", help="Regenera los reportes desde el último consolidado.")
+    export_parser = subparsers.add_parser("export-excel", help="Genera data_stock_completo.xlsx desde el consolidado en Parquet.")
+    export_parser.add_argument("--output", default=None, help="Ruta del Excel (por defecto DATA_STOCK_COMPLETO_FILE).")
+    subparsers.add_parser("sync-docs", help="Sincroniza stock_generales.json con Firestore (sólo cambios).")
+    subparsers.add_parser("compact-history", help="Compacta los snapshots históricos antiguos.")
+
+    batch_parser = subparsers.add_parser("batch", help="Proceso completo para varias empresas / ERPs.")
+    batch_parser.add_argument("--tenants", default=None, help="JSON con la lista de tenants (por defecto TENANTS_FILE).")
+    batch_parser.add_argument("--max-workers", type=int, default=None, help="Tenants en paralelo (por defecto BATCH_MAX_WORKERS).")
+
+    serve_parser = subparsers.add_parser("serve", help="Levanta la API web.")
+    serve_parser.add_argument("--host", default=None)
+    serve_parser.add_argument("--port", type=int, default=None)
+    serve_parser.add_argument("--debug", action="store_true", default=None)
+    return parser
+
+def main(argv=None) -> int:
+    """Punto de entrada de línea de comandos. Sin subcomando ejecuta el proceso completo."""
+    args = build_parser().parse_args(argv)
+    if args.command == "reports-only":
+        ok = run_reports_only()
+    elif args.command == "export-excel":
+        ok = export_excel(args.output)
+    elif args.command == "sync-docs":
+        ok = sync_docs()
+    elif args.command == "compact-history":
+        ok = compact_history()
+    elif args.command == "batch":
+        ok = run_batch(args.tenants, args.max_workers)
+    elif args.command == "serve":
+        ok = serve(args.host, args.port, args.debug)
+    else:
+        ok = run_pipeline()
+    return 0 if ok else 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import re
+import logging
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable
+
+import numpy as np
+import pandas as pd
+
+# Normalización canónica de códigos de producto y EAN, compartida por todos los cargadores.
+#   codigo: sin espacios (ni internos), y '123.0' -> '123' cuando Excel lo leyó como número
+#   EAN   : sólo el texto del número; '7751234567890.0' y '7.75123456789E+12' -> '7751234567890'
+# Vacíos y 'nan'/'None' quedan como ''. Cada pasada cuenta los valores mal formados por fuente
+# (también se guardan en NORMALIZATION_STATS para quien los quiera reportar).
+
+EAN_VALID_LENGTHS = (8, 12, 13, 14)
+_MISSING_TEXT = ('', 'nan', 'none', 'nat', '<na>')
+_SCIENTIFIC = re.compile(r'^\d+(\.\d+)?[eE]\+?\d+$')
+_WHITESPACE = re.compile(r'\s+')
+_NUMERIC_FLOAT = re.compile(r'(\d+)\.0+')
+
+NORMALIZATION_STATS: Dict[str, Dict[str, int]] = {}
+
+
+def _as_text(values) -> pd.Series:
+    series = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    return series.astype(object).where(series.notna(), '').astype(str).str.strip()
+
+
+def _record(source: str, counts: Dict[str, int]):
+    counts = {key: int(value) for key, value in counts.items() if value}
+    NORMALIZATION_STATS[source] = counts
+    if counts:
+        logging.warning(f"Normalización de {source}: {counts}")
+
+
+def fold_text(value) -> str:
+    """Texto para búsquedas: minúsculas, sin tildes y con espacios simples."""
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(text.lower().split())
+
+
+def normalize_code(value) -> str:
+    """Versión escalar de normalize_codes (p. ej. para un código recibido por la API)."""
+    text = '' if value is None else str(value).strip()
+    if text.lower() in _MISSING_TEXT:
+        return ''
+    text = _WHITESPACE.sub('', text)
+    match = _NUMERIC_FLOAT.fullmatch(text)
+    return match.group(1) if match else text
+
+
+def normalize_codes(values, source: str = 'codigo') -> pd.Series:
+    """Limpia una columna de códigos en una sola pasada vectorizada."""
+    text = _as_text(values)
+    missing = text.str.lower().isin(_MISSING_TEXT)
+    has_spaces = text.str.contains(r'\s', regex=True)
+    numeric_float = text.str.fullmatch(r'\d+\.0+')
+
+    cleaned = text.str.replace(r'\s+', '', regex=True).str.replace(r'^(\d+)\.0+$', r'\1', regex=True)
+    cleaned = cleaned.where(~missing, '')
+    if source is not None:
+        _record(source, {
+            'vacios': missing.sum(),
+            'con_espacios': (has_spaces & ~missing).sum(),
+            'formato_numerico': numeric_float.sum(),
+            'duplicados': cleaned[~missing].duplicated().sum(),
+        })
+    return cleaned
+
+
+def _scientific_to_digits(value: str) -> str:
+    try:
+        return format(Decimal(value).to_integral_value(), 'f')
+    except InvalidOperation:
+        return value
+
+
+def normalize_eans(values, source: str = 'ean') -> pd.Series:
+    """Limpia una columna de EAN / EAN-14 en una sola pasada vectorizada."""
+    text = _as_text(values).str.replace(r'\s+', '', regex=True)
+    missing = text.str.lower().isin(_MISSING_TEXT)
+
+    scientific = text.str.match(_SCIENTIFIC)
+    if scientific.any():
+        text = text.copy()
+        text[scientific] = [_scientific_to_digits(v) for v in text[scientific]]
+    cleaned = text.str.replace(r'\.0+$', '', regex=True).where(~missing, '')
+
+    present = cleaned != ''
+    not_digits = present & ~cleaned.str.fullmatch(r'\d+')
+    bad_length = present & ~not_digits & ~cleaned.str.len().isin(EAN_VALID_LENGTHS)
+    if source is not None:
+        _record(source, {
+            'notacion_cientifica': scientific.sum(),
+            'no_numericos': not_digits.sum(),
+            'largo_invalido': bad_length.sum(),
+        })
+    return cleaned
+
+
+class CodeDictionary:
+    """
+    Diccionario compartido de códigos: todas las fuentes se codifican como Categorical con las
+    mismas categorías, así los merges comparan enteros en lugar de cadenas.
+    """
+
+    def __init__(self, codes: Iterable[str] = ()):
+        self.categories = pd.Index(pd.unique(np.asarray(list(codes), dtype=object)), dtype=object)
+
+    @classmethod
+    def from_sources(cls, *sources: pd.Series) -> 'CodeDictionary':
+        dictionary = cls()
+        for series in sources:
+            dictionary.add(series)
+        return dictionary
+
+    def add(self, codes: pd.Series):
+        new = pd.Index(pd.unique(codes.astype(object).to_numpy()), dtype=object).difference(self.categories)
+        if len(new):
+            self.categories = self.categories.append(new)
+
+    def encode(self, codes: pd.Series) -> pd.Categorical:
+        return pd.Categorical(codes.astype(object), categories=self.categories)
+
+    @staticmethod
+    def decode(codes: pd.Series) -> pd.Series:
+        return codes.astype(object).astype(str)
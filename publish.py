@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import shutil
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from config import settings
+
+# Publicación atómica de las salidas y bloqueo de ejecución.
+#
+# Cada ejecución escribe sus reportes en un directorio nuevo (salida/versiones/.<version>.tmp);
+# al terminar lo renombra a salida/versiones/<version> y reemplaza el puntero salida/ACTUAL.json
+# con os.replace (y el enlace salida/actual donde el sistema permite symlinks). Los lectores
+# resuelven las rutas a través del puntero (published_path), así siempre ven un conjunto
+# completo de archivos: el anterior o el nuevo, nunca uno a medio escribir.
+# Para quien todavía lee las rutas de siempre (salida/reporte_stock_hoy.xlsx, ...) los archivos
+# publicados se copian además a la raíz de salida/, cada uno con os.replace; esas copias se
+# actualizan archivo por archivo, no como conjunto.
+#
+# El bloqueo (fcntl en Linux, msvcrt en Windows) es consultivo y se libera solo si el proceso
+# muere: dos ejecuciones lanzadas por el programador de tareas no se pisan.
+
+_INFRA_ATTRS = ('PUBLICACIONES_DIR', 'PUBLICACION_POINTER_FILE', 'PUBLICACION_LINK')
+
+
+def _output_attrs() -> Dict[str, str]:
+    """Rutas de settings que son salidas publicadas (bajo SALIDA_DIR, fuera de la infraestructura)."""
+    root = settings.SALIDA_DIR
+    infra = [getattr(settings, name) for name in _INFRA_ATTRS]
+    attrs = {}
+    for name in dir(settings):
+        if not name.isupper() or name in _INFRA_ATTRS:
+            continue
+        value = getattr(settings, name)
+        if not isinstance(value, str) or not (value == root or value.startswith(root + os.sep)):
+            continue
+        if any(value == path or value.startswith(path + os.sep) for path in infra):
+            continue
+        attrs[name] = value
+    return attrs
+
+
+def read_pointer() -> Optional[Dict]:
+    try:
+        with open(settings.PUBLICACION_POINTER_FILE, 'r', encoding='utf-8') as f:
+            pointer = json.load(f)
+        pointer['ruta'] = os.path.join(settings.SALIDA_DIR, pointer['directorio'])
+        return pointer
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def published_path(path: str) -> str:
+    """
+    Ruta de un archivo de salida dentro de la versión publicada vigente. Sin publicación
+    (instalaciones anteriores) o para rutas fuera de SALIDA_DIR devuelve la ruta tal cual.
+    """
+    root = settings.SALIDA_DIR
+    if not path.startswith(root + os.sep):
+        return path
+    pointer = read_pointer()
+    if pointer is None:
+        return path
+    return os.path.join(pointer['ruta'], os.path.relpath(path, root))
+
+
+def _update_link(target_dir: str):
+    """salida/actual -> versión vigente. Opcional: en Windows sin privilegios no hay symlinks."""
+    link = settings.PUBLICACION_LINK
+    tmp_link = link + '.tmp'
+    try:
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        os.symlink(os.path.relpath(target_dir, os.path.dirname(link)), tmp_link, target_is_directory=True)
+        os.replace(tmp_link, link)
+    except OSError as e:
+        logging.debug(f"No se actualizó el enlace {link}: {e}")
+
+
+def _mirror_to_root(final_dir: str):
+    """Reemplaza las copias de la raíz de salida/ por las de la versión recién publicada."""
+    root = settings.SALIDA_DIR
+    for dirpath, _, filenames in os.walk(final_dir):
+        target_dir = os.path.join(root, os.path.relpath(dirpath, final_dir))
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+            if dirpath != final_dir:
+                # directorios de fragmentos: sin restos de publicaciones anteriores
+                for name in set(os.listdir(target_dir)) - set(filenames):
+                    if os.path.isfile(os.path.join(target_dir, name)):
+                        os.remove(os.path.join(target_dir, name))
+            for name in filenames:
+                target = os.path.join(target_dir, name)
+                shutil.copy2(os.path.join(dirpath, name), target + '.tmp')
+                os.replace(target + '.tmp', target)
+        except OSError as e:
+            logging.warning(f"No se actualizaron las copias de {target_dir} (¿archivo abierto?): {e}")
+
+
+def _prune_versions(current: str):
+    versions = sorted(name for name in os.listdir(settings.PUBLICACIONES_DIR) if not name.startswith('.'))
+    for name in versions[:-settings.PUBLICACIONES_KEEP]:
+        if name == current:
+            continue
+        try:
+            shutil.rmtree(os.path.join(settings.PUBLICACIONES_DIR, name))
+        except OSError as e:
+            logging.debug(f"No se pudo borrar la versión {name} (¿en uso?): {e}")
+
+
+@contextmanager
+def versioned_publish(carry_over: bool = False, required: Iterable[str] = ()):
+    """
+    Redirige las rutas de salida de settings a un directorio de preparación y, si el bloque
+    termina sin excepción, lo publica como la nueva versión vigente. Con `carry_over` la
+    preparación parte de una copia de la versión vigente, así las salidas que el bloque no
+    regenera (p. ej. los rollups en reports-only) siguen publicadas.
+    `required` son nombres de settings que el bloque debe generar: como los generadores
+    registran sus errores sin propagarlos, si falta alguno no se publica (RuntimeError) y
+    sigue vigente la versión anterior.
+    """
+    version = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    staging = os.path.join(settings.PUBLICACIONES_DIR, f".{version}.tmp")
+    os.makedirs(staging)
+    original = _output_attrs()
+    root = settings.SALIDA_DIR
+    previous = read_pointer() if carry_over else None
+    if previous is not None and os.path.isdir(previous['ruta']):
+        shutil.copytree(previous['ruta'], staging, dirs_exist_ok=True)
+        for name in required:  # se exigen recién generadas, no copiadas
+            carried = staging + original[name][len(root):]
+            if os.path.isfile(carried):
+                os.remove(carried)
+    for name, value in original.items():
+        setattr(settings, name, staging + value[len(root):])
+    try:
+        yield staging
+        missing = [name for name in required if not os.path.exists(getattr(settings, name))]
+        if missing:
+            raise RuntimeError(f"Salidas no generadas: {', '.join(missing)}. Se mantiene la versión publicada.")
+    except BaseException:
+        for name, value in original.items():
+            setattr(settings, name, value)
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    for name, value in original.items():
+        setattr(settings, name, value)
+
+    final_dir = os.path.join(settings.PUBLICACIONES_DIR, version)
+    os.rename(staging, final_dir)
+    tmp_pointer = settings.PUBLICACION_POINTER_FILE + '.tmp'
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'directorio': os.path.relpath(final_dir, settings.SALIDA_DIR),
+                   'publicado': datetime.now().isoformat(timespec='seconds')}, f, ensure_ascii=False)
+    os.replace(tmp_pointer, settings.PUBLICACION_POINTER_FILE)
+    _update_link(final_dir)
+    _mirror_to_root(final_dir)
+    logging.info(f"Salidas publicadas en la versión {version}.")
+    _prune_versions(version)
+
+
+def _try_lock(handle) -> bool:
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(handle):
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    except OSError as e:
+        logging.warning(f"Error liberando el bloqueo de ejecución: {e}")
+
+
+@contextmanager
+def run_lock(wait_seconds: Optional[float] = None):
+    """
+    Bloqueo exclusivo de ejecución. Entrega True si se obtuvo (esperando como máximo
+    RUN_LOCK_WAIT_SECONDS) y False si otro proceso lo mantiene.
+    """
+    wait_seconds = settings.RUN_LOCK_WAIT_SECONDS if wait_seconds is None else wait_seconds
+    os.makedirs(os.path.dirname(settings.RUN_LOCK_FILE), exist_ok=True)
+    handle = open(settings.RUN_LOCK_FILE, 'a+')
+    deadline = time.monotonic() + wait_seconds
+    try:
+        while not _try_lock(handle):
+            if time.monotonic() >= deadline:
+                try:
+                    with open(settings.RUN_LOCK_FILE + '.info', 'r', encoding='utf-8') as f:
+                        holder = f.read().strip()
+                except OSError:
+                    holder = ''
+                logging.error(f"Otra ejecución mantiene el bloqueo {settings.RUN_LOCK_FILE} ({holder or 'sin datos'}).")
+                yield False
+                return
+            time.sleep(1)
+        # Datos del dueño en un archivo aparte: en Windows el byte bloqueado no se puede leer
+        try:
+            with open(settings.RUN_LOCK_FILE + '.info', 'w', encoding='utf-8') as f:
+                f.write(f"pid={os.getpid()} desde={datetime.now().isoformat(timespec='seconds')}")
+        except OSError as e:
+            logging.debug(f"No se registró el dueño del bloqueo: {e}")
+        try:
+            yield True
+        finally:
+            _unlock(handle)
+    finally:
+        handle.close()
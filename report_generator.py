@@ -1,76 +1,48 @@
 
+import numpy as np
 import pandas as pd
 import logging
-import glob
 import os
 import json
+import re
+import hashlib
+import unicodedata
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 from pydantic import ValidationError
 
 from config import settings
 from schemas import ProductoStock
+from history_service import StockHistory
+from normalize import normalize_codes, normalize_eans
 
 
-def generate_historical_general_stock_report(df_generales_cat: pd.DataFrame, df_base: pd.DataFrame):
+def generate_historical_general_stock_report(df_generales_cat: pd.DataFrame, df_base: pd.DataFrame,
+                                             history: Optional[StockHistory] = None):
     """
     Genera un reporte Excel con el histórico de stock VES (stock_referencial)
     para los códigos generales, incluyendo una columna de tendencia.
+    Reutiliza la matriz de histórico ya cargada por el proceso principal si se entrega.
     """
     logging.info("Generando reporte histórico de stock general (VES_disponible)...")
     try:
-        historical_data_list = []
-        
-        # Obtener todos los archivos de snapshot históricos y ordenarlos por fecha
-        snapshot_files = sorted(glob.glob(os.path.join(settings.HISTORICOS_DIR, "stock_snapshot_*.json")))
+        if history is None:
+            history = StockHistory.load()
 
-        # Cargar cada snapshot y añadirlo a la lista
-        for file_path in snapshot_files:
-            try:
-                file_date_str = os.path.basename(file_path).replace("stock_snapshot_", "").replace(".json", "")
-                snapshot_date = datetime.strptime(file_date_str, '%Y-%m-%d')
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for codigo, stock in data.items():
-                        historical_data_list.append({
-                            'codigo': str(codigo),
-                            'date': snapshot_date,
-                            'stock_ves': int(stock)
-                        })
-            except Exception as e:
-                logging.warning(f"Error al cargar el snapshot {file_path}: {e}")
-                continue
-
-        if not historical_data_list:
+        if not history.observed_dates():
             logging.warning("No se encontraron datos históricos para generar el reporte.")
             return
 
-        df_historical = pd.DataFrame(historical_data_list)
-        df_historical['codigo'] = df_historical['codigo'].astype(str).str.strip()
-
         # Filtrar por códigos generales actuales
-        codigos_generales = set(df_generales_cat['codigo'].astype(str).str.strip())
-        df_historical_filtered = df_historical[df_historical['codigo'].isin(codigos_generales)].copy()
+        codigos_generales = sorted(set(df_generales_cat['codigo']))
+        df_pivot = history.to_frame(codigos_generales)
 
-        if df_historical_filtered.empty:
+        if df_pivot.empty:
             logging.warning("No hay datos históricos para los códigos generales.")
             return
 
-        # Pivotear la tabla para tener fechas como columnas
-        df_pivot = df_historical_filtered.pivot_table(
-            index='codigo',
-            columns='date',
-            values='stock_ves',
-            fill_value=0 # Rellenar con 0 si no hay stock para una fecha
-        ).reset_index()
-
-        # Renombrar columnas de fecha a formato YYYY-MM-DD
-        df_pivot.columns = [col.strftime('%Y-%m-%d') if isinstance(col, datetime) else col for col in df_pivot.columns]
-
         # Unir con nombres de productos
         df_product_names = df_base[['codigo', 'nombre']].drop_duplicates(subset=['codigo'])
-        df_product_names['codigo'] = df_product_names['codigo'].astype(str).str.strip()
         
         df_reporte = pd.merge(df_pivot, df_product_names, on='codigo', how='left')
         
@@ -79,21 +51,14 @@ def generate_historical_general_stock_report(df_generales_cat: pd.DataFrame, df_
         df_reporte = df_reporte[['codigo', 'nombre'] + date_cols]
 
         # --- Cálculo de Tendencia ---
-        df_reporte['Tendencia'] = ""
         if len(date_cols) >= 7: # Necesitamos al menos 7 días para comparar con hace una semana
-            for index, row in df_reporte.iterrows():
-                latest_stock = row[date_cols[-1]] # Último día disponible
-                stock_7_days_ago = row[date_cols[-7]] if len(date_cols) >= 7 else None # Stock de hace 7 días
-
-                if stock_7_days_ago is not None:
-                    if latest_stock > stock_7_days_ago:
-                        df_reporte.loc[index, 'Tendencia'] = "📈 Aumento"
-                    elif latest_stock < stock_7_days_ago:
-                        df_reporte.loc[index, 'Tendencia'] = "📉 Disminución"
-                    else:
-                        df_reporte.loc[index, 'Tendencia'] = "↔️ Se Mantiene"
-                else:
-                    df_reporte.loc[index, 'Tendencia'] = "➖ Sin Datos Históricos"
+            latest_stock = df_reporte[date_cols[-1]].to_numpy() # Último día disponible
+            stock_7_days_ago = df_reporte[date_cols[-7]].to_numpy() # Stock de hace 7 días
+            df_reporte['Tendencia'] = np.select(
+                [latest_stock > stock_7_days_ago, latest_stock < stock_7_days_ago],
+                ["📈 Aumento", "📉 Disminución"],
+                default="↔️ Se Mantiene"
+            )
         else:
             df_reporte['Tendencia'] = "➖ Sin Datos Históricos (menos de 7 días)"
 
@@ -201,7 +166,7 @@ def generate_especiales_report(df_consolidado: pd.DataFrame):
 
         # 1. Cargar la plantilla de códigos especiales
         df_plantilla = pd.read_excel(settings.INPUT_ESPECIALES_EXCEL, dtype={'codigo': str})
-        df_plantilla['codigo'] = df_plantilla['codigo'].str.strip()
+        df_plantilla['codigo'] = normalize_codes(df_plantilla['codigo'], source=None)
         logging.info(f"Cargados {len(df_plantilla)} códigos desde la plantilla de especiales.")
 
         # Identificar columnas de almacenes dinámicamente
@@ -290,8 +255,8 @@ def generate_productos_local_json(df_consolidado: pd.DataFrame, lineas_a_procesa
         def generate_keywords(row):
             parts = set(str(row.get('nombre', '')).lower().split())
             parts.add(str(row['codigo']).lower())
-            if pd.notna(row.get('ean')): parts.add(str(row['ean']).lower().replace('.0',''))
-            if pd.notna(row.get('ean_14')): parts.add(str(row['ean_14']).lower().replace('.0',''))
+            for col in ('ean', 'ean_14'):
+                if pd.notna(row.get(col)) and row.get(col): parts.add(str(row[col]))
             return ' '.join(sorted(parts))
         df_productos_local['keywords'] = df_productos_local.apply(generate_keywords, axis=1)
 
@@ -301,16 +266,89 @@ def generate_productos_local_json(df_consolidado: pd.DataFrame, lineas_a_procesa
         
         df_output = df_productos_local[output_cols].copy()
 
-        if 'ean' in df_output.columns: df_output['ean'] = df_output['ean'].astype(str).str.replace(r'\.0$', '', regex=True)
-        if 'ean_14' in df_output.columns: df_output['ean_14'] = df_output['ean_14'].astype(str).str.replace(r'\.0$', '', regex=True)
+        if 'ean' in df_output.columns: df_output['ean'] = normalize_eans(df_output['ean'], source=None)
+        if 'ean_14' in df_output.columns: df_output['ean_14'] = normalize_eans(df_output['ean_14'], source=None)
 
         productos_dict = df_output.to_dict(orient='records')
         with open(settings.OUTPUT_PRODUCTOS_LOCAL_JSON, 'w', encoding='utf-8') as f:
             json.dump(productos_dict, f, indent=4, ensure_ascii=False)
         logging.info(f"productos_local.json generado con {len(productos_dict)} productos.")
+
+        if settings.PRODUCTOS_LOCAL_SHARDS_ENABLED:
+            write_productos_local_shards(df_output)
+
+        from search_index import build_search_index
+        build_search_index(df_output)
     except Exception as e:
         logging.error(f"Error generando productos_local.json: {e}")
 
+def _shard_filename(linea: str, used: set) -> str:
+    slug = unicodedata.normalize('NFKD', linea).encode('ascii', 'ignore').decode('ascii').lower()
+    slug = re.sub(r'[^a-z0-9]+', '_', slug).strip('_') or 'sin_linea'
+    if slug in used:
+        slug = f"{slug}_{hashlib.sha256(linea.encode('utf-8')).hexdigest()[:8]}"
+    used.add(slug)
+    return f"linea_{slug}.json"
+
+def write_productos_local_shards(df_output: pd.DataFrame) -> Optional[Dict]:
+    """
+    Escribe productos_local en un archivo compacto por línea más un manifest.json con el hash
+    (sha256), tamaño y cantidad de registros de cada shard. Los shards sin cambios no se
+    reescriben y los de líneas que ya no se procesan se eliminan, así la webapp puede cargar
+    primero las líneas que abre y volver a descargar sólo los shards cuyo hash cambió.
+    """
+    shards_dir = settings.PRODUCTOS_LOCAL_SHARDS_DIR
+    try:
+        os.makedirs(shards_dir, exist_ok=True)
+        manifest = {'generado': datetime.now().isoformat(timespec='seconds'), 'shards': {}}
+        used_names, written = set(), 0
+        for linea, df_linea in df_output.groupby('linea', sort=True):
+            payload = json.dumps(df_linea.to_dict(orient='records'), ensure_ascii=False,
+                                 separators=(',', ':')).encode('utf-8')
+            digest = hashlib.sha256(payload).hexdigest()
+            filename = _shard_filename(str(linea), used_names)
+            path = os.path.join(shards_dir, filename)
+            if not (os.path.exists(path) and os.path.getsize(path) == len(payload) and _file_sha256(path) == digest):
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+                written += 1
+            manifest['shards'][str(linea)] = {
+                'archivo': filename,
+                'sha256': digest,
+                'bytes': len(payload),
+                'registros': len(df_linea)
+            }
+
+        # Versión global: cambia si cambia cualquier shard
+        manifest['version'] = hashlib.sha256(
+            ''.join(f"{linea}:{info['sha256']}" for linea, info in sorted(manifest['shards'].items())).encode('utf-8')
+        ).hexdigest()[:16]
+
+        vigentes = {info['archivo'] for info in manifest['shards'].values()}
+        for filename in os.listdir(shards_dir):
+            if filename.startswith('linea_') and filename.endswith('.json') and filename not in vigentes:
+                os.remove(os.path.join(shards_dir, filename))
+
+        manifest_path = os.path.join(shards_dir, 'manifest.json')
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, manifest_path)
+        logging.info(f"productos_local por línea: {len(manifest['shards'])} shards ({written} actualizados) en {shards_dir}.")
+        return manifest
+    except Exception as e:
+        logging.error(f"Error generando los shards de productos_local: {e}")
+        return None
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def generate_stock_generales_json(df_base_generales: pd.DataFrame, df_base_especiales: pd.DataFrame, lineas_a_procesar: List[str]):
     """Genera el archivo JSON para Firestore/Dialogflow con validación de esquema."""
     try:
@@ -321,15 +359,17 @@ def generate_stock_generales_json(df_base_generales: pd.DataFrame, df_base_espec
             return
 
         warehouse_ids = sorted(set(col.split('_')[0] for col in df_stock_data.columns if '_disponible' in col or '_stock_total' in col))
+        eans = {col: normalize_eans(df_stock_data[col], source=None).to_numpy() if col in df_stock_data.columns
+                else np.full(len(df_stock_data), '', dtype=object) for col in ('ean', 'ean_14')}
         
         stock_list = []
-        for _, row in df_stock_data.iterrows():
+        for i, (_, row) in enumerate(df_stock_data.iterrows()):
             entry = {
                 'codigo': str(row['codigo']),
                 'nombre': str(row['nombre']),
                 'linea': str(row['linea']),
-                'ean': str(row.get('ean', '')).replace('.0', ''),
-                'ean_14': str(row.get('ean_14', '')).replace('.0', ''),
+                'ean': eans['ean'][i],
+                'ean_14': eans['ean_14'][i],
                 'precio': float(row.get('precio', 0.0)),
                 'can_kg_um': float(row.get('can_kg_um') or 0.0),
                 'u_por_caja': int(row.get('u_por_caja', 1)),
@@ -362,6 +402,10 @@ def generate_stock_generales_json(df_base_generales: pd.DataFrame, df_base_espec
             json.dump(validated_stock_list, f, indent=4, ensure_ascii=False)
         logging.info(f"stock_generales.json generado con {len(validated_stock_list)} productos.")
 
+        # Misma información en columnas fijas por almacén (Arrow IPC) para consumidores masivos
+        from columnar_export import write_stock_generales_arrow
+        write_stock_generales_arrow(validated_stock_list, warehouse_ids)
+
     except Exception as e:
         logging.error(f"Error generando stock_generales.json: {e}")
 
@@ -369,8 +413,12 @@ def save_daily_stock_snapshot(df_consolidado: pd.DataFrame):
     """
     Guarda un snapshot diario del stock consolidado en un archivo JSON.
     Solo se guarda si no existe un snapshot para el día actual.
+    Con INTRADAY_SNAPSHOTS_ENABLED además se registra cada ejecución en el log intradía.
     """
     logging.info("Guardando snapshot diario del stock...")
+    if settings.INTRADAY_SNAPSHOTS_ENABLED:
+        from intraday_snapshots import record_intraday_snapshot
+        record_intraday_snapshot(df_consolidado)
     try:
         snapshot_date = datetime.now().strftime('%Y-%m-%d')
         output_path = os.path.join(settings.HISTORICOS_DIR, f"stock_snapshot_{snapshot_date}.json")
@@ -387,9 +435,92 @@ def save_daily_stock_snapshot(df_consolidado: pd.DataFrame):
         snapshot_data = df_snapshot.set_index('codigo')['stock_referencial'].to_dict()
         
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(snapshot_data, f, indent=4, ensure_ascii=False)
+            json.dump(snapshot_data, f, ensure_ascii=False, separators=(',', ':'))
         
         logging.info(f"Snapshot diario guardado en {output_path}")
         
     except Exception as e:
         logging.error(f"Error al guardar el snapshot diario del stock: {e}")
+
+def save_consolidated_stock(df_consolidado: pd.DataFrame) -> Optional[str]:
+    """
+    Guarda el consolidado como data_stock_completo.parquet, el artefacto que leen los demás
+    procesos (reports-only, export-excel). Las columnas de texto se fijan como string para
+    que el tipo no dependa de los valores de cada día.
+    """
+    try:
+        df = df_consolidado.drop(columns=['motivo'], errors='ignore').copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].astype('string')
+        tmp_path = settings.DATA_STOCK_COMPLETO_PARQUET + '.tmp'
+        df.to_parquet(tmp_path, index=False, compression='zstd')
+        os.replace(tmp_path, settings.DATA_STOCK_COMPLETO_PARQUET)
+        logging.info(f"{settings.DATA_STOCK_COMPLETO_PARQUET} generado.")
+        return settings.DATA_STOCK_COMPLETO_PARQUET
+    except Exception as e:
+        logging.error(f"Error guardando el consolidado en Parquet: {e}")
+        return None
+
+def export_consolidated_excel(df_consolidado: pd.DataFrame, output_path: Optional[str] = None) -> Optional[str]:
+    """Versión Excel del consolidado (data_stock_completo.xlsx), para revisión manual."""
+    output_path = output_path or settings.DATA_STOCK_COMPLETO_FILE
+    try:
+        df_consolidado.drop(columns=['motivo'], errors='ignore').to_excel(output_path, index=False)
+        logging.info(f"{output_path} generado.")
+        return output_path
+    except Exception as e:
+        logging.error(f"Error exportando el consolidado a Excel: {e}")
+        return None
+
+def generate_stock_rollups(df_consolidado: pd.DataFrame):
+    """
+    Genera la tabla agregada de stock por línea x almacén (sumas de stock_total, predespacho
+    y disponible, más conteos de productos sin stock y con disponible negativo).
+    Se calcula en una sola agrupación sobre un arreglo largo (producto x almacén) y se guarda
+    como JSON y Parquet para que los dashboards no tengan que leer la lista completa de productos.
+    """
+    logging.info("Generando rollup de stock por línea y almacén...")
+    try:
+        warehouse_ids = sorted(set(col.rsplit('_', 1)[0] for col in df_consolidado.columns if col.endswith('_disponible')))
+        if not warehouse_ids:
+            logging.warning("No hay columnas de almacén para generar el rollup de stock.")
+            return
+
+        n_productos = len(df_consolidado)
+        n_almacenes = len(warehouse_ids)
+
+        def warehouse_matrix(tipo):
+            cols = [f"{wh}_{tipo}" for wh in warehouse_ids]
+            matrix = df_consolidado.reindex(columns=cols).fillna(0).to_numpy(dtype=np.int64)
+            return matrix.ravel()  # orden producto-mayor: [p0a0, p0a1, ..., p1a0, ...]
+
+        stock_total = warehouse_matrix('stock_total')
+        disponible = warehouse_matrix('disponible')
+        df_long = pd.DataFrame({
+            'linea': np.repeat(df_consolidado['linea'].astype(str).to_numpy(), n_almacenes),
+            'almacen': np.tile(np.array(warehouse_ids, dtype=object), n_productos),
+            'productos': 1,
+            'stock_total': stock_total,
+            'predespacho': warehouse_matrix('predespacho'),
+            'disponible': disponible,
+            'productos_sin_stock': (stock_total == 0).astype(np.int64),
+            'productos_disponible_negativo': (disponible < 0).astype(np.int64)
+        })
+        df_rollup = df_long.groupby(['linea', 'almacen'], sort=True, as_index=False).sum()
+
+        value_cols = [col for col in df_rollup.columns if col not in ('linea', 'almacen')]
+        df_totales = df_rollup.groupby('almacen', as_index=False)[value_cols].sum()
+
+        df_rollup.to_parquet(settings.OUTPUT_ROLLUP_STOCK_PARQUET, index=False)
+        rollup = {
+            'generado': datetime.now().isoformat(timespec='seconds'),
+            'almacenes': warehouse_ids,
+            'filas': df_rollup.to_dict(orient='records'),
+            'totales_por_almacen': df_totales.to_dict(orient='records')
+        }
+        with open(settings.OUTPUT_ROLLUP_STOCK_JSON, 'w', encoding='utf-8') as f:
+            json.dump(rollup, f, ensure_ascii=False, separators=(',', ':'))
+        logging.info(f"Rollup de stock generado: {len(df_rollup)} filas línea x almacén en {settings.OUTPUT_ROLLUP_STOCK_JSON}")
+    except Exception as e:
+        logging.error(f"Error generando el rollup de stock: {e}")
@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+from normalize import fold_text
+from publish import published_path
+from utils import ReloadingValue, file_version
+
+# Índice de búsqueda por trigramas sobre nombre, código, EAN y EAN-14.
+# Se construye una vez por publicación del proceso y se guarda como .npz (sin pickle):
+#   trigramas (ordenados) + offsets + postings  -> lista de productos por trigrama (formato CSR)
+#   n_trigramas por producto                      -> para desempatar por similitud de Jaccard
+#   columnas de los productos                     -> para responder sin otra lectura
+# La búsqueda es tolerante a errores de tipeo (cuenta trigramas compartidos) e insensible a
+# tildes y mayúsculas (fold_text); se puede filtrar por línea.
+
+RESULT_COLUMNS = ['codigo', 'nombre', 'linea', 'ean', 'ean_14', 'stock_referencial']
+
+
+def trigrams(text: str) -> set:
+    """Trigramas de cada palabra con relleno ('  pal ', como pg_trgm)."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _document_text(row) -> str:
+    return ' '.join(fold_text(value) for value in row if value)
+
+
+class SearchIndex:
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, postings: np.ndarray,
+                 doc_sizes: np.ndarray, productos: Dict[str, np.ndarray], version: str = ''):
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        self.doc_sizes = doc_sizes
+        self.productos = productos
+        self.version = version
+        self.key_ids = {key: i for i, key in enumerate(keys.tolist())}
+        lineas = productos['linea']
+        self.lineas, self.linea_ids = np.unique(lineas, return_inverse=True)
+        self.exact = {}
+        for col in ('codigo', 'ean', 'ean_14'):
+            for i, value in enumerate(productos[col].tolist()):
+                if value:
+                    self.exact.setdefault(fold_text(value), i)
+
+    @classmethod
+    def build(cls, df: pd.DataFrame) -> 'SearchIndex':
+        productos = {}
+        for col in RESULT_COLUMNS:
+            if col == 'stock_referencial':
+                values = pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy(dtype=np.int64) \
+                    if col in df.columns else np.zeros(len(df), dtype=np.int64)
+            else:
+                values = df[col].astype(object).where(df[col].notna(), '').astype(str).to_numpy(dtype=str) \
+                    if col in df.columns else np.full(len(df), '', dtype=str)
+            productos[col] = values
+
+        key_ids: Dict[str, int] = {}
+        tri_ids, doc_ids, doc_sizes = [], [], np.zeros(len(df), dtype=np.int32)
+        fields = zip(productos['nombre'].tolist(), productos['codigo'].tolist(),
+                     productos['ean'].tolist(), productos['ean_14'].tolist())
+        for doc, row in enumerate(fields):
+            grams = trigrams(_document_text(row))
+            doc_sizes[doc] = len(grams)
+            for gram in grams:
+                tri_ids.append(key_ids.setdefault(gram, len(key_ids)))
+                doc_ids.append(doc)
+
+        # CSR ordenado por trigrama
+        keys = np.array(list(key_ids), dtype=str)
+        order = np.argsort(keys, kind='stable')
+        remap = np.empty(len(keys), dtype=np.int64)
+        remap[order] = np.arange(len(keys))
+        tri = remap[np.asarray(tri_ids, dtype=np.int64)]
+        docs = np.asarray(doc_ids, dtype=np.int32)
+        by_tri = np.argsort(tri, kind='stable')
+        postings = docs[by_tri]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tri, minlength=len(keys)), out=offsets[1:])
+        return cls(keys[order], offsets, postings, doc_sizes, productos)
+
+    def save(self, path: Optional[str] = None) -> str:
+        path = path or settings.SEARCH_INDEX_FILE
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, keys=self.keys, offsets=self.offsets, postings=self.postings, doc_sizes=self.doc_sizes,
+                 **{f"col_{col}": values for col, values in self.productos.items()})
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'SearchIndex':
+        path = path or settings.SEARCH_INDEX_FILE
+        with np.load(path, allow_pickle=False) as data:
+            productos = {col: data[f"col_{col}"] for col in RESULT_COLUMNS}
+            stat = os.stat(path)
+            return cls(data['keys'], data['offsets'], data['postings'], data['doc_sizes'], productos,
+                       version=f"{stat.st_mtime_ns}-{stat.st_size}")
+
+    def search(self, query: str, linea: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Productos ordenados por trigramas compartidos con la consulta; coincidencia exacta de código/EAN primero."""
+        folded = fold_text(query)
+        if not folded:
+            return []
+        n_docs = len(self.doc_sizes)
+        linea_mask = None
+        if linea:
+            matches = np.flatnonzero(np.char.upper(self.lineas) == linea.strip().upper())
+            if matches.size == 0:
+                return []
+            linea_mask = self.linea_ids == matches[0]
+
+        # cobertura: fracción de los trigramas de la consulta presentes en el producto (un error de
+        # tipeo sólo quita unos pocos); a igual cobertura gana el más parecido en total (Jaccard)
+        query_grams = trigrams(folded)
+        ids = [self.key_ids[g] for g in query_grams if g in self.key_ids]
+        if ids:
+            hits = np.concatenate([self.postings[self.offsets[i]:self.offsets[i + 1]] for i in ids])
+            shared = np.bincount(hits, minlength=n_docs)
+        else:
+            shared = np.zeros(n_docs, dtype=np.int64)
+        score = shared / len(query_grams)
+        if linea_mask is not None:
+            score = np.where(linea_mask, score, 0)
+
+        exact = self.exact.get(folded.replace(' ', ''))
+        if exact is not None and (linea_mask is None or linea_mask[exact]):
+            score[exact] = 2.0
+
+        candidates = np.flatnonzero(score >= settings.SEARCH_MIN_SCORE)
+        jaccard = shared[candidates] / (len(query_grams) + self.doc_sizes[candidates] - shared[candidates])
+        rank = score[candidates] + jaccard * 1e-3
+        if candidates.size > limit:
+            top = np.argpartition(-rank, limit - 1)[:limit]
+            candidates, rank = candidates[top], rank[top]
+        candidates = candidates[np.lexsort((candidates, -rank))]
+        return [
+            {**{col: self.productos[col][i].item() for col in RESULT_COLUMNS},
+             'puntaje': round(min(float(score[i]), 1.0), 3)}
+            for i in candidates
+        ]
+
+
+def build_search_index(df_productos: pd.DataFrame) -> Optional[str]:
+    """Construye y publica el índice de búsqueda a partir de los productos publicados."""
+    logging.info("Construyendo índice de búsqueda por trigramas...")
+    try:
+        start = time.perf_counter()
+        index = SearchIndex.build(df_productos)
+        path = index.save()
+        logging.info(f"Índice de búsqueda: {len(index.doc_sizes)} productos, {len(index.keys)} trigramas, "
+                     f"{time.perf_counter() - start:.1f} s -> {path}")
+        return path
+    except Exception as e:
+        logging.error(f"Error construyendo el índice de búsqueda: {e}")
+        return None
+
+
+_index = ReloadingValue(lambda: file_version(published_path(settings.SEARCH_INDEX_FILE)),
+                        lambda version: SearchIndex.load(published_path(settings.SEARCH_INDEX_FILE)),
+                        settings.STOCK_INDEX_CHECK_SECONDS, description='el índice de búsqueda')
+
+
+def get_search_index() -> Optional[SearchIndex]:
+    """Índice vigente; vuelve a cargarlo cuando el proceso publica uno nuevo."""
+    return _index.get()
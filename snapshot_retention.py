@@ -0,0 +1,187 @@
+import os
+import glob
+import json
+import logging
+from datetime import datetime, date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import settings
+from normalize import normalize_codes
+
+# Política de retención de HISTORICOS_DIR:
+#   - días con antigüedad <= SNAPSHOT_RETENCION_DIARIA_DIAS: un JSON por día (sin cambios)
+#   - hasta SNAPSHOT_RETENCION_SEMANAL_DIAS: agregados semanales  -> compactado/semanal_YYYY-Www.parquet
+#   - más antiguos: agregados mensuales                             -> compactado/mensual_YYYY-MM.parquet
+# Cada agregado guarda por código min, max, mean, last y n (días con dato), de modo que
+# un periodo se puede volver a compactar (semanal -> mensual) sin perder exactitud.
+
+AGGREGATE_COLUMNS = ['codigo', 'min', 'max', 'mean', 'last', 'n']
+
+
+def _daily_snapshot_files() -> List[Tuple[date, str]]:
+    files = []
+    for file_path in glob.glob(os.path.join(settings.HISTORICOS_DIR, "stock_snapshot_*.json")):
+        try:
+            snapshot_date = datetime.strptime(os.path.basename(file_path)[len("stock_snapshot_"):][:10], '%Y-%m-%d').date()
+            files.append((snapshot_date, file_path))
+        except ValueError:
+            continue
+    return sorted(files)
+
+
+def _period_key(day: date, today: date) -> str:
+    if (today - day).days <= settings.SNAPSHOT_RETENCION_SEMANAL_DIAS:
+        year, week, _ = day.isocalendar()
+        return f"semanal_{year}-W{week:02d}"
+    return f"mensual_{day.strftime('%Y-%m')}"
+
+
+def _aggregate_daily(days: List[Tuple[date, str]]) -> pd.DataFrame:
+    """Agrega snapshots diarios en un DataFrame codigo, min, max, mean, last, n."""
+    frames = []
+    for snapshot_date, file_path in days:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        frames.append(pd.DataFrame({
+            'codigo': normalize_codes(pd.Series(list(data.keys()), dtype=object), source=None).to_numpy(dtype=object),
+            'stock': np.fromiter((float(v) for v in data.values()), dtype=np.float64, count=len(data)),
+            'fecha': snapshot_date
+        }))
+    df = pd.concat(frames, ignore_index=True).sort_values(['codigo', 'fecha'])
+    grouped = df.groupby('codigo', sort=True)['stock']
+    return pd.DataFrame({
+        'min': grouped.min(),
+        'max': grouped.max(),
+        'mean': grouped.mean(),
+        'last': grouped.last(),
+        'n': grouped.size().astype(np.int64)
+    }).reset_index()
+
+
+def _merge_aggregates(older: pd.DataFrame, newer: pd.DataFrame) -> pd.DataFrame:
+    """Combina dos agregados de periodos consecutivos (media ponderada por n, last del más reciente)."""
+    df = pd.concat([older.assign(_orden=0), newer.assign(_orden=1)], ignore_index=True)
+    df['_suma'] = df['mean'] * df['n']
+    df.sort_values(['codigo', '_orden'], inplace=True)
+    grouped = df.groupby('codigo', sort=True)
+    merged = pd.DataFrame({
+        'min': grouped['min'].min(),
+        'max': grouped['max'].max(),
+        'last': grouped['last'].last(),
+        'n': grouped['n'].sum()
+    })
+    merged['mean'] = grouped['_suma'].sum() / merged['n']
+    return merged.reset_index()[AGGREGATE_COLUMNS]
+
+
+def _compacted_path(period_key: str) -> str:
+    return os.path.join(settings.HISTORICOS_COMPACTADOS_DIR, f"{period_key}.parquet")
+
+
+def read_compacted(path: str, columns: Optional[List[str]] = None) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """Lee un agregado compactado y sus metadatos (periodo, fecha_inicio, fecha_fin)."""
+    table = pq.read_table(path, columns=columns)
+    metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items() if not k.startswith(b'pandas')}
+    return table.to_pandas(), metadata
+
+
+def compacted_metadata(path: str) -> Dict[str, str]:
+    """Metadatos del agregado sin leer sus datos (sólo el pie del Parquet)."""
+    schema_metadata = pq.read_schema(path).metadata or {}
+    return {k.decode(): v.decode() for k, v in schema_metadata.items() if not k.startswith(b'pandas')}
+
+
+def _write_compacted(period_key: str, df: pd.DataFrame, fecha_inicio: date, fecha_fin: date):
+    path = _compacted_path(period_key)
+    if os.path.exists(path):
+        previous, meta = read_compacted(path)
+        prev_inicio = date.fromisoformat(meta['fecha_inicio'])
+        prev_fin = date.fromisoformat(meta['fecha_fin'])
+        if prev_fin <= fecha_inicio:
+            df = _merge_aggregates(previous, df)
+        else:
+            df = _merge_aggregates(df, previous)
+        fecha_inicio, fecha_fin = min(prev_inicio, fecha_inicio), max(prev_fin, fecha_fin)
+
+    table = pa.Table.from_pandas(df[AGGREGATE_COLUMNS], preserve_index=False)
+    table = table.replace_schema_metadata({
+        'periodo': period_key,
+        'fecha_inicio': fecha_inicio.isoformat(),
+        'fecha_fin': fecha_fin.isoformat()
+    })
+    tmp_path = path + '.tmp'
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+
+
+def apply_snapshot_retention(today: Optional[date] = None) -> int:
+    """
+    Compacta los snapshots diarios fuera de la ventana diaria en agregados semanales/mensuales
+    y re-compacta los semanales antiguos en mensuales. Devuelve el número de archivos eliminados.
+    """
+    today = today or datetime.now().date()
+    logging.info("Aplicando política de retención de snapshots históricos...")
+    removed = 0
+    try:
+        os.makedirs(settings.HISTORICOS_COMPACTADOS_DIR, exist_ok=True)
+
+        # 1. Diarios antiguos -> semanal / mensual
+        groups: Dict[str, List[Tuple[date, str]]] = {}
+        for snapshot_date, file_path in _daily_snapshot_files():
+            if (today - snapshot_date).days > settings.SNAPSHOT_RETENCION_DIARIA_DIAS:
+                groups.setdefault(_period_key(snapshot_date, today), []).append((snapshot_date, file_path))
+
+        for period_key, days in sorted(groups.items()):
+            _write_compacted(period_key, _aggregate_daily(days), days[0][0], days[-1][0])
+            for _, file_path in days:
+                os.remove(file_path)
+                removed += 1
+            logging.info(f"Compactados {len(days)} snapshots diarios en {period_key}.")
+
+        # 2. Semanales fuera de la ventana semanal -> mensual (por mes de la fecha de cierre)
+        for path in sorted(glob.glob(os.path.join(settings.HISTORICOS_COMPACTADOS_DIR, "semanal_*.parquet"))):
+            df_week, meta = read_compacted(path)
+            fecha_fin = date.fromisoformat(meta['fecha_fin'])
+            if (today - fecha_fin).days <= settings.SNAPSHOT_RETENCION_SEMANAL_DIAS:
+                continue
+            month_key = f"mensual_{fecha_fin.strftime('%Y-%m')}"
+            _write_compacted(month_key, df_week, date.fromisoformat(meta['fecha_inicio']), fecha_fin)
+            os.remove(path)
+            removed += 1
+            logging.info(f"Agregado {meta['periodo']} re-compactado en {month_key}.")
+
+        logging.info(f"Retención aplicada: {removed} archivos históricos compactados.")
+        return removed
+    except Exception as e:
+        logging.error(f"Error aplicando la retención de snapshots: {e}")
+        return removed
+
+
+def iter_compacted_periods(start: Optional[date] = None, end: Optional[date] = None):
+    """Recorre (ruta, fecha_inicio, fecha_fin) de los agregados que se solapan con [start, end]."""
+    for path in sorted(glob.glob(os.path.join(settings.HISTORICOS_COMPACTADOS_DIR, "*.parquet"))):
+        try:
+            meta = compacted_metadata(path)
+            fecha_inicio = date.fromisoformat(meta['fecha_inicio'])
+            fecha_fin = date.fromisoformat(meta['fecha_fin'])
+        except Exception as e:
+            logging.warning(f"Agregado histórico inválido {path}: {e}")
+            continue
+        if (start is None or fecha_fin >= start) and (end is None or fecha_inicio <= end):
+            yield path, fecha_inicio, fecha_fin
+
+
+def load_compacted_snapshot(target: date) -> Optional[Dict[str, int]]:
+    """
+    Stock de cada código para una fecha ya compactada: el último valor del periodo que la contiene
+    (resolución semanal o mensual según la antigüedad).
+    """
+    for path, _, _ in iter_compacted_periods(target, target):
+        df, _ = read_compacted(path, columns=['codigo', 'last'])
+        return dict(zip(df['codigo'], df['last'].round().astype(np.int64).tolist()))
+    return None
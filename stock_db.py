@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import logging
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+from stock_diff import TRACKED_FIELDS
+
+# Base SQLite con el consolidado de cada día (alternativa consultable a data_stock_completo.xlsx).
+#   stock          : una fila por (fecha, codigo) con los datos del producto
+#   stock_almacen  : una fila por (fecha, codigo, almacen) con stock_total, predespacho y disponible
+# Los almacenes van en formato largo porque el conjunto de columnas ALMACEN_campo cambia entre días;
+# las combinaciones código x almacén con los tres valores en 0 no se guardan.
+# Volver a cargar una fecha reemplaza sus filas (varias ejecuciones en un mismo día).
+
+STOCK_COLUMNS = {
+    'codigo': 'TEXT NOT NULL',
+    'nombre': 'TEXT',
+    'linea': 'TEXT',
+    'ean': 'TEXT',
+    'ean_14': 'TEXT',
+    'precio': 'REAL',
+    'can_kg_um': 'REAL',
+    'orden': 'INTEGER',
+    'u_por_caja': 'INTEGER',
+    'stock_referencial': 'INTEGER',
+    'stock_antes': 'INTEGER',
+}
+
+SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS stock (
+        fecha TEXT NOT NULL,
+        {', '.join(f'{name} {sql_type}' for name, sql_type in STOCK_COLUMNS.items())},
+        PRIMARY KEY (fecha, codigo)
+    )""",
+    """CREATE TABLE IF NOT EXISTS stock_almacen (
+        fecha TEXT NOT NULL,
+        codigo TEXT NOT NULL,
+        almacen TEXT NOT NULL,
+        stock_total INTEGER NOT NULL,
+        predespacho INTEGER NOT NULL,
+        disponible INTEGER NOT NULL,
+        PRIMARY KEY (fecha, codigo, almacen)
+    )""",
+    "CREATE TABLE IF NOT EXISTS cargas (fecha TEXT PRIMARY KEY, generado TEXT NOT NULL, filas INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_codigo ON stock (codigo, fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_linea ON stock (linea, fecha)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_ean ON stock (ean)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_ean_14 ON stock (ean_14)",
+    "CREATE INDEX IF NOT EXISTS idx_stock_almacen_codigo ON stock_almacen (codigo, fecha)",
+]
+
+
+def connect(path: Optional[str] = None, read_only: bool = False) -> sqlite3.Connection:
+    path = path or settings.STOCK_DB_FILE
+    if read_only:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _column_values(df: pd.DataFrame, name: str, sql_type: str) -> list:
+    """Valores nativos de Python (sqlite3 no acepta tipos numpy); None donde falta el dato."""
+    if name not in df.columns:
+        return [None] * len(df)
+    series = df[name]
+    if sql_type.startswith('INTEGER'):
+        series = pd.to_numeric(series, errors='coerce').round().astype('Int64')
+    elif sql_type.startswith('REAL'):
+        series = pd.to_numeric(series, errors='coerce')
+    else:
+        series = series.astype('string').str.strip()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _warehouse_rows(df: pd.DataFrame, fecha: str):
+    """Filas (fecha, codigo, almacen, stock_total, predespacho, disponible) desde las columnas ALMACEN_campo."""
+    almacenes = sorted({col[:-len(field) - 1] for col in df.columns for field in TRACKED_FIELDS
+                        if col.endswith('_' + field)})
+    codigos = df['codigo'].astype(str).tolist()
+    for almacen in almacenes:
+        valores = [
+            pd.to_numeric(df[f"{almacen}_{field}"], errors='coerce').fillna(0).to_numpy(dtype=np.int64).tolist()
+            if f"{almacen}_{field}" in df.columns else [0] * len(df)
+            for field in TRACKED_FIELDS
+        ]
+        for codigo, stock_total, predespacho, disponible in zip(codigos, *valores):
+            if stock_total or predespacho or disponible:
+                yield fecha, codigo, almacen, stock_total, predespacho, disponible
+
+
+def write_stock_db(df_consolidado: pd.DataFrame, fecha: Optional[date] = None, path: Optional[str] = None) -> bool:
+    """Carga el consolidado del día en la base SQLite en una sola transacción."""
+    fecha = (fecha or datetime.now().date()).isoformat()
+    path = path or settings.STOCK_DB_FILE
+    logging.info(f"Cargando consolidado del {fecha} en {path}...")
+    try:
+        df = df_consolidado.drop_duplicates(subset=['codigo'])
+        columns = {name: _column_values(df, name, sql_type) for name, sql_type in STOCK_COLUMNS.items()}
+        stock_rows = zip([fecha] * len(df), *columns.values())
+
+        conn = connect(path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM stock WHERE fecha = ?", (fecha,))
+                conn.execute("DELETE FROM stock_almacen WHERE fecha = ?", (fecha,))
+                conn.executemany(
+                    f"INSERT INTO stock (fecha, {', '.join(STOCK_COLUMNS)}) VALUES ({', '.join('?' * (len(STOCK_COLUMNS) + 1))})",
+                    stock_rows
+                )
+                conn.executemany("INSERT INTO stock_almacen VALUES (?, ?, ?, ?, ?, ?)", _warehouse_rows(df, fecha))
+                conn.execute("INSERT OR REPLACE INTO cargas VALUES (?, ?, ?)",
+                             (fecha, datetime.now().isoformat(timespec='seconds'), len(df)))
+        finally:
+            conn.close()
+        logging.info(f"Base de stock actualizada: {len(df)} códigos para {fecha}.")
+        return True
+    except Exception as e:
+        logging.error(f"Error cargando el consolidado en la base SQLite: {e}")
+        return False
+
+
+def _latest_fecha(conn: sqlite3.Connection) -> Optional[str]:
+    row = conn.execute("SELECT MAX(fecha) FROM cargas").fetchone()
+    return row[0] if row else None
+
+
+def query_stock_codigo(codigo: str, fecha: Optional[str] = None, path: Optional[str] = None) -> Optional[Dict]:
+    """Datos y stock por almacén de un código en una fecha (por defecto, la última carga)."""
+    conn = connect(path, read_only=True)
+    try:
+        fecha = fecha or _latest_fecha(conn)
+        row = conn.execute("SELECT * FROM stock WHERE fecha = ? AND codigo = ?", (fecha, codigo)).fetchone()
+        if row is None:
+            return None
+        result = dict(row)
+        result['almacenes'] = {
+            r['almacen']: {field: r[field] for field in TRACKED_FIELDS}
+            for r in conn.execute(
+                "SELECT almacen, stock_total, predespacho, disponible FROM stock_almacen WHERE fecha = ? AND codigo = ?",
+                (fecha, codigo))
+        }
+        return result
+    finally:
+        conn.close()
+
+
+def query_stock_history(codigo: str, desde: str, hasta: str, path: Optional[str] = None) -> List[Dict]:
+    """stock_referencial de un código por fecha en [desde, hasta]."""
+    conn = connect(path, read_only=True)
+    try:
+        return [dict(r) for r in conn.execute(
+            "SELECT fecha, stock_referencial FROM stock WHERE codigo = ? AND fecha BETWEEN ? AND ? ORDER BY fecha",
+            (codigo, desde, hasta))]
+    finally:
+        conn.close()
+
+
+def stock_db_available(path: Optional[str] = None) -> bool:
+    return os.path.exists(path or settings.STOCK_DB_FILE)
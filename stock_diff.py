@@ -0,0 +1,158 @@
+import os
+import json
+import logging
+from datetime import datetime
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import settings
+
+TRACKED_FIELDS = ('stock_total', 'predespacho', 'disponible')
+
+
+class StockArtifact(NamedTuple):
+    """REPT_STOCK parseado en forma compacta: códigos x columnas ALMACEN_campo."""
+    timestamp: str
+    codigos: np.ndarray   # str
+    columnas: np.ndarray  # str, p. ej. 'VES_disponible'
+    valores: np.ndarray   # int64, shape (n_codigos, n_columnas)
+
+
+def artifact_from_frame(df_stock: pd.DataFrame, timestamp: Optional[str] = None) -> StockArtifact:
+    """Extrae del pivot de REPT_STOCK sólo las columnas de almacén seguidas (stock_total, predespacho, disponible)."""
+    columnas = sorted(col for col in df_stock.columns if col.endswith(tuple(f"_{f}" for f in TRACKED_FIELDS)))
+    valores = df_stock[columnas].fillna(0).to_numpy(dtype=np.int64) if columnas else np.zeros((len(df_stock), 0), np.int64)
+    return StockArtifact(
+        timestamp=timestamp or datetime.now().isoformat(timespec='seconds'),
+        codigos=df_stock['codigo'].astype(str).to_numpy(dtype=str),
+        columnas=np.array(columnas, dtype=str),
+        valores=valores
+    )
+
+
+def save_stock_artifact(artifact: StockArtifact, path: Optional[str] = None):
+    """Guarda el artefacto como .npz comprimido (escritura atómica)."""
+    path = path or settings.REPT_STOCK_ARTIFACT_FILE
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(
+        tmp_path,
+        timestamp=np.array(artifact.timestamp),
+        codigos=artifact.codigos,
+        columnas=artifact.columnas,
+        valores=artifact.valores
+    )
+    os.replace(tmp_path, path)
+    logging.info(f"Artefacto de REPT_STOCK guardado en {path} ({len(artifact.codigos)} códigos).")
+
+
+def load_stock_artifact(path: Optional[str] = None) -> Optional[StockArtifact]:
+    """Carga el último REPT_STOCK guardado; None si no existe o está dañado."""
+    path = path or settings.REPT_STOCK_ARTIFACT_FILE
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return StockArtifact(
+                timestamp=str(data['timestamp']),
+                codigos=data['codigos'],
+                columnas=data['columnas'],
+                valores=data['valores']
+            )
+    except Exception as e:
+        logging.error(f"Error al cargar el artefacto de REPT_STOCK desde {path}: {e}")
+        return None
+
+
+def referencial_from_artifact(artifact: StockArtifact) -> dict:
+    """codigo -> stock_referencial (disponible de VES) del artefacto."""
+    col = next((i for i, name in enumerate(artifact.columnas) if 'VES' in name.upper() and name.endswith('_disponible')), None)
+    if col is None:
+        return {}
+    return dict(zip(artifact.codigos.tolist(), artifact.valores[:, col].tolist()))
+
+
+def align_artifact(artifact: StockArtifact, codigos: pd.Index, columnas: pd.Index) -> np.ndarray:
+    """Reubica la matriz del artefacto sobre la unión de códigos y columnas (0 donde no existe)."""
+    out = np.zeros((len(codigos), len(columnas)), dtype=np.int64)
+    rows = codigos.get_indexer(artifact.codigos)
+    cols = columnas.get_indexer(artifact.columnas)
+    out[np.ix_(rows, cols)] = artifact.valores
+    return out
+
+
+def diff_stock_artifacts(previous: StockArtifact, current: StockArtifact) -> pd.DataFrame:
+    """
+    Movimientos entre dos REPT_STOCK: una fila por código, almacén y campo que cambió.
+    Códigos o almacenes que aparecen o desaparecen se comparan contra 0.
+    """
+    codigos = pd.Index(previous.codigos).union(pd.Index(current.codigos))
+    columnas = pd.Index(previous.columnas).union(pd.Index(current.columnas))
+    antes = align_artifact(previous, codigos, columnas)
+    despues = align_artifact(current, codigos, columnas)
+    delta = despues - antes
+
+    rows, cols = np.nonzero(delta)
+    campos = np.array([next(f for f in TRACKED_FIELDS if col.endswith('_' + f)) for col in columnas], dtype=object)
+    almacenes = np.array([col[:-len(campo) - 1] for col, campo in zip(columnas, campos)], dtype=object)
+    return pd.DataFrame({
+        'timestamp': current.timestamp,
+        'codigo': codigos.to_numpy(dtype=str)[rows],
+        'almacen': almacenes[cols],
+        'campo': campos[cols],
+        'antes': antes[rows, cols],
+        'despues': despues[rows, cols],
+        'delta': delta[rows, cols]
+    })
+
+
+def append_movements_log(df_movimientos: pd.DataFrame, run_date: Optional[datetime] = None) -> Optional[str]:
+    """Agrega los movimientos al log NDJSON del día (uno por día, varias ejecuciones por archivo)."""
+    if df_movimientos.empty:
+        return None
+    run_date = run_date or datetime.now()
+    os.makedirs(settings.MOVIMIENTOS_DIR, exist_ok=True)
+    log_path = os.path.join(settings.MOVIMIENTOS_DIR, f"movimientos_{run_date.strftime('%Y-%m-%d')}.ndjson")
+    lines = df_movimientos.to_json(orient='records', lines=True, force_ascii=False)
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(lines if lines.endswith('\n') else lines + '\n')
+    return log_path
+
+
+def track_stock_movements(df_stock: pd.DataFrame) -> Optional[pd.DataFrame]:
+    """
+    Compara el REPT_STOCK recién parseado con el de la ejecución anterior, registra los
+    movimientos en el log del día y deja el actual como nueva referencia.
+    """
+    logging.info("Calculando movimientos respecto del REPT_STOCK anterior...")
+    try:
+        current = artifact_from_frame(df_stock)
+        previous = load_stock_artifact()
+        df_movimientos = None
+        if previous is None:
+            logging.info("No hay REPT_STOCK anterior: se guarda el actual como referencia.")
+        else:
+            df_movimientos = diff_stock_artifacts(previous, current)
+            log_path = append_movements_log(df_movimientos)
+            logging.info(f"Movimientos desde {previous.timestamp}: {len(df_movimientos)} cambios"
+                         + (f" registrados en {log_path}" if log_path else "."))
+        save_stock_artifact(current)
+        return df_movimientos
+    except Exception as e:
+        logging.error(f"Error calculando movimientos de stock: {e}")
+        return None
+
+
+def load_movements(run_date: datetime, codigo: Optional[str] = None) -> List[dict]:
+    """Lee los movimientos registrados en un día, opcionalmente filtrados por código."""
+    log_path = os.path.join(settings.MOVIMIENTOS_DIR, f"movimientos_{run_date.strftime('%Y-%m-%d')}.ndjson")
+    if not os.path.exists(log_path):
+        return []
+    movimientos = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if codigo is None or record['codigo'] == codigo:
+                movimientos.append(record)
+    return movimientos
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from config import settings
+from normalize import fold_text, normalize_code
+from publish import published_path
+from utils import ReloadingValue, file_version
+
+# Índice en memoria del último stock_generales para responder consultas puntuales (webhook de
+# Dialogflow) sin leer archivos por petición. Se construye una vez y se vuelve a construir sólo
+# cuando cambia el archivo publicado; el reemplazo es atómico (se cambia la referencia).
+
+
+class StockIndex:
+    """Productos de stock_generales indexados por código, EAN/EAN-14 y palabras del nombre."""
+
+    def __init__(self, productos: List[Dict], almacenes: List[str], version: str = ''):
+        self.productos = productos
+        self.almacenes = almacenes
+        self.version = version
+        self.by_codigo: Dict[str, int] = {}
+        self.by_ean: Dict[str, int] = {}
+        self.by_token: Dict[str, List[int]] = {}
+        self.nombres: List[str] = []
+        self.almacen_lookup = {fold_text(wh): wh for wh in almacenes}
+
+        for i, producto in enumerate(productos):
+            self.by_codigo.setdefault(fold_text(producto['codigo']), i)
+            for col in ('ean', 'ean_14'):
+                if producto.get(col):
+                    self.by_ean.setdefault(producto[col], i)
+            nombre = fold_text(producto.get('nombre'))
+            self.nombres.append(nombre)
+            for token in set(nombre.split()):
+                self.by_token.setdefault(token, []).append(i)
+        self.sorted_tokens = sorted(self.by_token)
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> 'StockIndex':
+        path = path or settings.STOCK_GENERALES_FILE
+        with open(path, 'r', encoding='utf-8') as f:
+            productos = json.load(f)
+        almacenes = sorted({wh for producto in productos for wh in producto.get('almacenes', {})})
+        stat = os.stat(path)
+        return cls(productos, almacenes, version=f"{stat.st_mtime_ns}-{stat.st_size}")
+
+    def find(self, query: str, limit: int = 5) -> List[Dict]:
+        """
+        Resuelve un código exacto, un EAN o un fragmento de nombre (todas las palabras deben
+        aparecer; se aceptan prefijos). Devuelve hasta `limit` productos.
+        """
+        query = str(query or '').strip()
+        if not query:
+            return []
+        codigo = fold_text(normalize_code(query))
+        if codigo in self.by_codigo:
+            return [self.productos[self.by_codigo[codigo]]]
+        digits = query.replace(' ', '')
+        if digits in self.by_ean:
+            return [self.productos[self.by_ean[digits]]]
+
+        tokens = fold_text(query).split()
+        candidates = None
+        for token in sorted(tokens, key=len, reverse=True):
+            matches = self.by_token.get(token)
+            if matches is None:
+                # Palabra incompleta: unión de los tokens que empiezan con ella
+                matches = []
+                pos = bisect_left(self.sorted_tokens, token)
+                while pos < len(self.sorted_tokens) and self.sorted_tokens[pos].startswith(token):
+                    matches.extend(self.by_token[self.sorted_tokens[pos]])
+                    pos += 1
+            current = set(matches)
+            candidates = current if candidates is None else candidates & current
+            if not candidates:
+                return []
+        ranked = sorted(candidates, key=lambda i: (len(self.nombres[i]), i))[:limit]
+        return [self.productos[i] for i in ranked]
+
+    def resolve_almacen(self, almacen: Optional[str]) -> Optional[str]:
+        if not almacen:
+            return None
+        return self.almacen_lookup.get(fold_text(almacen))
+
+
+def _stock_generales_version() -> Optional[str]:
+    path = published_path(settings.STOCK_GENERALES_FILE)
+    version = file_version(path)
+    if version is None:
+        logging.warning(f"Índice de stock no disponible: no existe {path}")
+    return version
+
+
+def _load_stock_index(version: str) -> StockIndex:
+    start = time.perf_counter()
+    index = StockIndex.from_file(published_path(settings.STOCK_GENERALES_FILE))
+    logging.info(f"Índice de stock cargado: {len(index.productos)} productos en "
+                 f"{(time.perf_counter() - start) * 1000:.0f} ms.")
+    return index
+
+
+_index = ReloadingValue(_stock_generales_version, _load_stock_index, settings.STOCK_INDEX_CHECK_SECONDS,
+                        description='el índice de stock')
+
+
+def get_stock_index() -> Optional[StockIndex]:
+    """Índice vigente; revisa como máximo cada STOCK_INDEX_CHECK_SECONDS si hay un archivo nuevo."""
+    return _index.get()
@@ -1,26 +1,51 @@
 import os
 import logging
-from google.cloud import storage
-from google.oauth2 import service_account
-from config import STORAGE_BUCKET_NAME, STORAGE_CREDENTIALS_PATH
-from utils import validate_file_exists, format_file_size
+import threading
+import time
+from config import settings
+from utils import validate_file_exists, format_file_size, TTLCache
+
+# Campos mínimos pedidos a la API de listado: evita descargar ACLs y metadatos que no se usan
+LIST_FIELDS = "items(name,size,timeCreated,updated),prefixes,nextPageToken"
+
+
+class StorageUnavailableError(RuntimeError):
+    """El bucket no está disponible (credenciales, red o inicialización fallida)."""
 
 class CloudStorageManager:
     def __init__(self):
-        self.bucket_name = STORAGE_BUCKET_NAME
+        self.bucket_name = settings.STORAGE_BUCKET_NAME
         self.credentials = None
         self.client = None
-        self.bucket = None
-        self._initialize_client()
+        self._bucket = None
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        self._listing_cache = TTLCache(settings.STORAGE_LIST_CACHE_TTL_SECONDS)
+        self._signed_url_cache = TTLCache(settings.REPORTE_URL_EXPIRATION_MINUTES * 60, max_entries=64)
+        self._signed_url_lock = threading.Lock()
+
+    @property
+    def bucket(self):
+        """El cliente se crea en el primer uso: cargar credenciales y google-cloud-storage es costoso."""
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self._initialize_client()
+                    self._initialized = True
+        return self._bucket
 
     def _initialize_client(self):
+        credentials_path = settings.STORAGE_CREDENTIALS_PATH
         try:
-            if not os.path.exists(STORAGE_CREDENTIALS_PATH):
-                logging.error(f"Archivo de credenciales no encontrado: {STORAGE_CREDENTIALS_PATH}")
-                raise FileNotFoundError(f"Archivo de credenciales no encontrado: {STORAGE_CREDENTIALS_PATH}")
-            self.credentials = service_account.Credentials.from_service_account_file(STORAGE_CREDENTIALS_PATH)
+            from google.cloud import storage
+            from google.oauth2 import service_account
+
+            if not credentials_path or not os.path.exists(credentials_path):
+                logging.error(f"Archivo de credenciales no encontrado: {credentials_path}")
+                raise FileNotFoundError(f"Archivo de credenciales no encontrado: {credentials_path}")
+            self.credentials = service_account.Credentials.from_service_account_file(credentials_path)
             self.client = storage.Client(credentials=self.credentials)
-            self.bucket = self.client.bucket(self.bucket_name)
+            self._bucket = self.client.bucket(self.bucket_name)
             logging.info(f"Cliente de Google Cloud Storage inicializado para bucket: {self.bucket_name}")
         except Exception as e:
             logging.error(f"Error inicializando cliente de Google Cloud Storage: {e}")
@@ -54,6 +79,41 @@ class CloudStorageManager:
             logging.error(f"Error generando URL firmada para {blob_name}: {e}")
             return None
 
+    def get_signed_url(self, blob_name, version='', expiration_minutes=30):
+        """
+        URL firmada reutilizable: la firma RSA se hace una vez por (blob, versión del reporte) y
+        se renueva SIGNED_URL_RENEW_MARGIN_MINUTES antes de expirar. Al publicarse otra versión
+        cambia la clave y se firma de nuevo. Devuelve (url, expira_en_epoch) o None.
+        """
+        cache_key = (blob_name, version, expiration_minutes)
+        cached = self._signed_url_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        with self._signed_url_lock:
+            cached = self._signed_url_cache.get(cache_key)
+            if cached is not None:
+                return cached
+            expires_at = time.time() + expiration_minutes * 60
+            url = self.generate_signed_url(blob_name, expiration_minutes=expiration_minutes)
+            if url is None:
+                return None
+            reuse_seconds = (expiration_minutes - settings.SIGNED_URL_RENEW_MARGIN_MINUTES) * 60
+            if reuse_seconds > 0:
+                self._signed_url_cache.set(cache_key, (url, expires_at), ttl_seconds=reuse_seconds)
+            return url, expires_at
+
+    def open_blob(self, blob_name, chunk_size=256 * 1024):
+        """
+        Abre un blob en modo lectura binaria con descargas por rangos.
+        Permite a lectores como Parquet leer sólo el pie y las columnas que necesitan.
+        """
+        try:
+            blob = self.bucket.blob(blob_name)
+            return blob.open("rb", chunk_size=chunk_size)
+        except Exception as e:
+            logging.error(f"Error abriendo {blob_name} para lectura: {e}")
+            return None
+
     def file_exists(self, blob_name):
         try:
             blob = self.bucket.blob(blob_name)
@@ -93,19 +153,75 @@ class CloudStorageManager:
             logging.error(f"Error obteniendo metadatos de {blob_name}: {e}")
             return None
 
-    def list_files(self, prefix=""):
+    @staticmethod
+    def _blob_to_dict(blob):
+        return {
+            "name": blob.name,
+            "size": blob.size,
+            "size_formatted": format_file_size(blob.size) if blob.size else "0B",
+            "time_created": blob.time_created,
+            "updated": blob.updated
+        }
+
+    def iter_files(self, prefix="", delimiter=None, page_size=None, start_offset=None, end_offset=None):
+        """
+        Recorre los blobs bajo un prefijo de forma perezosa, página a página.
+        El filtrado por prefijo, delimitador y rango de nombres lo resuelve el servidor.
+        Lanza StorageUnavailableError si el bucket no está disponible o el listado falla.
+        """
+        bucket = self.bucket
+        if bucket is None:
+            raise StorageUnavailableError(f"Cliente de Cloud Storage no inicializado (bucket: {self.bucket_name})")
         try:
-            blobs = self.bucket.list_blobs(prefix=prefix)
-            files = []
+            blobs = bucket.list_blobs(
+                prefix=prefix,
+                delimiter=delimiter,
+                start_offset=start_offset,
+                end_offset=end_offset,
+                page_size=page_size or settings.STORAGE_LIST_PAGE_SIZE,
+                fields=LIST_FIELDS
+            )
             for blob in blobs:
-                files.append({
-                    "name": blob.name,
-                    "size": blob.size,
-                    "size_formatted": format_file_size(blob.size) if blob.size else "0B",
-                    "time_created": blob.time_created,
-                    "updated": blob.updated
-                })
-            return files
+                yield self._blob_to_dict(blob)
+        except Exception as e:
+            logging.error(f"Error listando archivos con prefijo '{prefix}': {e}")
+            raise StorageUnavailableError(str(e)) from e
+
+    def list_files_page(self, prefix="", delimiter=None, page_size=None, page_token=None):
+        """
+        Devuelve una sola página del listado junto con el token de la siguiente.
+        Las páginas se guardan en caché local durante STORAGE_LIST_CACHE_TTL_SECONDS.
+        """
+        page_size = min(page_size or settings.STORAGE_LIST_PAGE_SIZE, settings.STORAGE_LIST_MAX_PAGE_SIZE)
+        cache_key = (prefix, delimiter, page_size, page_token)
+        cached = self._listing_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        try:
+            iterator = self.bucket.list_blobs(
+                prefix=prefix,
+                delimiter=delimiter,
+                max_results=page_size,
+                page_size=page_size,
+                page_token=page_token,
+                fields=LIST_FIELDS
+            )
+            page = next(iterator.pages, None)
+            files = [self._blob_to_dict(blob) for blob in page] if page is not None else []
+            result = {
+                "files": files,
+                "prefixes": sorted(iterator.prefixes),
+                "next_page_token": iterator.next_page_token
+            }
+            self._listing_cache.set(cache_key, result)
+            return result
+        except Exception as e:
+            logging.error(f"Error listando página de archivos con prefijo '{prefix}': {e}")
+            return None
+
+    def list_files(self, prefix=""):
+        try:
+            return list(self.iter_files(prefix=prefix))
         except Exception as e:
             logging.error(f"Error listando archivos con prefijo '{prefix}': {e}")
-            return []
\ No newline at end of file
+            return []
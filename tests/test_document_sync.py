@@ -0,0 +1,101 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings  # noqa: E402
+from document_sync import InMemoryDocumentStore, document_id, sync_documents  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def procesamiento(tmp_path):
+    """Estado de sincronización en un directorio temporal, lotes chicos y reintentos sin espera."""
+    saved = dict(vars(settings))
+    settings.apply_tenant(procesamiento_dir=str(tmp_path))
+    settings.DOC_SYNC_BATCH_SIZE = 2
+    settings.DOC_SYNC_RETRY_BASE_SECONDS = 0
+    yield tmp_path
+    vars(settings).clear()
+    vars(settings).update(saved)
+
+
+class FailingStore(InMemoryDocumentStore):
+    """Rechaza siempre los lotes que incluyen alguno de los documentos indicados."""
+
+    def __init__(self, failing_ids):
+        super().__init__()
+        self.failing_ids = set(failing_ids)
+
+    def commit_batch(self, collection, writes):
+        if any(doc_id in self.failing_ids for doc_id, _ in writes):
+            raise ConnectionError("lote rechazado")
+        super().commit_batch(collection, writes)
+
+
+def _items(**stock):
+    return [{'codigo': codigo, 'stock_referencial': value} for codigo, value in stock.items()]
+
+
+def _state(collection='prueba'):
+    with open(settings.DOC_SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f).get(collection, {})
+
+
+def test_only_changes_are_sent():
+    store = InMemoryDocumentStore()
+    assert sync_documents(_items(A=1, B=2, C=3), store, 'prueba') == \
+        {'enviados': 3, 'eliminados': 0, 'lotes': 2, 'fallidos': 0}
+    assert sync_documents(_items(A=1, B=5, C=3), store, 'prueba') == \
+        {'enviados': 1, 'eliminados': 0, 'lotes': 1, 'fallidos': 0}
+    assert store.collections['prueba']['B'] == {'codigo': 'B', 'stock_referencial': 5}
+    assert sync_documents(_items(A=1, B=5, C=3), store, 'prueba')['lotes'] == 0
+
+
+def test_deletes_are_applied():
+    store = InMemoryDocumentStore()
+    sync_documents(_items(A=1, B=2, C=3), store, 'prueba')
+    result = sync_documents(_items(A=1), store, 'prueba')
+    assert result['eliminados'] == 2
+    assert set(store.collections['prueba']) == {'A'}
+    assert set(_state()) == {'A'}
+
+
+def test_failed_batches_are_left_out_of_state():
+    store = FailingStore({'B'})
+    settings.DOC_SYNC_MAX_RETRIES = 1
+    result = sync_documents(_items(A=1, B=2, C=3), store, 'prueba')
+    assert result['fallidos'] == 1
+    # A y B van en el mismo lote: ninguno queda registrado y se reenviarán
+    assert set(_state()) == {'C'}
+    assert set(store.collections['prueba']) == {'C'}
+
+    store.failing_ids.clear()
+    assert sync_documents(_items(A=1, B=2, C=3), store, 'prueba')['enviados'] == 2
+    assert set(_state()) == {'A', 'B', 'C'}
+
+
+def test_failed_delete_is_retried():
+    store = FailingStore(set())
+    sync_documents(_items(A=1, B=2), store, 'prueba')
+    store.failing_ids.add('B')
+    settings.DOC_SYNC_MAX_RETRIES = 0
+    assert sync_documents(_items(A=1), store, 'prueba')['fallidos'] == 1
+    assert 'B' in _state()
+
+    store.failing_ids.clear()
+    assert sync_documents(_items(A=1), store, 'prueba')['eliminados'] == 1
+    assert set(store.collections['prueba']) == {'A'}
+
+
+def test_transient_failure_is_retried():
+    store = InMemoryDocumentStore(fail_commits=1)
+    assert sync_documents(_items(A=1), store, 'prueba')['fallidos'] == 0
+    assert store.collections['prueba'] == {'A': {'codigo': 'A', 'stock_referencial': 1}}
+
+
+def test_document_id_is_safe():
+    assert document_id('A/1') == 'A%2F1'
+    assert document_id('..') == 'codigo_%2E%2E'
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalize import NORMALIZATION_STATS, CodeDictionary, normalize_code, normalize_codes, normalize_eans  # noqa: E402
+
+
+def test_codes_keep_leading_zeros():
+    assert normalize_codes(pd.Series(['00123', '0456', '0012.00'])).tolist() == ['00123', '0456', '0012']
+
+
+def test_codes_read_as_float():
+    assert normalize_codes(pd.Series(['123.0', '45.00', '12.5'])).tolist() == ['123', '45', '12.5']
+    assert normalize_codes(pd.Series([123.0, 7.0])).tolist() == ['123', '7']
+
+
+def test_codes_whitespace_and_missing():
+    values = pd.Series([' 0456 ', '12 34', '\tA-1\n', np.nan, None, 'nan', 'None', ''], dtype=object)
+    assert normalize_codes(values).tolist() == ['0456', '1234', 'A-1', '', '', '', '', '']
+
+
+def test_scalar_matches_vectorized():
+    values = [' 00123.0 ', '12 34', 'nan', None, 'A-1', '7.0']
+    assert [normalize_code(v) for v in values] == normalize_codes(pd.Series(values, dtype=object)).tolist()
+
+
+def test_counts_per_source():
+    values = pd.Series(['00123', '12 34', '123.0', '123', np.nan, 'A-1', 'A-1'], dtype=object)
+    normalize_codes(values, source='prueba')
+    assert NORMALIZATION_STATS['prueba'] == {'vacios': 1, 'con_espacios': 1, 'formato_numerico': 1, 'duplicados': 2}
+
+    normalize_codes(pd.Series(['00123', 'A-1']), source='prueba')
+    assert NORMALIZATION_STATS['prueba'] == {}  # nada que corregir: sin entradas
+
+
+def test_source_none_does_not_record():
+    NORMALIZATION_STATS.pop('codigo', None)
+    normalize_codes(pd.Series(['123.0']), source=None)
+    assert 'codigo' not in NORMALIZATION_STATS
+
+
+def test_eans():
+    values = pd.Series(['7751234567890.0', '7.75123456789E+12', ' 0075 1234 ', 'abc', None, '123'], dtype=object)
+    assert normalize_eans(values, source='ean_prueba').tolist() == \
+        ['7751234567890', '7751234567890', '00751234', 'abc', '', '123']
+    assert NORMALIZATION_STATS['ean_prueba'] == {'notacion_cientifica': 1, 'no_numericos': 1, 'largo_invalido': 1}
+
+
+def test_code_dictionary_round_trip():
+    generales = normalize_codes(pd.Series(['00123', 'B-2 ', '7.0']))
+    stock = normalize_codes(pd.Series(['7', '00123', 'C-3']))
+    dictionary = CodeDictionary.from_sources(generales, stock)
+    assert list(dictionary.categories) == ['00123', 'B-2', '7', 'C-3']
+
+    encoded = dictionary.encode(stock)
+    assert (encoded.codes >= 0).all()
+    assert CodeDictionary.decode(pd.Series(encoded)).tolist() == stock.tolist()
+    # misma categoría en ambas fuentes -> mismo entero, el merge compara enteros
+    assert dictionary.encode(generales).codes[0] == encoded.codes[1]
+
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings  # noqa: E402
+import publish  # noqa: E402
+
+
+@pytest.fixture
+def salida(tmp_path):
+    """settings reubicado en un directorio temporal; se restaura al terminar."""
+    saved = dict(vars(settings))
+    settings.apply_tenant(str(tmp_path / 'datos'), str(tmp_path / 'salida'), str(tmp_path / 'procesamiento'))
+    os.makedirs(settings.PUBLICACIONES_DIR)
+    yield tmp_path / 'salida'
+    vars(settings).clear()
+    vars(settings).update(saved)
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def test_publish_switches_pointer_and_root_copy(salida):
+    with publish.versioned_publish(required=('OUTPUT_FINAL_REPORT_EXCEL',)) as staging:
+        assert settings.OUTPUT_FINAL_REPORT_EXCEL.startswith(staging)
+        _write(settings.OUTPUT_FINAL_REPORT_EXCEL, 'v1')
+
+    pointer = publish.read_pointer()
+    assert pointer is not None
+    assert _read(publish.published_path(settings.OUTPUT_FINAL_REPORT_EXCEL)) == 'v1'
+    assert _read(settings.OUTPUT_FINAL_REPORT_EXCEL) == 'v1'
+    assert not any(name.endswith('.tmp') for name in os.listdir(settings.PUBLICACIONES_DIR))
+
+
+def test_missing_required_output_keeps_previous_version(salida):
+    with publish.versioned_publish(required=('OUTPUT_FINAL_REPORT_EXCEL',)):
+        _write(settings.OUTPUT_FINAL_REPORT_EXCEL, 'v1')
+    previous = publish.read_pointer()
+
+    # el generador registra su error sin propagarlo: el archivo simplemente no aparece
+    with pytest.raises(RuntimeError):
+        with publish.versioned_publish(required=('OUTPUT_FINAL_REPORT_EXCEL', 'STOCK_GENERALES_FILE')):
+            _write(settings.OUTPUT_FINAL_REPORT_EXCEL, 'v2')
+
+    assert publish.read_pointer()['version'] == previous['version']
+    assert _read(publish.published_path(settings.OUTPUT_FINAL_REPORT_EXCEL)) == 'v1'
+    assert settings.OUTPUT_FINAL_REPORT_EXCEL == os.path.join(str(salida), 'reporte_stock_hoy.xlsx')
+    assert not any(name.endswith('.tmp') for name in os.listdir(settings.PUBLICACIONES_DIR))
+
+
+def test_carry_over_keeps_outputs_but_requires_fresh_ones(salida):
+    with publish.versioned_publish():
+        _write(settings.OUTPUT_ROLLUP_STOCK_JSON, 'rollup')
+        _write(settings.OUTPUT_FINAL_REPORT_EXCEL, 'v1')
+    previous = publish.read_pointer()
+
+    # una copia del reporte anterior no cuenta como generado
+    with pytest.raises(RuntimeError):
+        with publish.versioned_publish(carry_over=True, required=('OUTPUT_FINAL_REPORT_EXCEL',)):
+            pass
+    assert publish.read_pointer()['version'] == previous['version']
+
+    with publish.versioned_publish(carry_over=True, required=('OUTPUT_FINAL_REPORT_EXCEL',)):
+        _write(settings.OUTPUT_FINAL_REPORT_EXCEL, 'v2')
+    assert publish.read_pointer()['version'] != previous['version']
+    assert _read(publish.published_path(settings.OUTPUT_ROLLUP_STOCK_JSON)) == 'rollup'
+    assert _read(publish.published_path(settings.OUTPUT_FINAL_REPORT_EXCEL)) == 'v2'
+
+
+def test_exception_in_block_discards_staging(salida):
+    with pytest.raises(ValueError):
+        with publish.versioned_publish():
+            _write(settings.OUTPUT_FINAL_REPORT_EXCEL, 'v1')
+            raise ValueError("fallo")
+    assert publish.read_pointer() is None
+    assert os.listdir(settings.PUBLICACIONES_DIR) == []
+
+
+def test_prune_keeps_last_versions(salida):
+    settings.PUBLICACIONES_KEEP = 2
+    for i in range(4):
+        with publish.versioned_publish():
+            _write(settings.OUTPUT_FINAL_REPORT_EXCEL, f"v{i}")
+    versions = os.listdir(settings.PUBLICACIONES_DIR)
+    assert len(versions) == 2
+    with open(settings.PUBLICACION_POINTER_FILE, 'r', encoding='utf-8') as f:
+        assert json.load(f)['version'] in versions
+
+
+def test_run_lock_is_exclusive_and_records_holder(salida):
+    with publish.run_lock(wait_seconds=0) as acquired:
+        assert acquired
+        assert _read(settings.RUN_LOCK_FILE + '.info').startswith(f"pid={os.getpid()} ")
+        with publish.run_lock(wait_seconds=0) as second:
+            assert not second
+    with publish.run_lock(wait_seconds=0) as again:
+        assert again
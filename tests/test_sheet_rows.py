@@ -0,0 +1,106 @@
+import os
+import sys
+from io import BytesIO
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_loader import _iter_sheet_rows  # noqa: E402
+
+
+def _sheet_with_empty_leading_area() -> bytes:
+    """Hoja cuyo primer dato está en C3: filas 1-2 y columnas A-B vacías."""
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet['C3'] = 'CODIGO'
+    sheet['D3'] = 'STOCK'
+    sheet['C4'] = 'A1'
+    sheet['D4'] = 5
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _normalized(rows):
+    return [tuple(None if value in ('', None) else value for value in row) for row in rows]
+
+
+EXPECTED = [
+    (None, None, None, None),
+    (None, None, None, None),
+    (None, None, 'CODIGO', 'STOCK'),
+    (None, None, 'A1', 5),
+]
+
+
+def test_calamine_keeps_empty_leading_rows_and_columns():
+    pytest.importorskip('python_calamine')
+    rows = _normalized(_iter_sheet_rows(_sheet_with_empty_leading_area()))
+    assert rows == EXPECTED
+
+
+def test_calamine_first_row_and_max_col():
+    pytest.importorskip('python_calamine')
+    rows = _normalized(_iter_sheet_rows(_sheet_with_empty_leading_area(), first_row=2, max_col=3))
+    assert rows == [row[:3] for row in EXPECTED[2:]]
+
+
+def test_openpyxl_matches_positions(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'python_calamine', None)  # fuerza el lector openpyxl
+    rows = _normalized(_iter_sheet_rows(_sheet_with_empty_leading_area()))
+    assert rows == EXPECTED
+
+
+@pytest.mark.parametrize('backend', ['calamine', 'openpyxl'])
+def test_max_row_limits_probe(monkeypatch, backend):
+    if backend == 'calamine':
+        pytest.importorskip('python_calamine')
+    else:
+        monkeypatch.setitem(sys.modules, 'python_calamine', None)
+    rows = _normalized(_iter_sheet_rows(_sheet_with_empty_leading_area(), max_row=3))
+    assert rows == EXPECTED[:3]
+
+
+class _TrackingSheet:
+    """Hoja de calamine que registra cuántas filas entregó y falla si se carga entera."""
+
+    def __init__(self, sheet):
+        self._sheet = sheet
+        self.start = sheet.start
+        self.produced = 0
+
+    def to_python(self, *args, **kwargs):
+        raise AssertionError("to_python carga la hoja completa")
+
+    def iter_rows(self):
+        for row in self._sheet.iter_rows():
+            self.produced += 1
+            yield row
+
+
+def test_calamine_streams_one_row_at_a_time(monkeypatch):
+    python_calamine = pytest.importorskip('python_calamine')
+    original = python_calamine.CalamineWorkbook
+    sheets = []
+
+    class TrackingWorkbook:
+        @classmethod
+        def from_filelike(cls, filelike):
+            workbook = cls()
+            workbook._workbook = original.from_filelike(filelike)
+            return workbook
+
+        def get_sheet_by_index(self, index):
+            sheets.append(_TrackingSheet(self._workbook.get_sheet_by_index(index)))
+            return sheets[-1]
+
+    monkeypatch.setattr(python_calamine, 'CalamineWorkbook', TrackingWorkbook)
+    rows = _iter_sheet_rows(_sheet_with_empty_leading_area(), first_row=1, max_col=3)
+    received = []
+    for row in rows:
+        received.append(row)
+        # sólo se leyó la fila entregada (más las saltadas por first_row)
+        assert sheets[0].produced == 1 + len(received)
+    assert _normalized(received) == [row[:3] for row in EXPECTED[1:]]
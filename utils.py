@@ -4,8 +4,17 @@ import json
 from datetime import datetime, timedelta
 import secrets
 import time
+import threading
 from functools import wraps
 
+def validate_file_exists(filepath, description):
+    """Verifica si un archivo existe y loguea el resultado."""
+    if not filepath or not os.path.exists(filepath):
+        logging.error(f"{description} no encontrado: {filepath}")
+        return False
+    logging.info(f"{description} encontrado: {filepath}")
+    return True
+
 def format_file_size(size_bytes):
     if size_bytes == 0:
         return "0B"
@@ -78,3 +87,86 @@ class TempURLManager:
 
     def get_file_path(self, token):
         return self.urls[token]["file_path"] if self.is_valid_url(token) else None
+
+class TTLCache:
+    """
+    Caché en memoria con expiración por entrada.
+    Pensada para respuestas baratas de reutilizar durante unos segundos (listados, URLs firmadas).
+    """
+    def __init__(self, ttl_seconds, max_entries=256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            self._entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key, value, ttl_seconds=None):
+        if len(self._entries) >= self.max_entries:
+            self._evict()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+        # Si todas siguen vigentes, descartar la más próxima a expirar
+        while len(self._entries) >= self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
+
+def file_version(path):
+    """Versión de un archivo publicado (mtime en ns y tamaño) o None si no existe."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+class ReloadingValue:
+    """
+    Valor en memoria que se vuelve a cargar cuando el proceso publica una versión nueva.
+    `version_fn()` se consulta como máximo cada `check_seconds` y devuelve la versión vigente
+    (None si no hay nada publicado); `loader(version)` construye el valor para esa versión. Si la
+    carga falla se conserva el valor anterior. Seguro entre threads.
+    """
+    def __init__(self, version_fn, loader, check_seconds, description='valor'):
+        self.version_fn = version_fn
+        self.loader = loader
+        self.check_seconds = check_seconds
+        self.description = description
+        self._value = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self, now):
+        return self._value is not None and now - self._checked_at < self.check_seconds
+
+    def get(self):
+        now = time.monotonic()
+        if self._fresh(now):
+            return self._value
+        with self._lock:
+            if self._fresh(now):
+                return self._value
+            self._checked_at = now
+            version = self.version_fn()
+            if version is None or (self._value is not None and version == self._version):
+                return self._value
+            try:
+                self._value = self.loader(version)
+                self._version = version
+            except Exception as e:
+                logging.error(f"Error cargando {self.description}: {e}")
+            return self._value